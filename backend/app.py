@@ -1,35 +1,218 @@
 import os
-from flask import Flask, request, jsonify
+import io
+import time
+from flask import Flask, Blueprint, request, jsonify, send_file, Response, g
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from dotenv import load_dotenv
 from datetime import timedelta
-from ingest import ingest_documents_for_user, get_collection, ingest_documents_for_class, get_class_collection, regenerate_material_summary, regenerate_user_file_summary
-from query import answer_question_for_user, answer_question_for_class
-from auth import register_user, authenticate_user, get_user_name
-from user_storage import get_user_files, remove_file_for_user, get_class_files, remove_file_for_class, update_material_summary, update_user_file_summary
+
+# Load environment variables from .env file before the modules below read their settings
+load_dotenv()
+
+from ingest import ingest_documents_for_user, get_user_collection, ingest_documents_for_class, get_class_collection, regenerate_material_summary, regenerate_user_file_summary
+from query import answer_question_for_user, answer_question_for_class, answer_in_conversation
+from conversations import (
+    create_conversation, get_conversation, list_conversations, delete_conversation,
+    conversation_lock, add_turn
+)
+from auth import register_user, authenticate_user, get_user_name, is_admin, PasswordHashBusy
+from user_storage import get_user_files, remove_file_for_user, get_class_files, remove_file_for_class, remove_class_files, update_material_summary, update_user_file_summary
 from classes_storage import (
     create_class, get_class, list_classes_for_user, 
     add_member, is_member_of_class, is_teacher_for_class,
-    regenerate_invite_code, get_class_members, update_class
+    regenerate_invite_code, get_class_members, update_class, delete_class,
+    parse_roster_csv, add_members_bulk, remove_members_bulk
 )
+from summary_index import discard_summary_index
+from top_questions import record_question, lookup_answer, freshness, list_top_questions
+from vectorstore import delete_class_collection, delete_legacy_user_file, prefetch_class_collection, get_chroma_client, is_class_collection, preload_modules, vector_service_status
+from maintenance import start_background_maintenance
+from tiering import start_background_tiering, get_tiering_metrics
+from class_bundles import export_class_bundle, import_class_bundle
+from uploads import create_upload, get_upload, write_part, discard_upload, upload_lock, SpooledUpload
+from metrics import METRICS_ENABLED, REQUEST_SECONDS, render_metrics, begin_stage_capture, end_stage_capture
+from profiler import profiling_enabled, start_request, finish_request, discard_request, list_profiles, get_profile
+from llm import LLMOverloaded
+from http_cache import store_version, make_etag, not_modified, with_etag, listing_response, compress_response
+from user_storage import FILES_INDEX, CLASS_FILES_INDEX
+from classes_storage import CLASSES_FILE, MEMBERSHIPS_FILE
+from auth import USERS_FILE
+
+api = Blueprint("api", __name__)
+
+_app = None
+_worker_pid = None
+
+
+def create_app() -> Flask:
+    """
+    Build the Flask app. Nothing here opens the vector store or the LLM
+    client; those are created per process on first use, so a gunicorn master
+    can build the app and fork workers safely (see gunicorn.conf.py).
+    """
+    app = Flask(__name__)
+    CORS(app)  # allow localhost:3000 by default
+
+    # JWT Configuration
+    app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
+    JWTManager(app)
+
+    app.register_blueprint(api)
+    app.register_error_handler(LLMOverloaded, llm_overloaded_response)
+    app.register_error_handler(PasswordHashBusy, password_hash_busy_response)
+    app.after_request(compress_response)
+    app.before_request(init_worker)
+    if METRICS_ENABLED:
+        app.before_request(start_request_timer)
+        app.after_request(record_request_latency)
+    if profiling_enabled():
+        app.before_request(start_request_profile)
+        app.after_request(finish_request_profile)
+        app.teardown_request(drop_request_profile)
+    return app
+
+
+def __getattr__(name):
+    # `from app import app`, `gunicorn app:app` and `flask run` build the app on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def preload():
+    """Import the heavy libraries in a preloading master, before workers fork"""
+    preload_modules()
+    import anthropic  # noqa: F401
+    import pypdf  # noqa: F401
+
+
+def init_worker():
+    """
+    Start this process's background jobs. Runs once per process: from
+    gunicorn's post_fork hook, or on the first request under other servers.
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    # Orphan-chunk cleanup, if MAINTENANCE_INTERVAL_SECONDS is set
+    start_background_maintenance()
+    # Archiving of idle class collections, if TIERING_INTERVAL_SECONDS is set
+    start_background_tiering(get_chroma_client, is_tiered=is_class_collection)
+
+
+def llm_overloaded_response(e: LLMOverloaded):
+    """429 with Retry-After, so clients back off instead of retrying at once"""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def password_hash_busy_response(e: PasswordHashBusy):
+    """503 with Retry-After while this worker's password hashing queue is full"""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def record_request_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        # Label by route template so /classes/<class_id> stays one series
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            endpoint=endpoint,
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
+
+
+def start_request_profile():
+    g.profile = start_request()
+    if g.profile is not None:
+        begin_stage_capture()
+
+
+def finish_request_profile(response):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        body = request.get_json(silent=True) if request.is_json else None
+        class_id = (request.view_args or {}).get("class_id") or (body or {}).get("class_id")
+        finish_request(profile, {
+            "endpoint": request.url_rule.rule if request.url_rule else "unmatched",
+            "method": request.method,
+            "path": request.path,
+            "class_id": class_id,
+            "status": response.status_code,
+        }, end_stage_capture())
+    return response
 
-# Load environment variables from .env file
-load_dotenv()
 
-app = Flask(__name__)
-CORS(app)  # allow localhost:3000 by default
+def drop_request_profile(exc):
+    # after_request is skipped when a view raises; stop sampling the thread anyway
+    profile = g.pop("profile", None)
+    if profile is not None:
+        end_stage_capture()
+        discard_request(profile)
 
-# JWT Configuration
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
-jwt = JWTManager(app)
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint (per worker process)"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
-@app.route("/health", methods=["GET"])
+@api.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
-@app.route("/register", methods=["POST"])
+@api.route("/health/vectorstore", methods=["GET"])
+def vectorstore_health():
+    """Resident/archived collection counts, rehydration latency and where the store lives, for this worker"""
+    store = vector_service_status()
+    if "error" in store:
+        return jsonify({"store": store}), 503
+    return jsonify({**get_tiering_metrics(get_chroma_client()), "store": store})
+
+@api.route("/admin/profiles", methods=["GET"])
+@jwt_required()
+def admin_list_profiles():
+    """Captured request profiles, newest first (admins only)"""
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify({"profiles": list_profiles()})
+
+@api.route("/admin/profiles/<profile_id>", methods=["GET"])
+@jwt_required()
+def admin_download_profile(profile_id):
+    """Download one profile: folded stacks by default, ?format=json for the full record"""
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "Admin access required"}), 403
+
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get("format") == "json":
+        return jsonify(profile)
+    return Response(
+        profile["folded"] + "\n",
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={profile_id}.folded"},
+    )
+
+@api.route("/register", methods=["POST"])
 def register():
     data = request.get_json()
     email = data.get("email")
@@ -46,7 +229,7 @@ def register():
     access_token = create_access_token(identity=email)
     return jsonify({"access_token": access_token, "email": email, "name": name})
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     data = request.get_json()
     email = data.get("email")
@@ -62,7 +245,7 @@ def login():
     access_token = create_access_token(identity=email)
     return jsonify({"access_token": access_token, "email": user["email"], "name": user["name"]})
 
-@app.route("/upload", methods=["POST"])
+@api.route("/upload", methods=["POST"])
 @jwt_required()
 def upload():
     user_email = get_jwt_identity()
@@ -71,31 +254,36 @@ def upload():
         return jsonify({"error": "No files provided"}), 400
 
     try:
-        ingest_documents_for_user(user_email, files)
-        return jsonify({"status": "ok", "message": "Documents ingested"})
+        report = ingest_documents_for_user(user_email, files)
+        return jsonify({"status": "ok", "message": "Documents ingested", "files": report})
     except Exception as e:
         print("Upload error:", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/files", methods=["GET"])
+@api.route("/files", methods=["GET"])
 @jwt_required()
 def list_files():
     user_email = get_jwt_identity()
+    # Unchanged since the client's last poll: answer from a stat() call
+    etag = make_etag(user_email, store_version(FILES_INDEX))
+    cached = not_modified(etag)
+    if cached:
+        return cached
     try:
         files = get_user_files(user_email)
-        return jsonify({"files": files})
+        return listing_response("files", files, "filename", etag)
     except Exception as e:
         print("List files error:", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/files/<filename>", methods=["DELETE"])
+@api.route("/files/<filename>", methods=["DELETE"])
 @jwt_required()
 def delete_file(filename):
     user_email = get_jwt_identity()
     try:
-        collection = get_collection()
-        success = remove_file_for_user(user_email, filename, collection)
+        success = remove_file_for_user(user_email, filename, get_user_collection(user_email))
         if success:
+            delete_legacy_user_file(user_email, filename)
             return jsonify({"status": "ok", "message": f"File {filename} deleted"})
         else:
             return jsonify({"error": "File not found"}), 404
@@ -104,7 +292,7 @@ def delete_file(filename):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/files/<filename>/summary", methods=["POST"])
+@api.route("/files/<filename>/summary", methods=["POST"])
 @jwt_required()
 def generate_user_file_summary(filename):
     """Generate or regenerate summary for a user's personal file"""
@@ -126,7 +314,7 @@ def generate_user_file_summary(filename):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/ask", methods=["POST"])
+@api.route("/ask", methods=["POST"])
 @jwt_required()
 def ask():
     user_email = get_jwt_identity()
@@ -138,26 +326,125 @@ def ask():
     level = data.get("level", "beginner")
     tone = data.get("tone", "neutral")
     class_id = data.get("class_id")  # Optional class context
+    conversation_id = data.get("conversation_id")  # Optional multi-turn context
 
     try:
+        if conversation_id:
+            return ask_in_conversation(user_email, conversation_id, class_id, question, level, tone)
         if class_id:
             # Class-scoped QA
             if not is_member_of_class(user_email, class_id):
                 return jsonify({"error": "Not a member of this class"}), 403
+            record_question(class_id, question, level, tone)
+            precomputed = lookup_answer(class_id, question, level, tone)
+            if precomputed is not None:
+                return jsonify({
+                    "answer": precomputed["answer"],
+                    "sources": precomputed["sources"],
+                    "precomputed": freshness(precomputed),
+                })
             answer, sources = answer_question_for_class(class_id, user_email, question, level, tone)
         else:
             # User-scoped QA (personal uploads)
             answer, sources = answer_question_for_user(user_email, question, level, tone)
         
         return jsonify({"answer": answer, "sources": sources})
+    except LLMOverloaded as e:
+        return llm_overloaded_response(e)
     except Exception as e:
         print("Ask error:", e)
         return jsonify({"error": str(e)}), 500
 
 
+def ask_in_conversation(user_email, conversation_id, class_id, question, level, tone):
+    # Unknown ids never get a lock
+    if get_conversation(user_email, conversation_id) is None:
+        return jsonify({"error": "Conversation not found"}), 404
+
+    # One turn at a time per conversation, so turns are recorded in order
+    with conversation_lock(conversation_id):
+        conversation = get_conversation(user_email, conversation_id)
+        if conversation is None:
+            return jsonify({"error": "Conversation not found"}), 404
+        if class_id and class_id != conversation.get("class_id"):
+            return jsonify({"error": "Conversation belongs to a different class"}), 400
+        if conversation.get("class_id") and not is_member_of_class(user_email, conversation["class_id"]):
+            return jsonify({"error": "Not a member of this class"}), 403
+
+        answer, sources, standalone = answer_in_conversation(conversation, question, level, tone)
+        add_turn(conversation, question, standalone, answer, sources)
+
+    return jsonify({
+        "answer": answer,
+        "sources": sources,
+        "conversation_id": conversation_id,
+        "turn": len(conversation["turns"]),
+        "standalone_question": standalone,
+    })
+
+
+# ===== Conversation Endpoints =====
+
+@api.route("/conversations", methods=["POST"])
+@jwt_required()
+def create_conversation_route():
+    """Start a conversation, optionally scoped to a class"""
+    user_email = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    class_id = data.get("class_id")
+
+    if class_id and not is_member_of_class(user_email, class_id):
+        return jsonify({"error": "Not a member of this class"}), 403
+
+    try:
+        conversation = create_conversation(user_email, class_id)
+        return jsonify({"conversation_id": conversation["conversation_id"], "class_id": class_id})
+    except Exception as e:
+        print("Create conversation error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/conversations", methods=["GET"])
+@jwt_required()
+def list_conversations_route():
+    """List the user's conversations, newest first"""
+    user_email = get_jwt_identity()
+    try:
+        return jsonify({"conversations": list_conversations(user_email)})
+    except Exception as e:
+        print("List conversations error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/conversations/<conversation_id>", methods=["GET"])
+@jwt_required()
+def get_conversation_route(conversation_id):
+    """Full transcript of a conversation"""
+    user_email = get_jwt_identity()
+    conversation = get_conversation(user_email, conversation_id)
+    if conversation is None:
+        return jsonify({"error": "Conversation not found"}), 404
+    conversation.pop("user", None)
+    return jsonify(conversation)
+
+
+@api.route("/conversations/<conversation_id>", methods=["DELETE"])
+@jwt_required()
+def delete_conversation_route(conversation_id):
+    user_email = get_jwt_identity()
+    # Unknown ids never get a lock
+    if get_conversation(user_email, conversation_id) is None:
+        return jsonify({"error": "Conversation not found"}), 404
+
+    with conversation_lock(conversation_id):
+        if not delete_conversation(user_email, conversation_id):
+            return jsonify({"error": "Conversation not found"}), 404
+    return jsonify({"status": "deleted", "conversation_id": conversation_id})
+
+
 # ===== Class Management Endpoints =====
 
-@app.route("/classes", methods=["POST"])
+@api.route("/classes", methods=["POST"])
 @jwt_required()
 def create_class_route():
     """Create a new class (user becomes teacher)"""
@@ -187,25 +474,34 @@ def create_class_route():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes", methods=["GET"])
+@api.route("/classes", methods=["GET"])
 @jwt_required()
 def list_classes():
     """List all classes the user is a member of"""
     user_email = get_jwt_identity()
+    etag = make_etag(user_email, store_version(CLASSES_FILE, MEMBERSHIPS_FILE))
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
     try:
         classes = list_classes_for_user(user_email)
-        return jsonify({"classes": classes})
+        return listing_response("classes", classes, "class_id", etag)
     except Exception as e:
         print("List classes error:", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>", methods=["GET"])
+@api.route("/classes/<class_id>", methods=["GET"])
 @jwt_required()
 def get_class_details(class_id):
     """Get class details (members only)"""
     user_email = get_jwt_identity()
+    # The tag covers the memberships store, so a match also means membership is unchanged
+    etag = make_etag(user_email, class_id, store_version(CLASSES_FILE, MEMBERSHIPS_FILE, USERS_FILE))
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
     if not is_member_of_class(user_email, class_id):
         return jsonify({"error": "Not a member of this class"}), 403
@@ -233,13 +529,13 @@ def get_class_details(class_id):
         if is_teacher:
             response["invite_code"] = class_info.get("invite_code")
         
-        return jsonify(response)
+        return with_etag(jsonify(response), etag)
     except Exception as e:
         print("Get class error:", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>", methods=["PUT", "PATCH"])
+@api.route("/classes/<class_id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_class_details(class_id):
     """Update class details (teacher only)"""
@@ -272,7 +568,28 @@ def update_class_details(class_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/invite", methods=["POST"])
+@api.route("/classes/<class_id>", methods=["DELETE"])
+@jwt_required()
+def delete_class_route(class_id):
+    """Delete a class, its memberships and its materials (teacher only)"""
+    user_email = get_jwt_identity()
+    
+    try:
+        success, error = delete_class(class_id, user_email)
+        if error:
+            return jsonify({"error": error}), 403 if "Only teachers" in error else 404
+        
+        # Anything left behind here is picked up by maintenance.py
+        remove_class_files(class_id)
+        delete_class_collection(class_id)
+        discard_summary_index(class_id)
+        return jsonify({"status": "ok", "message": "Class deleted"})
+    except Exception as e:
+        print("Delete class error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/classes/<class_id>/invite", methods=["POST"])
 @jwt_required()
 def regenerate_invite(class_id):
     """Regenerate invite code for a class (teacher only)"""
@@ -289,7 +606,98 @@ def regenerate_invite(class_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/join", methods=["POST"])
+@api.route("/classes/<class_id>/members", methods=["GET"])
+@jwt_required()
+def list_class_members(class_id):
+    """Paginated class roster (members only)"""
+    user_email = get_jwt_identity()
+    etag = make_etag(user_email, class_id, store_version(MEMBERSHIPS_FILE))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    if not is_member_of_class(user_email, class_id):
+        return jsonify({"error": "Not a member of this class"}), 403
+
+    try:
+        return listing_response("members", get_class_members(class_id), "email", etag)
+    except Exception as e:
+        print("List class members error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+def roster_emails():
+    """Emails from an uploaded `roster` CSV or a JSON body {"emails": [...]}"""
+    roster_file = request.files.get("roster")
+    if roster_file is not None:
+        return parse_roster_csv(roster_file.read().decode("utf-8-sig", errors="replace"))
+    data = request.get_json(silent=True) or {}
+    return [e.get("email", "") if isinstance(e, dict) else str(e) for e in data.get("emails", [])]
+
+
+def roster_summary(results):
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return counts
+
+
+@api.route("/classes/<class_id>/roster", methods=["POST"])
+@jwt_required()
+def import_roster(class_id):
+    """Enroll many students at once from a CSV or JSON roster (teacher only)"""
+    user_email = get_jwt_identity()
+    emails = roster_emails()
+    if not emails:
+        return jsonify({"error": "No roster rows provided"}), 400
+
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+    try:
+        results, error = add_members_bulk(class_id, user_email, emails, dry_run=dry_run)
+        if error:
+            return jsonify({"error": error}), 403 if error.startswith("Only teachers") else 400
+        return jsonify({"dry_run": dry_run, "summary": roster_summary(results), "results": results})
+    except Exception as e:
+        print("Roster import error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/classes/<class_id>/roster", methods=["DELETE"])
+@jwt_required()
+def remove_roster(class_id):
+    """Remove many students at once (teacher only)"""
+    user_email = get_jwt_identity()
+    emails = roster_emails()
+    if not emails:
+        return jsonify({"error": "No roster rows provided"}), 400
+
+    try:
+        results, error = remove_members_bulk(class_id, user_email, emails)
+        if error:
+            return jsonify({"error": error}), 403 if error.startswith("Only teachers") else 400
+        return jsonify({"summary": roster_summary(results), "results": results})
+    except Exception as e:
+        print("Roster removal error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/classes/<class_id>/top-questions", methods=["GET"])
+@jwt_required()
+def list_class_top_questions(class_id):
+    """Most-asked questions and which answers are precomputed (teacher only)"""
+    user_email = get_jwt_identity()
+
+    if not is_teacher_for_class(user_email, class_id):
+        return jsonify({"error": "Only teachers can view top questions"}), 403
+
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    return jsonify({"class_id": class_id, "questions": list_top_questions(class_id, limit)})
+
+
+@api.route("/classes/<class_id>/join", methods=["POST"])
 @jwt_required()
 def join_class(class_id):
     """Join a class using invite code"""
@@ -316,24 +724,32 @@ def join_class(class_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/materials", methods=["GET"])
+@api.route("/classes/<class_id>/materials", methods=["GET"])
 @jwt_required()
 def list_class_materials(class_id):
     """List uploaded materials for a class (members only)"""
     user_email = get_jwt_identity()
-    
+    # Checked before the ETag, so only members can make the prefetch below happen
     if not is_member_of_class(user_email, class_id):
         return jsonify({"error": "Not a member of this class"}), 403
+
+    etag = make_etag(user_email, class_id, store_version(CLASS_FILES_INDEX, MEMBERSHIPS_FILE))
+    cached = not_modified(etag)
+    if cached:
+        prefetch_class_collection(class_id)
+        return cached
     
     try:
         files = get_class_files(class_id)
-        return jsonify({"files": files})
+        # Students usually ask a question next, so start bringing the class back from the archive
+        prefetch_class_collection(class_id)
+        return listing_response("files", files, "filename", etag)
     except Exception as e:
         print("List class materials error:", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/upload", methods=["POST"])
+@api.route("/classes/<class_id>/upload", methods=["POST"])
 @jwt_required()
 def upload_class_materials(class_id):
     """Upload materials to a class (teacher only)"""
@@ -347,14 +763,165 @@ def upload_class_materials(class_id):
         return jsonify({"error": "No files provided"}), 400
 
     try:
-        ingest_documents_for_class(user_email, class_id, files)
-        return jsonify({"status": "ok", "message": "Materials uploaded successfully"})
+        report = ingest_documents_for_class(user_email, class_id, files)
+        return jsonify({"status": "ok", "message": "Materials uploaded successfully", "files": report})
     except Exception as e:
         print("Upload class materials error:", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/materials/<filename>", methods=["DELETE"])
+def upload_session_response(session, status=200, **extra):
+    fields = ("upload_id", "filename", "class_id", "size", "part_size", "offset", "complete")
+    response = jsonify({**extra, **{key: session[key] for key in fields}})
+    response.status_code = status
+    response.headers["Upload-Offset"] = str(session["offset"])
+    return response
+
+
+def start_resumable_upload(user_email, class_id=None):
+    data = request.get_json(silent=True) or {}
+    session, error = create_upload(user_email, data.get("filename"), data.get("size"), class_id)
+    if error:
+        return jsonify({"error": error}), 400
+    return upload_session_response(session, 201)
+
+
+@api.route("/upload/resumable", methods=["POST"])
+@jwt_required()
+def create_resumable_upload():
+    """Open a resumable upload of one personal file"""
+    return start_resumable_upload(get_jwt_identity())
+
+
+@api.route("/classes/<class_id>/upload/resumable", methods=["POST"])
+@jwt_required()
+def create_resumable_class_upload(class_id):
+    """Open a resumable upload of one class material (teacher only)"""
+    user_email = get_jwt_identity()
+
+    if not is_teacher_for_class(user_email, class_id):
+        return jsonify({"error": "Only teachers can upload materials"}), 403
+
+    return start_resumable_upload(user_email, class_id)
+
+
+@api.route("/upload/resumable/<upload_id>", methods=["GET"])
+@jwt_required()
+def get_resumable_upload(upload_id):
+    """How many bytes of an upload have arrived, to resume from"""
+    session = get_upload(get_jwt_identity(), upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return upload_session_response(session)
+
+
+@api.route("/upload/resumable/<upload_id>", methods=["PUT"])
+@jwt_required()
+def put_upload_part(upload_id):
+    """Write the next part (raw body, Upload-Offset header); the last part ingests the file"""
+    user_email = get_jwt_identity()
+    session = get_upload(user_email, upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", request.args.get("offset", "")))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header required"}), 400
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length required"}), 411
+
+    session, error = write_part(session, offset, request.stream, request.content_length)
+    if error == "offset_mismatch":
+        return upload_session_response(session, 409, error="Part does not start at the upload's offset")
+    if error:
+        return jsonify({"error": error, "offset": session["offset"]}), 400
+    if not session["complete"]:
+        return upload_session_response(session)
+    return finish_resumable_upload(user_email, session)
+
+
+def finish_resumable_upload(user_email, session):
+    """Ingest a complete spool, then remove it. On failure it stays for a retry."""
+    with upload_lock(session["upload_id"]):
+        # A concurrent retry may have ingested it already
+        if get_upload(user_email, session["upload_id"]) is None:
+            return jsonify({"error": "Upload not found"}), 404
+        try:
+            with SpooledUpload(session) as f:
+                if session["class_id"]:
+                    report = ingest_documents_for_class(user_email, session["class_id"], [f])
+                    message = "Materials uploaded successfully"
+                else:
+                    report = ingest_documents_for_user(user_email, [f])
+                    message = "Documents ingested"
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 403
+        except Exception as e:
+            print("Resumable upload error:", e)
+            return jsonify({"error": str(e), "upload_id": session["upload_id"]}), 500
+        discard_upload(session["upload_id"])
+    return jsonify({"status": "ok", "message": message, "upload_id": session["upload_id"], "files": report})
+
+
+@api.route("/upload/resumable/<upload_id>", methods=["DELETE"])
+@jwt_required()
+def cancel_resumable_upload(upload_id):
+    """Abandon an upload and delete what was spooled"""
+    if get_upload(get_jwt_identity(), upload_id) is None:
+        return jsonify({"error": "Upload not found"}), 404
+    discard_upload(upload_id)
+    return jsonify({"status": "ok", "message": "Upload cancelled"})
+
+
+@api.route("/classes/<class_id>/export", methods=["GET"])
+@jwt_required()
+def export_class_materials(class_id):
+    """Download a class's materials, embeddings and summaries as a bundle (teacher only)"""
+    user_email = get_jwt_identity()
+    
+    if not is_teacher_for_class(user_email, class_id):
+        return jsonify({"error": "Only teachers can export materials"}), 403
+    
+    try:
+        buffer = io.BytesIO()
+        export_class_bundle(class_id, buffer)
+        buffer.seek(0)
+        return send_file(
+            buffer,
+            mimetype="application/zip",
+            as_attachment=True,
+            download_name=f"{class_id}.teachtwin"
+        )
+    except Exception as e:
+        print("Export class materials error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/classes/<class_id>/import", methods=["POST"])
+@jwt_required()
+def import_class_materials(class_id):
+    """Load an exported bundle into this class without re-embedding (teacher only)"""
+    user_email = get_jwt_identity()
+    
+    if not is_teacher_for_class(user_email, class_id):
+        return jsonify({"error": "Only teachers can import materials"}), 403
+    
+    bundle = request.files.get("bundle")
+    if not bundle:
+        return jsonify({"error": "No bundle provided"}), 400
+
+    try:
+        result, error = import_class_bundle(user_email, class_id, bundle.stream)
+        if error:
+            return jsonify({"error": error}), 400
+        return jsonify({"status": "ok", **result})
+    except Exception as e:
+        print("Import class materials error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/classes/<class_id>/materials/<filename>", methods=["DELETE"])
 @jwt_required()
 def delete_class_material(class_id, filename):
     """Delete a material from a class (teacher only)"""
@@ -375,7 +942,7 @@ def delete_class_material(class_id, filename):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/classes/<class_id>/materials/<filename>/summary", methods=["POST"])
+@api.route("/classes/<class_id>/materials/<filename>/summary", methods=["POST"])
 @jwt_required()
 def generate_material_summary(class_id, filename):
     """Generate or regenerate summary for a specific material"""
@@ -403,4 +970,4 @@ def generate_material_summary(class_id, filename):
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    create_app().run(host="0.0.0.0", port=port, debug=True)
@@ -1,58 +1,221 @@
+"""
+File-based users and password hashing.
+
+bcrypt is slow on purpose, so it never runs on the request thread's own
+budget: hashes and checks go through a per-process pool of
+PASSWORD_HASH_CONCURRENCY threads (bcrypt releases the GIL while it works).
+Callers beyond that wait in a queue of at most PASSWORD_HASH_MAX_QUEUE, and
+further ones get PasswordHashBusy with a Retry-After estimate, so a login
+storm is turned away early instead of stalling every worker thread.
+
+New hashes use BCRYPT_ROUNDS. A password stored with a different cost is
+rehashed at that cost the next time its owner logs in.
+
+Profile lookups (login, display names) read users.json through an
+in-memory copy keyed by email that is parsed again only when the file
+changes.
+"""
 import os
 import json
+import math
+import time
 import bcrypt
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from typing import Optional
 from flask import jsonify
+from metrics import timed, Counter, Gauge
 
 # Simple file-based user storage (for demo purposes)
 USERS_FILE = "./data/users.json"
 
+# Comma-separated emails allowed to use the /admin endpoints
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# bcrypt cost factor (log2 of the work) for new hashes; bcrypt accepts 4-31
+BCRYPT_ROUNDS = min(31, max(4, int(os.environ.get("BCRYPT_ROUNDS", "12"))))
+# Hashes computed at once per process; with several workers, keep the total near the core count
+PASSWORD_HASH_CONCURRENCY = max(1, int(os.environ.get("PASSWORD_HASH_CONCURRENCY", "2")))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+
+class PasswordHashBusy(Exception):
+    """Too many password hashes queued; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Created on first use and again after a fork; a preloading master's threads do not survive it
+_pool = None
+_pool_pid = None
+_pending = 0
+_pending_lock = threading.Lock()
+_hash_seconds = 0.25  # moving average of one hash, for Retry-After
+
+# users.json as last parsed: (file version, users)
+_users_cache = None
+# Serializes read-modify-write of users.json within this process
+_users_lock = threading.Lock()
+
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "teachtwin_password_hash_pending",
+    "Password hashes running or waiting for a pool thread",
+    function=lambda: _pending,
+)
+PASSWORD_HASH_REJECTIONS = Counter(
+    "teachtwin_password_hash_rejections_total",
+    "Logins and registrations turned away because the password hash queue was full",
+)
+PASSWORD_REHASHES = Counter(
+    "teachtwin_password_rehashes_total",
+    "Stored passwords rehashed at BCRYPT_ROUNDS on login",
+)
+
+
 def ensure_users_file():
     os.makedirs("./data", exist_ok=True)
     if not os.path.exists(USERS_FILE):
         with open(USERS_FILE, "w") as f:
             json.dump({}, f)
 
+@timed("users_load")
 def load_users():
     ensure_users_file()
     with open(USERS_FILE, "r") as f:
         return json.load(f)
 
+@timed("users_save")
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
+    """Written to a temp file and renamed, so readers never see half a file"""
+    tmp_path = USERS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(users, f, indent=2)
+    os.replace(tmp_path, USERS_FILE)
+
+
+def _users_version():
+    try:
+        st = os.stat(USERS_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get_user(email: str) -> Optional[dict]:
+    """One user's record, without parsing users.json unless it changed. Do not modify it."""
+    global _users_cache
+    version = _users_version()
+    cached = _users_cache
+    if cached is None or cached[0] != version:
+        users = load_users()
+        cached = _users_cache = (version, users)
+    return cached[1].get(email)
+
+
+def _pool_executor() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="password-hash")
+        _pool_pid = os.getpid()
+    return _pool
 
+
+def _timed_call(function, *args):
+    global _hash_seconds
+    start = time.perf_counter()
+    result = function(*args)
+    _hash_seconds = 0.8 * _hash_seconds + 0.2 * (time.perf_counter() - start)
+    return result
+
+
+def _run_in_pool(function, *args):
+    """Run a bcrypt call on the hashing pool and wait for it"""
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_HASH_CONCURRENCY + PASSWORD_HASH_MAX_QUEUE:
+            PASSWORD_HASH_REJECTIONS.inc()
+            retry_after = max(1, math.ceil(_pending * _hash_seconds / PASSWORD_HASH_CONCURRENCY))
+            raise PasswordHashBusy("Too many logins in progress, try again shortly", retry_after)
+        _pending += 1
+        pool = _pool_executor()
+    try:
+        return pool.submit(_timed_call, function, *args).result()
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+@timed("password_hash")
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return _run_in_pool(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
 
+@timed("password_check")
 def check_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return _run_in_pool(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """The cost factor of a stored hash ("$2b$12$...")"""
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _rehash(email: str, password: str, old_hash: str):
+    try:
+        new_hash = hash_password(password)
+    except PasswordHashBusy:
+        # The login itself succeeded; rehash on a quieter login
+        return
+    with _users_lock:
+        users = load_users()
+        user = users.get(email)
+        # Unless the password changed meanwhile
+        if user is None or user.get("password") != old_hash:
+            return
+        user["password"] = new_hash
+        save_users(users)
+    PASSWORD_REHASHES.inc()
+
 
 def register_user(email, password, name):
-    users = load_users()
-    
-    if email in users:
+    if get_user(email) is not None:
         return None, "User already exists"
-    
-    users[email] = {
-        "password": hash_password(password),
-        "name": name,
-        "created_at": str(os.times())
-    }
-    
-    save_users(users)
+    # Hash before taking the lock, so registrations don't queue behind each other's bcrypt
+    hashed = hash_password(password)
+
+    with _users_lock:
+        users = load_users()
+        if email in users:
+            return None, "User already exists"
+
+        users[email] = {
+            "password": hashed,
+            "name": name,
+            "created_at": str(os.times())
+        }
+
+        save_users(users)
     return email, None
 
 def authenticate_user(email, password):
-    users = load_users()
-    
-    if email not in users:
+    user = get_user(email)
+
+    if user is None:
         return None, "Invalid credentials"
-    
-    user = users[email]
-    if not check_password(password, user["password"]):
+
+    stored = user["password"]
+    if not check_password(password, stored):
         return None, "Invalid credentials"
-    
+
+    if hash_rounds(stored) != BCRYPT_ROUNDS:
+        _rehash(email, password, stored)
+
     return {
         "email": email,
         "name": user.get("name", "User")
@@ -61,8 +224,11 @@ def authenticate_user(email, password):
 
 def get_user_name(email: str) -> str:
     """Get user's display name by email"""
-    users = load_users()
-    user = users.get(email)
+    user = get_user(email)
     if user:
         return user.get("name", email)
     return email
+
+
+def is_admin(email: str) -> bool:
+    return bool(email) and email.lower() in ADMIN_EMAILS
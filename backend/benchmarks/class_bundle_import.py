@@ -0,0 +1,73 @@
+"""
+Class bundle export/import throughput. Builds a synthetic class, exports it,
+and times importing the bundle into a fresh class. No embedding model or LLM
+is involved on either side.
+
+Usage (from the backend directory):
+    python -m benchmarks.class_bundle_import [--files 40] [--chunks-per-file 100] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from benchmarks.common import random_embeddings
+
+
+def run(files: int, chunks_per_file: int, repeat: int):
+    # The storage modules use ./data relative paths, so work in a scratch directory
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="teachtwin-bundle-")
+    sys.path.insert(0, backend_dir)
+    os.chdir(workdir)
+    try:
+        from vectorstore import get_class_collection
+        from user_storage import add_files_for_class
+        from class_bundles import export_class_bundle, import_class_bundle
+
+        total = files * chunks_per_file
+        vectors = random_embeddings(total)
+        source = get_class_collection("class_source")
+        entries = {}
+        for f in range(files):
+            filename = f"lecture_{f:02d}.pdf"
+            ids = [f"class_source:{filename}:{i}" for i in range(chunks_per_file)]
+            start = f * chunks_per_file
+            source.add(
+                ids=ids,
+                embeddings=[v.tolist() for v in vectors[start:start + chunks_per_file]],
+                documents=[f"{filename} chunk {i} " + "lorem ipsum " * 60 for i in range(chunks_per_file)],
+                metadatas=[{"source": filename, "class_id": "class_source", "uploaded_by": "t@x"}] * chunks_per_file,
+            )
+            entries[filename] = {"chunk_ids": ids, "uploaded_by": "t@x", "summary": "A lecture."}
+        add_files_for_class("class_source", entries)
+
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        export_class_bundle("class_source", buffer)
+        export_s = time.perf_counter() - start
+        size_mb = buffer.tell() / (1024 * 1024)
+        print(f"{files} files, {total} chunks, bundle {size_mb:.1f} MB, export {export_s:.2f}s")
+
+        for r in range(repeat):
+            buffer.seek(0)
+            start = time.perf_counter()
+            result, error = import_class_bundle("t@x", f"class_target{r}", buffer)
+            elapsed = time.perf_counter() - start
+            if error:
+                raise SystemExit(error)
+            print(f"import #{r + 1}: {elapsed:.2f}s  {result['chunks'] / elapsed:,.0f} chunks/s  {size_mb / elapsed:.1f} MB/s")
+    finally:
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Class bundle import throughput")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--chunks-per-file", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.files, args.chunks_per_file, args.repeat)
@@ -0,0 +1,55 @@
+"""Shared helpers for the benchmark scripts."""
+import time
+import tempfile
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+
+# Dimension of Chroma's default embedding model (all-MiniLM-L6-v2)
+EMBEDDING_DIM = 384
+
+
+def temp_client():
+    """A throwaway persistent Chroma client, so benchmarks never touch ./data"""
+    path = tempfile.mkdtemp(prefix="teachtwin-bench-")
+    return chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False)), path
+
+
+def random_embeddings(n: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> np.ndarray:
+    """Unit-normalised float32 vectors, standing in for real chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_in_batches(collection, ids, embeddings, metadatas=None, documents=None, batch_size: int = 5000):
+    """Chroma caps the size of a single add, so large corpora go in batches"""
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.add(
+            ids=ids[start:end],
+            embeddings=[list(map(float, e)) for e in embeddings[start:end]],
+            metadatas=metadatas[start:end] if metadatas else None,
+            documents=documents[start:end] if documents else None,
+        )
+
+
+def timed(fn, *args, **kwargs):
+    """Run fn and return (result, elapsed milliseconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def percentiles(samples_ms) -> dict:
+    samples = np.asarray(samples_ms)
+    return {
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+        "p99": float(np.percentile(samples, 99)),
+        "mean": float(samples.mean()),
+    }
+
+
+def format_row(label: str, stats: dict) -> str:
+    return f"{label:<32} p50={stats['p50']:8.2f}ms  p95={stats['p95']:8.2f}ms  p99={stats['p99']:8.2f}ms"
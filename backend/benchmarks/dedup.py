@@ -0,0 +1,100 @@
+"""
+Near-duplicate detection cost and accuracy. Builds a synthetic class corpus
+in which every lecture is uploaded in several versions (draft, final, v2:
+a few words edited and a slide added each time), chunks it like an upload,
+and feeds it through dedup.detect_duplicates in upload order.
+
+Reports, per corpus size: detection time per chunk (the ingest-time
+overhead), index size on disk, the share of later-version chunks marked as
+duplicates (should be high) and of first-version chunks marked (should be
+near zero, since lectures are distinct).
+
+Usage (from the backend directory):
+    python -m benchmarks.dedup [--lectures 20 80 320] [--versions 3] [--words 1500] [--edit-rate 0.01]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from benchmarks.load_benchmark import TOPICS, make_document
+
+
+def versions_of(rng: random.Random, text: str, versions: int, edit_rate: float) -> list:
+    """The original plus `versions - 1` lightly edited copies, each building on the last"""
+    out = [text]
+    vocabulary = sorted({w for terms in TOPICS.values() for t in terms for w in t.split()})
+    for _ in range(versions - 1):
+        words = out[-1].split()
+        for i in range(len(words)):
+            if rng.random() < edit_rate:
+                words[i] = rng.choice(vocabulary)
+        words.extend(f"Additional slide with a worked example number {rng.randint(1, 99)}.".split())
+        out.append(" ".join(words))
+    return out
+
+
+def run(args):
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="teachtwin-dedup-")
+    sys.path.insert(0, backend_dir)
+    os.environ.setdefault("ANTHROPIC_API_KEY", "unused")
+    os.chdir(workdir)
+    try:
+        import dedup
+        from ingest import chunk_text
+        dedup.DEDUP_MODE = "mark"
+
+        print(f"threshold={dedup.DEDUP_THRESHOLD}, {dedup.NUM_PERM} permutations in {dedup.BANDS} bands, "
+              f"{args.versions} versions per lecture, edit rate {args.edit_rate:.0%}")
+        print(f"{'lectures':>8} {'chunks':>7} {'ms/chunk':>9} {'p95 ms/upload':>14} {'index KiB':>10} {'B/chunk':>8} "
+              f"{'later marked':>13} {'first marked':>13}")
+        for lectures in args.lectures:
+            rng = random.Random(args.seed)
+            topics = list(TOPICS)
+            scope = f"bench_{lectures}"
+            dedup.discard_index(scope)
+
+            uploads = []
+            for lecture in range(lectures):
+                text = make_document(rng, topics[lecture % len(topics)], args.words)
+                for version, body in enumerate(versions_of(rng, text, args.versions, args.edit_rate)):
+                    uploads.append((f"lecture_{lecture:03d}_v{version}.txt", version, chunk_text(body)))
+            # Teachers upload drafts first and revisions later
+            uploads.sort(key=lambda upload: upload[1])
+
+            total_chunks, upload_ms = 0, []
+            marked = {True: [0, 0], False: [0, 0]}  # later version? -> [marked, total]
+            for filename, version, chunks in uploads:
+                ids = [f"{scope}:{filename}:{i}" for i in range(len(chunks))]
+                metadatas = [{"source": filename} for _ in chunks]
+                start = time.perf_counter()
+                dedup.detect_duplicates(scope, ids, chunks, metadatas)
+                upload_ms.append((time.perf_counter() - start) * 1000)
+                total_chunks += len(chunks)
+                counts = marked[version > 0]
+                counts[0] += sum(bool(m.get("dup_group")) for m in metadatas)
+                counts[1] += len(chunks)
+
+            size = os.path.getsize(dedup._path(scope))
+            upload_ms.sort()
+            p95 = upload_ms[int(0.95 * (len(upload_ms) - 1))]
+            later = marked[True][0] / max(1, marked[True][1])
+            first = marked[False][0] / max(1, marked[False][1])
+            print(f"{lectures:>8} {total_chunks:>7} {sum(upload_ms) / total_chunks:>9.3f} {p95:>14.1f} "
+                  f"{size / 1024:>10.1f} {size / total_chunks:>8.0f} {later:>13.1%} {first:>13.1%}")
+    finally:
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate detection overhead, index size and accuracy")
+    parser.add_argument("--lectures", type=int, nargs="+", default=[20, 80, 320])
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--words", type=int, default=1500)
+    parser.add_argument("--edit-rate", type=float, default=0.01, help="Fraction of words changed between versions")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,74 @@
+"""
+Exact flat-index search versus Chroma's HNSW across collection sizes, on both
+sides of FLAT_INDEX_MAX_CHUNKS. Reports query latency and recall@k against a
+float64 brute-force ground truth.
+
+Usage (from the backend directory):
+    python -m benchmarks.flat_vs_hnsw [--sizes 200,1000,2000,5000,20000] [--queries 200] [--k 4]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import numpy as np
+from benchmarks.common import temp_client, random_embeddings, add_in_batches, timed, percentiles, format_row
+from flat_index import FlatIndex, FLAT_INDEX_MAX_CHUNKS
+
+
+def exact_top_k(matrix: np.ndarray, q: np.ndarray, k: int) -> set:
+    distances = ((matrix.astype(np.float64) - q.astype(np.float64)) ** 2).sum(axis=1)
+    return set(np.argsort(distances)[:k].tolist())
+
+
+def recall(found_ids, truth: set) -> float:
+    return len({int(i) for i in found_ids} & truth) / len(truth)
+
+
+def run(sizes, queries: int, k: int):
+    print(f"FLAT_INDEX_MAX_CHUNKS={FLAT_INDEX_MAX_CHUNKS}, k={k}, {queries} queries per size")
+    for size in sizes:
+        vectors = random_embeddings(size)
+        ids = [str(i) for i in range(size)]
+        docs = [""] * size
+        metas = [{"source": "doc.pdf"}] * size
+        query_vectors = random_embeddings(queries, seed=1)
+        truths = [exact_top_k(vectors, q, k) for q in query_vectors]
+
+        client, path = temp_client()
+        mmap_dir = tempfile.mkdtemp(prefix="teachtwin-flat-")
+        try:
+            collection = client.create_collection("bench")
+            add_in_batches(collection, ids, vectors, metas)
+            indexes = {
+                "flat": FlatIndex(ids, vectors, docs, metas),
+                "flat (mmap)": FlatIndex(ids, vectors, docs, metas, os.path.join(mmap_dir, "bench.npy")),
+            }
+
+            side = "below" if size <= FLAT_INDEX_MAX_CHUNKS else "above"
+            print(f"\n{size} chunks ({side} threshold)")
+            for label, index in indexes.items():
+                latencies, recalls = [], []
+                for q, truth in zip(query_vectors, truths):
+                    result, ms = timed(index.query, q, k)
+                    latencies.append(ms)
+                    recalls.append(recall(result["ids"][0], truth))
+                print(f"{format_row(label, percentiles(latencies))}  recall@{k}={np.mean(recalls):.3f}")
+
+            latencies, recalls = [], []
+            for q, truth in zip(query_vectors, truths):
+                result, ms = timed(collection.query, query_embeddings=[q.tolist()], n_results=k)
+                latencies.append(ms)
+                recalls.append(recall(result["ids"][0], truth))
+            print(f"{format_row('hnsw', percentiles(latencies))}  recall@{k}={np.mean(recalls):.3f}")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(mmap_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flat index vs HNSW latency and recall")
+    parser.add_argument("--sizes", default="200,1000,2000,5000,20000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.queries, args.k)
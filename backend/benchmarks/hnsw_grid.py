@@ -0,0 +1,123 @@
+"""
+HNSW parameter sweep. For every combination of M, construction_ef and
+search_ef, builds a fresh collection and reports recall@k against brute
+force, query latency, build time and on-disk size.
+
+Uses synthetic vectors by default. Pass --corpus with a directory of .pdf/.txt
+course materials to chunk and embed real text instead (needs the embedding
+model to be available).
+
+Usage (from the backend directory):
+    python -m benchmarks.hnsw_grid [--chunks 20000] [--M 8,16,32] [--construction-ef 100,200] [--search-ef 10,50,100]
+    python -m benchmarks.hnsw_grid --corpus ~/courses/cs4260 --space cosine
+"""
+import argparse
+import os
+import shutil
+import time
+import numpy as np
+from benchmarks.common import temp_client, random_embeddings, add_in_batches, timed, percentiles
+
+
+def load_corpus(directory: str) -> np.ndarray:
+    """Chunk and embed every .pdf/.txt file in a directory"""
+    from ingest import chunk_text, extract_text_from_pdf, extract_text_from_plain
+    from vectorstore import embed_query
+
+    chunks = []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        with open(path, "rb") as f:
+            if filename.lower().endswith(".pdf"):
+                text = extract_text_from_pdf(f)
+            elif filename.lower().endswith(".txt"):
+                text = extract_text_from_plain(f)
+            else:
+                continue
+        chunks.extend(chunk_text(text))
+    print(f"Embedding {len(chunks)} chunks from {directory}")
+    return np.asarray([embed_query(chunk) for chunk in chunks], dtype=np.float32)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def brute_force(vectors: np.ndarray, queries: np.ndarray, k: int, space: str):
+    if space == "l2":
+        scores = 2.0 * (queries @ vectors.T) - (vectors ** 2).sum(axis=1)[None, :]
+    else:
+        if space == "cosine":
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def run(vectors, queries, space, Ms, construction_efs, search_efs, k):
+    truths = []
+    for start in range(0, len(queries), 50):
+        truths.extend(brute_force(vectors, queries[start:start + 50], k, space))
+    ids = [str(i) for i in range(len(vectors))]
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, space={space}, k={k}")
+    print(f"{'M':>4} {'c_ef':>6} {'s_ef':>6} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'disk MB':>8}")
+    for M in Ms:
+        for construction_ef in construction_efs:
+            for search_ef in search_efs:
+                client, path = temp_client()
+                try:
+                    collection = client.create_collection("bench", metadata={
+                        "hnsw:space": space,
+                        "hnsw:M": M,
+                        "hnsw:construction_ef": construction_ef,
+                        "hnsw:search_ef": search_ef,
+                    })
+                    start = time.perf_counter()
+                    add_in_batches(collection, ids, vectors)
+                    build_s = time.perf_counter() - start
+
+                    latencies, recalls = [], []
+                    for q, truth in zip(queries, truths):
+                        result, ms = timed(collection.query, query_embeddings=[q.tolist()], n_results=k)
+                        latencies.append(ms)
+                        recalls.append(len({int(i) for i in result["ids"][0]} & truth) / k)
+                    stats = percentiles(latencies)
+                    disk_mb = directory_size(path) / (1024 * 1024)
+                    print(f"{M:>4} {construction_ef:>6} {search_ef:>6} {np.mean(recalls):>8.3f} "
+                          f"{stats['p50']:>8.2f} {stats['p99']:>8.2f} {build_s:>8.2f} {disk_mb:>8.1f}")
+                finally:
+                    shutil.rmtree(path, ignore_errors=True)
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HNSW recall/latency/size sweep")
+    parser.add_argument("--corpus", help="directory of .pdf/.txt files to use instead of synthetic vectors")
+    parser.add_argument("--chunks", type=int, default=20000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="l2")
+    parser.add_argument("--M", type=int_list, default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int_list, default=[100, 200])
+    parser.add_argument("--search-ef", type=int_list, default=[10, 50, 100])
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+        # Slightly perturbed chunks stand in for questions
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+        queries = corpus[picks] + rng.normal(0, 0.01, corpus[picks].shape).astype(np.float32)
+    else:
+        corpus = random_embeddings(args.chunks)
+        queries = random_embeddings(args.queries, seed=1)
+
+    run(corpus, queries, args.space, args.M, args.construction_ef, args.search_ef, args.k)
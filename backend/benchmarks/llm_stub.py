@@ -0,0 +1,124 @@
+"""
+Local stand-in for the Anthropic Messages API, so load tests measure the
+backend rather than the network and rate limits.
+
+Point the backend at it with ANTHROPIC_BASE_URL=http://127.0.0.1:<port>
+(the anthropic SDK reads that variable). Each response takes
+`latency + output_tokens / token_rate` seconds, with optional jitter.
+
+Usage (from the backend directory):
+    python -m benchmarks.llm_stub [--port 8765] [--latency 0.4] [--token-rate 80] [--output-tokens 200]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.4, token_rate: float = 80.0, output_tokens: int = 200, jitter: float = 0.1):
+        self.latency = latency          # seconds before the first token
+        self.token_rate = token_rate    # output tokens per second (0 = instant)
+        self.output_tokens = output_tokens
+        self.jitter = jitter            # +/- fraction applied to the total delay
+
+
+def _text_length(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list):
+        return sum(_text_length(block.get("text", "")) if isinstance(block, dict) else _text_length(block) for block in value)
+    return 0
+
+
+def make_handler(config: StubConfig, stats: dict):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = {}
+
+            if not self.path.rstrip("/").endswith("/messages"):
+                self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                return
+
+            prompt_chars = _text_length(body.get("system", "")) + sum(
+                _text_length(message.get("content", "")) for message in body.get("messages", [])
+            )
+            input_tokens = max(1, prompt_chars // 4)
+            output_tokens = min(config.output_tokens, int(body.get("max_tokens", config.output_tokens)))
+
+            delay = config.latency
+            if config.token_rate > 0:
+                delay += output_tokens / config.token_rate
+            if config.jitter:
+                delay *= 1 + random.uniform(-config.jitter, config.jitter)
+            time.sleep(max(0.0, delay))
+
+            with lock:
+                stats["requests"] = stats.get("requests", 0) + 1
+                stats["input_tokens"] = stats.get("input_tokens", 0) + input_tokens
+                stats["output_tokens"] = stats.get("output_tokens", 0) + output_tokens
+
+            self._send(200, {
+                "id": f"msg_stub_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model", "stub"),
+                "content": [{"type": "text", "text": " ".join(["stub"] * output_tokens)}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            })
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_stub(config: StubConfig, port: int = 0):
+    """
+    Serve the stub on a daemon thread.
+    Returns (server, base_url, stats); call server.shutdown() when done.
+    """
+    stats = {}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Anthropic Messages API stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--token-rate", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server, url, _ = start_stub(StubConfig(args.latency, args.token_rate, args.output_tokens, args.jitter), args.port)
+    print(f"LLM stub listening on {url} (set ANTHROPIC_BASE_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
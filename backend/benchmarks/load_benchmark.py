@@ -0,0 +1,400 @@
+"""
+End-to-end load test of app.py against a local LLM stub.
+
+Boots the backend in a scratch directory with ANTHROPIC_BASE_URL pointing at
+benchmarks.llm_stub, seeds it over HTTP with synthetic teachers, students,
+classes and course materials, then drives /ask, /upload, /classes and /files
+at a fixed concurrency. Reports throughput and p50/p95/p99 per endpoint.
+
+Baselines are JSON files under benchmarks/baselines/, so a run can be
+compared with an earlier version of the code:
+
+    python -m benchmarks.load_benchmark --save before
+    (change something)
+    python -m benchmarks.load_benchmark --compare before
+
+Pass --target http://host:port to load an already running server instead
+(it must be configured with its own LLM or stub).
+
+Usage (from the backend directory):
+    python -m benchmarks.load_benchmark [--concurrency 16] [--duration 60] [--classes 4] [--students 40]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import percentiles
+from benchmarks.llm_stub import StubConfig, start_stub
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Relative weight of each operation in the request mix
+DEFAULT_MIX = {
+    "ask_class": 40,
+    "ask_personal": 15,
+    "list_classes": 15,
+    "list_files": 15,
+    "list_materials": 10,
+    "upload": 5,
+}
+
+TOPICS = {
+    "photosynthesis": ["chlorophyll", "light reactions", "calvin cycle", "stomata", "glucose", "thylakoid"],
+    "thermodynamics": ["entropy", "enthalpy", "heat engine", "carnot cycle", "free energy", "equilibrium"],
+    "linear algebra": ["eigenvalue", "matrix", "vector space", "basis", "determinant", "orthogonal"],
+    "microeconomics": ["supply curve", "elasticity", "marginal cost", "monopoly", "utility", "equilibrium price"],
+    "cell biology": ["mitochondria", "membrane", "ribosome", "cytoskeleton", "endocytosis", "nucleus"],
+    "algorithms": ["recursion", "dynamic programming", "graph search", "heap", "complexity", "sorting"],
+}
+FILLER = (
+    "the lecture covers this in detail with worked examples and practice problems "
+    "students should review the definitions before the next session and note how "
+    "each idea connects to the previous unit"
+).split()
+
+
+# ===== Synthetic corpus =====
+
+def make_document(rng: random.Random, topic: str, words: int) -> str:
+    """A pseudo-lecture about one topic, with its key terms spread through the text"""
+    terms = TOPICS[topic]
+    out = [f"Lecture notes: {topic}."]
+    while len(out) < words:
+        term = rng.choice(terms)
+        out.append(f"The {term} is central to {topic}.")
+        out.extend(rng.choice(FILLER) for _ in range(rng.randint(8, 20)))
+    return " ".join(out)
+
+
+def make_question(rng: random.Random, topic: str) -> str:
+    term = rng.choice(TOPICS[topic])
+    return rng.choice([
+        f"What is the role of {term} in {topic}?",
+        f"Can you explain {term}?",
+        f"How does {term} relate to {topic}?",
+    ])
+
+
+# ===== HTTP client =====
+
+class Client:
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, token: str = None, json_body=None, files=None):
+        """Returns (status, parsed body or None)"""
+        headers = {}
+        data = None
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for filename, content in files:
+                parts.append(
+                    f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+                    f"Content-Type: text/plain\r\n\r\n".encode("utf-8") + content.encode("utf-8") + b"\r\n"
+                )
+            parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+            data = b"".join(parts)
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        try:
+            return status, json.loads(body) if body else None
+        except ValueError:
+            return status, None
+
+
+# ===== Server lifecycle =====
+
+def start_backend(workdir: str, llm_url: str, port: int):
+    """Run app.py's Flask app on a threaded dev server inside workdir"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.update({
+        "ANTHROPIC_API_KEY": "stub",
+        "ANTHROPIC_BASE_URL": llm_url,
+        "PYTHONPATH": backend_dir + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(workdir, "server.log"), "wb"),
+    )
+    return process
+
+
+def wait_until_healthy(client: Client, timeout: float = 60.0, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit("Backend exited during startup; see server.log")
+        try:
+            status, _ = client.request("GET", "/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit("Backend did not become healthy in time")
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ===== Seeding =====
+
+def register(client: Client, email: str) -> str:
+    status, body = client.request("POST", "/register", json_body={"email": email, "password": "load-test", "name": email})
+    if status != 200:
+        status, body = client.request("POST", "/login", json_body={"email": email, "password": "load-test"})
+    if status != 200:
+        raise SystemExit(f"Could not register {email}: {status} {body}")
+    return body["access_token"]
+
+
+def seed(client: Client, rng: random.Random, classes: int, students: int, files_per_class: int, words: int) -> dict:
+    """Create teachers, classes with materials, and students with personal uploads"""
+    run_id = uuid.uuid4().hex[:6]
+    topics = list(TOPICS)
+    state = {"classes": [], "students": []}
+
+    for c in range(classes):
+        topic = topics[c % len(topics)]
+        token = register(client, f"teacher{c}-{run_id}@load.test")
+        status, body = client.request("POST", "/classes", token, json_body={"name": f"{topic.title()} {c}"})
+        if status != 200:
+            raise SystemExit(f"Could not create class: {status} {body}")
+        files = [(f"{topic.replace(' ', '_')}_{f}.txt", make_document(rng, topic, words)) for f in range(files_per_class)]
+        status, body_upload = client.request("POST", f"/classes/{body['class_id']}/upload", token, files=files)
+        if status != 200:
+            raise SystemExit(f"Could not upload class materials: {status} {body_upload}")
+        state["classes"].append({"class_id": body["class_id"], "invite_code": body["invite_code"], "topic": topic, "teacher": token})
+
+    for s in range(students):
+        token = register(client, f"student{s}-{run_id}@load.test")
+        enrolled = state["classes"][s % len(state["classes"])] if state["classes"] else None
+        if enrolled:
+            client.request("POST", f"/classes/{enrolled['class_id']}/join", token, json_body={"invite_code": enrolled["invite_code"]})
+        topic = rng.choice(topics)
+        client.request("POST", "/upload", token, files=[(f"notes_{s}.txt", make_document(rng, topic, words // 2))])
+        state["students"].append({"token": token, "class": enrolled, "topic": topic})
+
+    return state
+
+
+# ===== Load =====
+
+def operation(client: Client, rng: random.Random, state: dict, name: str):
+    """Run one operation; returns (endpoint label, status)"""
+    student = rng.choice(state["students"])
+    token = student["token"]
+    if name == "ask_class" and student["class"]:
+        cls = student["class"]
+        status, _ = client.request("POST", "/ask", token, json_body={
+            "question": make_question(rng, cls["topic"]), "class_id": cls["class_id"],
+        })
+        return "POST /ask (class)", status
+    if name in ("ask_class", "ask_personal"):
+        status, _ = client.request("POST", "/ask", token, json_body={"question": make_question(rng, student["topic"])})
+        return "POST /ask (personal)", status
+    if name == "list_classes":
+        return "GET /classes", client.request("GET", "/classes", token)[0]
+    if name == "list_files":
+        return "GET /files", client.request("GET", "/files", token)[0]
+    if name == "list_materials" and student["class"]:
+        return "GET /classes/<id>/materials", client.request("GET", f"/classes/{student['class']['class_id']}/materials", token)[0]
+    if name == "upload":
+        filename = f"extra_{rng.randint(0, 9)}.txt"
+        status, _ = client.request("POST", "/upload", token, files=[(filename, make_document(rng, student["topic"], 600))])
+        return "POST /upload", status
+    return "GET /classes", client.request("GET", "/classes", token)[0]
+
+
+def drive(client: Client, state: dict, mix: dict, concurrency: int, duration: float, seed_value: int) -> dict:
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id: int):
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                label, status = operation(client, rng, state, name)
+            except OSError:
+                label, status = name, 0
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                samples[label].append(elapsed_ms)
+                if status >= 400 or status == 0:
+                    errors[label] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i) for i in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    results = {}
+    for label, values in samples.items():
+        results[label] = {
+            "requests": len(values),
+            "errors": errors[label],
+            "rps": len(values) / wall,
+            **percentiles(values),
+        }
+    total = sum(len(v) for v in samples.values())
+    results["TOTAL"] = {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "rps": total / wall,
+        **percentiles([v for values in samples.values() for v in values]),
+    }
+    return results
+
+
+# ===== Reporting =====
+
+def print_report(results: dict):
+    print(f"{'endpoint':<30} {'reqs':>7} {'errs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label in sorted(results, key=lambda l: (l == "TOTAL", l)):
+        r = results[label]
+        print(f"{label:<30} {r['requests']:>7} {r['errors']:>6} {r['rps']:>8.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f}")
+
+
+def save_baseline(name: str, config: dict, results: dict) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump({"config": config, "results": results, "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2)
+    return path
+
+
+def compare_baseline(name: str, results: dict, threshold: float) -> bool:
+    """Print deltas against a saved baseline. Returns True if any endpoint regressed."""
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    regressed = False
+    print(f"\nvs. baseline '{name}' (regression = p95 or rps worse by more than {threshold:.0%})")
+    for label in sorted(results, key=lambda l: (l == "TOTAL", l)):
+        if label not in baseline:
+            continue
+        old, new = baseline[label], results[label]
+        p95_change = (new["p95"] - old["p95"]) / old["p95"] if old["p95"] else 0.0
+        rps_change = (new["rps"] - old["rps"]) / old["rps"] if old["rps"] else 0.0
+        flag = ""
+        if p95_change > threshold or rps_change < -threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{label:<30} p95 {old['p95']:>8.1f} -> {new['p95']:>8.1f} ms ({p95_change:+.0%})  "
+              f"rps {old['rps']:>6.1f} -> {new['rps']:>6.1f} ({rps_change:+.0%}){flag}")
+    return regressed
+
+
+def run(args) -> int:
+    rng = random.Random(args.seed)
+    mix = dict(DEFAULT_MIX)
+    for item in args.mix or []:
+        key, _, weight = item.partition("=")
+        mix[key] = float(weight)
+
+    stub = process = workdir = None
+    try:
+        if args.target:
+            base_url = args.target
+        else:
+            stub, llm_url, stub_stats = start_stub(StubConfig(args.llm_latency, args.llm_token_rate, args.llm_output_tokens))
+            workdir = tempfile.mkdtemp(prefix="teachtwin-load-")
+            port = free_port()
+            process = start_backend(workdir, llm_url, port)
+            base_url = f"http://127.0.0.1:{port}"
+            print(f"backend {base_url} in {workdir}, LLM stub {llm_url}")
+
+        client = Client(base_url)
+        wait_until_healthy(client, process=process)
+
+        start = time.perf_counter()
+        state = seed(client, rng, args.classes, args.students, args.files_per_class, args.words)
+        print(f"seeded {args.classes} classes x {args.files_per_class} files, {args.students} students "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        print(f"driving {args.concurrency} concurrent clients for {args.duration:.0f}s")
+        results = drive(client, state, mix, args.concurrency, args.duration, args.seed)
+        print_report(results)
+        if stub is not None:
+            print(f"LLM stub served {stub_stats.get('requests', 0)} calls, "
+                  f"{stub_stats.get('input_tokens', 0):,} input / {stub_stats.get('output_tokens', 0):,} output tokens")
+
+        config = {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+        config["mix"] = mix
+        if args.save:
+            print(f"saved baseline to {save_baseline(args.save, config, results)}")
+        if args.compare and compare_baseline(args.compare, results, args.threshold):
+            return 1
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if stub is not None:
+            stub.shutdown()
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test against a local LLM stub")
+    parser.add_argument("--target", help="Load an already running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of load after seeding")
+    parser.add_argument("--classes", type=int, default=4)
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--files-per-class", type=int, default=5)
+    parser.add_argument("--words", type=int, default=3000, help="Approximate words per class document")
+    parser.add_argument("--mix", nargs="*", metavar="OP=WEIGHT", help=f"Override operation weights ({', '.join(DEFAULT_MIX)})")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Stub seconds before the first token")
+    parser.add_argument("--llm-token-rate", type=float, default=80.0, help="Stub output tokens per second")
+    parser.add_argument("--llm-output-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="NAME", help="Save results as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against a saved baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change counted as a regression")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch data directory and server.log")
+    sys.exit(run(parser.parse_args()))
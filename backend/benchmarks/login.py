@@ -0,0 +1,163 @@
+"""
+Login throughput and profile lookups at realistic user counts.
+
+Writes a users.json with --users accounts into a scratch directory (every
+account shares one precomputed bcrypt hash, so seeding is instant), then:
+
+  lookup  time to fetch one user's display name by parsing users.json (the
+          previous behavior of get_user_name and authenticate_user) vs. the
+          cached, email-keyed lookup
+  storm   --concurrency clients logging in through the Flask app in-process
+          for --duration seconds, like an exam start: as before (users.json
+          parsed for every lookup, bcrypt on every request thread, i.e. a
+          pool as large as the client count and no queue limit) vs. the
+          cached lookup with the bounded pool. A separate client polls
+          GET /classes throughout to show what the storm does to other
+          requests. Clients turned away with 503 wait for Retry-After.
+
+Usage (from the backend directory):
+    python -m benchmarks.login [--users 1000 10000 50000] [--concurrency 32] [--rounds 12] [--duration 15]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import bcrypt
+from benchmarks.common import percentiles
+
+PASSWORD = "exam-day"
+
+
+def write_users(path: str, count: int, hashed: str):
+    users = {
+        f"student{i}@bench.test": {"password": hashed, "name": f"Student {i}", "created_at": "0"}
+        for i in range(count)
+    }
+    with open(path, "w") as f:
+        json.dump(users, f, indent=2)
+
+
+def time_lookups(auth, count: int, repeat: int = 50) -> tuple:
+    rng = random.Random(count)
+    emails = [f"student{rng.randrange(count)}@bench.test" for _ in range(repeat)]
+    start = time.perf_counter()
+    for email in emails[:5]:
+        auth.load_users().get(email)
+    parsed = (time.perf_counter() - start) * 1000 / 5
+    auth.get_user(emails[0])  # the one parse the cache needs
+    start = time.perf_counter()
+    for email in emails:
+        auth.get_user_name(email)
+    cached = (time.perf_counter() - start) * 1000 / repeat
+    return parsed, cached
+
+
+def storm(app, users: int, concurrency: int, duration: float, seed: int) -> dict:
+    latencies, statuses, other = [], {}, []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def login(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            email = f"student{rng.randrange(users)}@bench.test"
+            start = time.perf_counter()
+            response = client.post("/login", json={"email": email, "password": PASSWORD})
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 503:
+                # As a well-behaved client would
+                time.sleep(min(float(response.headers.get("Retry-After", 1)), max(0.0, deadline - time.perf_counter())))
+
+    def browse():
+        from flask_jwt_extended import create_access_token
+        client = app.test_client()
+        with app.app_context():
+            # Logging in would compete with the storm for the hashing pool
+            token = create_access_token(identity="student0@bench.test")
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get("/classes", headers={"Authorization": f"Bearer {token}"})
+            other.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(concurrency)] + [threading.Thread(target=browse)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    ok = statuses.get(200, 0)
+    return {
+        "logins_per_s": ok / wall,
+        "busy": statuses.get(503, 0),
+        "failed": sum(count for status, count in statuses.items() if status not in (200, 503)),
+        "login": percentiles(latencies),
+        # A stalled worker may not answer even once before the deadline
+        "other": percentiles(other or [duration * 1000]),
+    }
+
+
+def run(args):
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="teachtwin-login-")
+    sys.path.insert(0, backend_dir)
+    os.environ.setdefault("ANTHROPIC_API_KEY", "unused")
+    os.chdir(workdir)
+    try:
+        import auth
+        from app import app
+        auth.BCRYPT_ROUNDS = args.rounds
+        os.makedirs("./data", exist_ok=True)
+        hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+        start = time.perf_counter()
+        bcrypt.checkpw(PASSWORD.encode("utf-8"), hashed.encode("utf-8"))
+        print(f"{os.cpu_count()} CPUs, bcrypt cost {args.rounds} ({(time.perf_counter() - start) * 1000:.0f} ms per check), "
+              f"{args.concurrency} clients logging in for {args.duration:.0f}s")
+
+        print(f"\n{'users':>7} {'file MiB':>9} {'parse ms':>9} {'cached ms':>10}")
+        for count in args.users:
+            write_users(auth.USERS_FILE, count, hashed)
+            parsed, cached = time_lookups(auth, count)
+            size = os.path.getsize(auth.USERS_FILE) / 2 ** 20
+            print(f"{count:>7} {size:>9.1f} {parsed:>9.2f} {cached:>10.4f}")
+
+        cached_get_user = auth.get_user
+        modes = [
+            ("parse + request threads", False, args.concurrency, 10 ** 6),
+            (f"cache + pool {args.pool}/queue {args.queue}", True, args.pool, args.queue),
+        ]
+        print(f"\n{'mode':>28} {'logins/s':>9} {'503s':>6} {'fails':>6} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'other p50':>10} {'other p95':>10}")
+        for label, cached, pool, queue in modes:
+            write_users(auth.USERS_FILE, args.users[-1], hashed)
+            auth.get_user = cached_get_user if cached else (lambda email: auth.load_users().get(email))
+            auth.PASSWORD_HASH_CONCURRENCY = pool
+            auth.PASSWORD_HASH_MAX_QUEUE = queue
+            auth._pool = None
+            row = storm(app, args.users[-1], args.concurrency, args.duration, args.seed)
+            print(f"{label:>28} {row['logins_per_s']:>9.1f} {row['busy']:>6} {row['failed']:>6} "
+                  f"{row['login']['p50']:>8.0f} {row['login']['p95']:>8.0f} {row['other']['p50']:>10.1f} {row['other']['p95']:>10.1f}")
+    finally:
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login throughput under a login storm, and cached vs. parsed profile lookups")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients logging in at once")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--pool", type=int, default=2, help="PASSWORD_HASH_CONCURRENCY for the pooled run")
+    parser.add_argument("--queue", type=int, default=32, help="PASSWORD_HASH_MAX_QUEUE for the pooled run")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
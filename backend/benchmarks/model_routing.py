@@ -0,0 +1,99 @@
+"""
+Answer-route latency and token spend against the local LLM stub. No network,
+no embedding model: retrieval results are synthetic chunks, sized by each
+route's n_results, so only routing, prompt assembly and the (stubbed) LLM
+call are measured.
+
+Each question is answered twice: through its classified route, and through
+the fixed "standard" route every answer used before routing.
+
+Usage (from the backend directory):
+    python -m benchmarks.model_routing [--questions questions.txt] [--llm-latency 0.3] [--llm-token-rate 120]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from benchmarks.common import percentiles
+from benchmarks.llm_stub import StubConfig, start_stub
+
+SAMPLE_QUESTIONS = [
+    "What room is the lecture in?",
+    "When is the midterm?",
+    "Who is the TA for section 2?",
+    "How many problem sets are there?",
+    "Is there a lab this week?",
+    "What is a list comprehension?",
+    "What does the syllabus say about late work?",
+    "Summarize the main points of lecture 4",
+    "What is the formula for compound interest?",
+    "Why does entropy always increase in an isolated system?",
+    "Explain the difference between mitosis and meiosis",
+    "How does the Calvin cycle use ATP and NADPH?",
+    "Walk me through the proof that the square root of 2 is irrational",
+    "Compare supervised and unsupervised learning with examples from the course",
+]
+
+CHUNK = ("Course material text. " * 40)[:800]
+
+
+def synthetic_results(n: int) -> dict:
+    return {
+        "documents": [[CHUNK] * n],
+        "metadatas": [[{"source": f"lecture_{i:02d}.pdf"} for i in range(n)]],
+    }
+
+
+def run(questions, latency: float, token_rate: float, repeat: int):
+    server, url, stats = start_stub(StubConfig(latency=latency, token_rate=token_rate, output_tokens=2000, jitter=0.0))
+    os.environ["ANTHROPIC_BASE_URL"] = url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    sys.path.insert(0, os.getcwd())
+    from query import ROUTES, classify_question, generate_answer
+
+    try:
+        for mode in ("fixed", "routed"):
+            latencies = defaultdict(list)
+            tokens = defaultdict(lambda: [0, 0])
+            for _ in range(repeat):
+                for question in questions:
+                    route = classify_question(question) if mode == "routed" else "standard"
+                    label = classify_question(question)
+                    before_in, before_out = stats.get("input_tokens", 0), stats.get("output_tokens", 0)
+                    start = time.perf_counter()
+                    generate_answer(synthetic_results(ROUTES[route]["n_results"]), question, "beginner", "neutral", route)
+                    latencies[label].append((time.perf_counter() - start) * 1000)
+                    tokens[label][0] += stats["input_tokens"] - before_in
+                    tokens[label][1] += stats["output_tokens"] - before_out
+
+            print(f"\n{mode}: {'every question on the standard route' if mode == 'fixed' else 'questions on their classified route'}")
+            print(f"{'question class':<16} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'in tok/q':>9} {'out tok/q':>10}")
+            for label in ROUTES:
+                if not latencies[label]:
+                    continue
+                stats_ms = percentiles(latencies[label])
+                n = len(latencies[label])
+                print(f"{label:<16} {n:>4} {stats_ms['p50']:>9.1f} {stats_ms['p95']:>9.1f} "
+                      f"{tokens[label][0] / n:>9.0f} {tokens[label][1] / n:>10.0f}")
+    finally:
+        server.shutdown()
+
+    print("\nroutes:")
+    for name, settings in ROUTES.items():
+        print(f"  {name:<10} model={settings['model']} max_tokens={settings['max_tokens']} n_results={settings['n_results']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer routing latency and token spend against the LLM stub")
+    parser.add_argument("--questions", help="Text file with one question per line (default: built-in samples)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub seconds before the first token")
+    parser.add_argument("--llm-token-rate", type=float, default=120.0, help="Stub output tokens per second")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    questions = SAMPLE_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    run(questions, args.llm_latency, args.llm_token_rate, args.repeat)
@@ -0,0 +1,94 @@
+"""
+What header/footer stripping saves before chunking. For each document,
+reports pages, lines removed, characters and chunks before and after
+normalize.normalize_pages, plus extraction + normalization time. No vector
+store, embedding model or LLM is involved.
+
+Without --corpus, synthetic slide decks are generated: every page repeats a
+course title, instructor line, copyright footer and page number around a few
+lines of content.
+
+Usage (from the backend directory):
+    python -m benchmarks.normalization [--corpus path/to/materials] [--decks 10] [--pages 40]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from benchmarks.load_benchmark import TOPICS, FILLER
+
+
+def synthetic_deck(rng: random.Random, topic: str, pages: int) -> list:
+    deck = []
+    for page in range(1, pages + 1):
+        content = []
+        for _ in range(rng.randint(3, 7)):
+            term = rng.choice(TOPICS[topic])
+            content.append(f"The {term} is central to {topic}. " + " ".join(rng.choice(FILLER) for _ in range(rng.randint(6, 14))))
+        deck.append("\n".join([
+            f"{topic.title()} - Spring Term",
+            "Prof. A. Example, Department of Science",
+            *content,
+            "(c) University of Example. For enrolled students only. Do not distribute.",
+            f"{page} / {pages}",
+        ]))
+    return deck
+
+
+def corpus_pages(path: str) -> dict:
+    """filename -> pages, using the upload extractors"""
+    from ingest import extract_pages_from_pdf, extract_text_from_plain
+    documents = {}
+    for filename in sorted(os.listdir(path)):
+        full = os.path.join(path, filename)
+        if not os.path.isfile(full):
+            continue
+        with open(full, "rb") as f:
+            if filename.lower().endswith(".pdf"):
+                documents[filename] = extract_pages_from_pdf(f)
+            else:
+                documents[filename] = extract_text_from_plain(f).split("\f")
+    return documents
+
+
+def run(args):
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("ANTHROPIC_API_KEY", "unused")
+    from ingest import count_chunks, chunk_text
+    from normalize import normalize_pages
+
+    if args.corpus:
+        documents = corpus_pages(os.path.abspath(args.corpus))
+    else:
+        rng = random.Random(args.seed)
+        topics = list(TOPICS)
+        documents = {
+            f"deck_{i:02d}.pdf": synthetic_deck(rng, topics[i % len(topics)], args.pages)
+            for i in range(args.decks)
+        }
+
+    print(f"{'document':<28} {'pages':>5} {'lines -':>7} {'chars':>9} {'after':>9} {'chunks':>6} {'after':>6} {'ms':>7}")
+    totals = [0, 0, 0, 0]
+    for filename, pages in documents.items():
+        start = time.perf_counter()
+        text, stats = normalize_pages(pages)
+        ms = (time.perf_counter() - start) * 1000
+        before = count_chunks(stats["chars_before"])
+        after = len(chunk_text(text))
+        totals = [totals[0] + stats["chars_before"], totals[1] + stats["chars_after"], totals[2] + before, totals[3] + after]
+        print(f"{filename[:28]:<28} {stats['pages']:>5} {stats['lines_removed']:>7} {stats['chars_before']:>9} "
+              f"{stats['chars_after']:>9} {before:>6} {after:>6} {ms:>7.2f}")
+
+    if totals[0]:
+        print(f"\ntotal: {totals[0]} -> {totals[1]} chars ({1 - totals[1] / totals[0]:.1%} less), "
+              f"{totals[2]} -> {totals[3]} chunks ({1 - totals[3] / max(1, totals[2]):.1%} fewer)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Characters and chunks saved by header/footer stripping")
+    parser.add_argument("--corpus", help="Directory of materials (.pdf, .txt, .md); default: synthetic slide decks")
+    parser.add_argument("--decks", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,122 @@
+"""
+/ask latency and LLM calls for a class question stream, answered live versus
+with the top questions precomputed. Questions are drawn from a pool with a
+Zipf-like distribution (a few questions account for most asks), at random
+levels and tones. The app runs in-process against llm_stub in a scratch
+directory, with a small synthetic class.
+
+The "precomputed" mode first replays a warm-up stream to fill the question
+log, runs the precompute job once (as an upload would trigger it) and then
+measures the same stream as "live". Reported per mode: p50/p95 /ask latency,
+hit rate, LLM calls during the measured stream, and the LLM calls the job
+spent.
+
+Usage (from the backend directory):
+    python -m benchmarks.precomputed_answers [--asks 400] [--pool 60] [--zipf 1.1] [--top 10] [--llm-latency 0.4]
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from benchmarks.common import percentiles
+from benchmarks.llm_stub import StubConfig, start_stub
+from benchmarks.load_benchmark import TOPICS, make_document
+
+VARIANTS = [("beginner", "neutral"), ("beginner", "friendly"), ("advanced", "formal")]
+
+
+def question_pool(size: int) -> list:
+    templates = ["What is {term}?", "Can you explain {term} in {topic}?", "How is {term} used in {topic}?"]
+    pool = []
+    for topic, terms in TOPICS.items():
+        for term in terms:
+            for template in templates:
+                pool.append(template.format(term=term, topic=topic))
+    return pool[:size]
+
+
+def question_stream(rng: random.Random, pool: list, asks: int, s: float) -> list:
+    weights = [1.0 / (rank ** s) for rank in range(1, len(pool) + 1)]
+    variant_weights = [0.7, 0.2, 0.1]
+    stream = []
+    for question in rng.choices(pool, weights=weights, k=asks):
+        level, tone = rng.choices(VARIANTS, weights=variant_weights)[0]
+        # Students phrase the same question with different case and punctuation
+        stream.append((question.lower() if rng.random() < 0.3 else question, level, tone))
+    return stream
+
+
+def run(args):
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="teachtwin-precompute-")
+    server, url, stats = start_stub(StubConfig(latency=args.llm_latency, token_rate=0, output_tokens=200, jitter=0.0))
+    os.environ["ANTHROPIC_BASE_URL"] = url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    sys.path.insert(0, backend_dir)
+    os.chdir(workdir)
+    try:
+        import top_questions
+        from app import app
+        top_questions.PRECOMPUTE_TOP_QUESTIONS = args.top
+        top_questions.PRECOMPUTE_DELAY_SECONDS = 3600  # the job is run explicitly below
+        top_questions.QUESTION_LOG_FLUSH_SECONDS = 0
+
+        client = app.test_client()
+        token = client.post("/register", json={"email": "t@bench", "password": "pw", "name": "T", "role": "teacher"}).get_json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        created = client.post("/classes", headers=headers, json={"name": "Bench"}).get_json()
+        class_id = created.get("class_id") or created["class"]["class_id"]
+        rng = random.Random(args.seed)
+        files = [(io.BytesIO(make_document(rng, topic, args.words).encode()), f"{topic.replace(' ', '_')}.txt") for topic in TOPICS]
+        client.post(f"/classes/{class_id}/upload", headers=headers, data={"files": files}, content_type="multipart/form-data")
+
+        pool = question_pool(args.pool)
+        warmup = question_stream(random.Random(args.seed + 1), pool, args.asks, args.zipf)
+        measured = question_stream(random.Random(args.seed + 2), pool, args.asks, args.zipf)
+
+        def ask_all(stream):
+            latencies, hits = [], 0
+            calls_before = stats.get("requests", 0)
+            for question, level, tone in stream:
+                start = time.perf_counter()
+                body = client.post("/ask", headers=headers, json={"question": question, "class_id": class_id, "level": level, "tone": tone}).get_json()
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += "precomputed" in body
+            return latencies, hits, stats.get("requests", 0) - calls_before
+
+        print(f"{args.asks} asks over {len(pool)} questions (zipf s={args.zipf}), top {args.top}, LLM latency {args.llm_latency}s")
+        print(f"{'mode':>12} {'p50 ms':>8} {'p95 ms':>8} {'hit rate':>9} {'LLM calls':>10} {'job calls':>10}")
+
+        top_questions.PRECOMPUTE_TOP_QUESTIONS = 0
+        latencies, hits, calls = ask_all(measured)
+        row = percentiles(latencies)
+        print(f"{'live':>12} {row['p50']:>8.1f} {row['p95']:>8.1f} {hits / len(measured):>9.1%} {calls:>10} {0:>10}")
+
+        top_questions.PRECOMPUTE_TOP_QUESTIONS = args.top
+        ask_all(warmup)
+        calls_before = stats.get("requests", 0)
+        top_questions.precompute_answers(class_id)
+        job_calls = stats.get("requests", 0) - calls_before
+        latencies, hits, calls = ask_all(measured)
+        row = percentiles(latencies)
+        print(f"{'precomputed':>12} {row['p50']:>8.1f} {row['p95']:>8.1f} {hits / len(measured):>9.1%} {calls:>10} {job_calls:>10}")
+    finally:
+        server.shutdown()
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Class /ask latency with the top questions precomputed vs answered live")
+    parser.add_argument("--asks", type=int, default=400)
+    parser.add_argument("--pool", type=int, default=60, help="Distinct questions")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of question popularity")
+    parser.add_argument("--top", type=int, default=10, help="PRECOMPUTE_TOP_QUESTIONS")
+    parser.add_argument("--words", type=int, default=1500, help="Words per class document")
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+Memory, recall and latency of the int8 quantized index (at several rescore
+factors) against the float32 flat index and Chroma's HNSW.
+
+Usage (from the backend directory):
+    python -m benchmarks.quantization [--chunks 50000] [--queries 200] [--k 4] [--rescore 1,2,4,8]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import numpy as np
+from benchmarks.common import temp_client, random_embeddings, add_in_batches, timed, percentiles
+from benchmarks.flat_vs_hnsw import exact_top_k
+from flat_index import FlatIndex
+from quantized_index import QuantizedIndex
+
+
+def hnsw_data_bytes(path: str) -> int:
+    """Size of data_level0.bin, where HNSW keeps the float32 vectors"""
+    total = 0
+    for root, _, files in os.walk(path):
+        if "data_level0.bin" in files:
+            total += os.path.getsize(os.path.join(root, "data_level0.bin"))
+    return total
+
+
+def report(label, memory_bytes, latencies, recalls, k):
+    stats = percentiles(latencies)
+    print(f"{label:<24} {memory_bytes / (1024 * 1024):>10.1f} {np.mean(recalls):>10.3f} "
+          f"{stats['p50']:>8.2f} {stats['p99']:>8.2f}")
+
+
+def run(chunks: int, queries: int, k: int, rescore_factors):
+    vectors = random_embeddings(chunks)
+    # Queries near stored chunks, like questions that paraphrase the material
+    rng = np.random.default_rng(1)
+    query_vectors = vectors[rng.choice(chunks, size=queries, replace=False)] + \
+        rng.normal(0, 0.05, (queries, vectors.shape[1])).astype(np.float32)
+    truths = [exact_top_k(vectors, q, k) for q in query_vectors]
+    ids = [str(i) for i in range(chunks)]
+    metas = [{"source": "doc.pdf"}] * chunks
+
+    print(f"{chunks} vectors x {vectors.shape[1]} dims, {queries} queries, k={k}")
+    print(f"{'index':<24} {'resident MB':>10} {'recall':>10} {'p50 ms':>8} {'p99 ms':>8}")
+
+    flat = FlatIndex(ids, vectors, [""] * chunks, metas)
+    latencies, recalls = [], []
+    for q, truth in zip(query_vectors, truths):
+        result, ms = timed(flat.query, q, k)
+        latencies.append(ms)
+        recalls.append(len({int(i) for i in result["ids"][0]} & truth) / k)
+    report("flat float32", flat.matrix.nbytes, latencies, recalls, k)
+
+    workdir = tempfile.mkdtemp(prefix="teachtwin-quant-")
+    try:
+        index = QuantizedIndex.build(os.path.join(workdir, "bench"), "bench", ids, vectors, metas)
+        for factor in rescore_factors:
+            latencies, recalls = [], []
+            for q, truth in zip(query_vectors, truths):
+                hits, ms = timed(index.search, q, k, None, factor)
+                latencies.append(ms)
+                recalls.append(len({int(i) for i, _ in hits} & truth) / k)
+            report(f"int8 rescore x{factor}", index.memory_bytes(), latencies, recalls, k)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    client, path = temp_client()
+    try:
+        collection = client.create_collection("bench")
+        add_in_batches(collection, ids, vectors, metas)
+        latencies, recalls = [], []
+        for q, truth in zip(query_vectors, truths):
+            result, ms = timed(collection.query, query_embeddings=[q.tolist()], n_results=k)
+            latencies.append(ms)
+            recalls.append(len({int(i) for i in result["ids"][0]} & truth) / k)
+        report("hnsw (chroma default)", hnsw_data_bytes(path), latencies, recalls, k)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="int8 quantization trade-offs")
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rescore", default="1,2,4,8")
+    args = parser.parse_args()
+    run(args.chunks, args.queries, args.k, [int(r) for r in args.rescore.split(",")])
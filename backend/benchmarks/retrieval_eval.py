@@ -0,0 +1,311 @@
+"""
+Offline retrieval evaluation against golden question sets.
+
+Chunks a class corpus at each configured chunk size/overlap into a scratch
+class collection, runs the same retrieval as answer_question_for_class
+(vectorstore.query_collection) for every golden question, and reports
+recall@k, MRR and retrieval latency per configuration. `--hybrid on` also
+evaluates vector results fused with a BM25 keyword ranking (reciprocal rank
+fusion), so the lexical signal can be judged before it is wired into query.py.
+
+The golden file is JSON or JSON Lines, one entry per question:
+
+    {"question": "What does the Calvin cycle produce?", "sources": ["lecture_03.pdf"]}
+
+A hit is a retrieved chunk whose `source` is one of the expected filenames.
+recall@k is the fraction of expected sources present in the top k; MRR uses
+the rank of the first hit.
+
+With --llm-stub, each configuration's top-k context is also sent through the
+answer prompt to benchmarks.llm_stub and the reported input token counts are
+averaged, which shows what a larger k or chunk costs per question.
+
+Usage (from the backend directory):
+    python -m benchmarks.retrieval_eval --corpus path/to/materials --golden golden.jsonl \\
+        [--chunk-sizes 400 800 1200] [--overlaps 100] [--k 2 4 8] [--hybrid off on] [--llm-stub]
+    python -m benchmarks.retrieval_eval --synthetic   # generated corpus and questions
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from benchmarks.common import percentiles
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+# ===== Inputs =====
+
+def load_golden(path: str) -> list:
+    with open(path, "r") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for entry in entries:
+        if not entry.get("question") or not entry.get("sources"):
+            raise SystemExit(f"Golden entry needs 'question' and 'sources': {entry}")
+    return entries
+
+
+def load_corpus(path: str) -> dict:
+    """filename -> extracted text, using the same extractors as uploads"""
+    from ingest import extract_pages_from_pdf, extract_text_from_plain
+    from normalize import normalize_pages
+    corpus = {}
+    for filename in sorted(os.listdir(path)):
+        full = os.path.join(path, filename)
+        if not os.path.isfile(full):
+            continue
+        with open(full, "rb") as f:
+            pages = extract_pages_from_pdf(f) if filename.lower().endswith(".pdf") else extract_text_from_plain(f).split("\f")
+        text, _ = normalize_pages(pages)
+        if text.strip():
+            corpus[filename] = text
+    return corpus
+
+
+def synthetic_inputs(files_per_topic: int, questions: int, seed: int):
+    """Corpus and golden set from the load test's topic generator"""
+    import random
+    from benchmarks.load_benchmark import TOPICS, make_document, make_question
+    rng = random.Random(seed)
+    corpus = {}
+    by_topic = {}
+    for topic in TOPICS:
+        for f in range(files_per_topic):
+            filename = f"{topic.replace(' ', '_')}_{f}.txt"
+            corpus[filename] = make_document(rng, topic, 2000)
+            by_topic.setdefault(topic, []).append(filename)
+    golden = []
+    for _ in range(questions):
+        topic = rng.choice(list(TOPICS))
+        golden.append({"question": make_question(rng, topic), "sources": by_topic[topic]})
+    return corpus, golden
+
+
+# ===== Keyword ranking =====
+
+class BM25:
+    def __init__(self, documents, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(TOKEN_RE.findall(doc.lower())) for doc in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df = Counter()
+        for counts in self.term_counts:
+            df.update(counts.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def top(self, query: str, n: int):
+        """Indexes of the n best-scoring documents"""
+        terms = [t for t in TOKEN_RE.findall(query.lower()) if t in self.idf]
+        scores = []
+        for i, counts in enumerate(self.term_counts):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            for term in terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [i for _, i in scores[:n]]
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """Merge ranked id lists; ids ranked well by either list rise to the top"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# ===== Evaluation =====
+
+def build_collection(corpus: dict, chunk_size: int, overlap: int):
+    """Chunk the corpus into a fresh class collection, as a class upload would"""
+    from ingest import chunk_text
+    from vectorstore import get_class_collection, delete_class_collection, refresh_search_indexes
+
+    class_id = f"eval_{chunk_size}_{overlap}"
+    delete_class_collection(class_id)
+    collection = get_class_collection(class_id)
+    ids, documents, metadatas = [], [], []
+    for filename, text in corpus.items():
+        for i, chunk in enumerate(chunk_text(text, size=chunk_size, overlap=overlap)):
+            ids.append(f"{class_id}:{filename}:{i}")
+            documents.append(chunk)
+            metadatas.append({"source": filename, "class_id": class_id})
+    for start in range(0, len(ids), 1000):
+        collection.add(ids=ids[start:start + 1000], documents=documents[start:start + 1000], metadatas=metadatas[start:start + 1000])
+    refresh_search_indexes(collection)
+    return collection, ids, documents, metadatas
+
+
+def score(retrieved_sources, expected) -> tuple:
+    """(recall, reciprocal rank) for one question"""
+    expected = set(expected)
+    recall = len(expected & set(retrieved_sources)) / len(expected)
+    for rank, source in enumerate(retrieved_sources, start=1):
+        if source in expected:
+            return recall, 1.0 / rank
+    return recall, 0.0
+
+
+def evaluate(corpus, golden, chunk_sizes, overlaps, ks, hybrid_modes, llm=None) -> list:
+    from vectorstore import query_collection
+    rows = []
+    for chunk_size in chunk_sizes:
+        for overlap in overlaps:
+            if overlap >= chunk_size:
+                continue
+            start = time.perf_counter()
+            collection, ids, documents, metadatas = build_collection(corpus, chunk_size, overlap)
+            build_s = time.perf_counter() - start
+            position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            bm25 = BM25(documents) if "on" in hybrid_modes else None
+
+            for k in ks:
+                for hybrid in hybrid_modes:
+                    recalls, rrs, latencies, prompt_tokens = [], [], [], []
+                    for entry in golden:
+                        question = entry["question"]
+                        t0 = time.perf_counter()
+                        if hybrid == "on":
+                            # Fuse a wider vector candidate pool with the keyword ranking
+                            pool = max(k * 4, 20)
+                            results = query_collection(collection, question, n_results=pool)
+                            vector_ranking = [position[i] for i in results["ids"][0] if i in position]
+                            top = reciprocal_rank_fusion([vector_ranking, bm25.top(question, pool)])[:k]
+                        else:
+                            results = query_collection(collection, question, n_results=k)
+                            top = [position[i] for i in results["ids"][0] if i in position]
+                        latencies.append((time.perf_counter() - t0) * 1000)
+
+                        recall, rr = score([metadatas[i]["source"] for i in top], entry["sources"])
+                        recalls.append(recall)
+                        rrs.append(rr)
+                        if llm is not None:
+                            prompt_tokens.append(llm([documents[i] for i in top], question))
+
+                    stats = percentiles(latencies)
+                    rows.append({
+                        "chunk_size": chunk_size,
+                        "overlap": overlap,
+                        "k": k,
+                        "hybrid": hybrid,
+                        "chunks": len(ids),
+                        "build_s": build_s,
+                        "recall": sum(recalls) / len(recalls),
+                        "mrr": sum(rrs) / len(rrs),
+                        "p50_ms": stats["p50"],
+                        "p95_ms": stats["p95"],
+                        "prompt_tokens": (sum(prompt_tokens) / len(prompt_tokens)) if prompt_tokens else None,
+                    })
+    return rows
+
+
+def stub_prompt_counter(args):
+    """Send each answer prompt to a local LLM stub and return its input token count"""
+    from benchmarks.llm_stub import StubConfig, start_stub
+    from query import build_prompts
+    from llm import get_client, MODEL
+    server, url, _ = start_stub(StubConfig(latency=0.0, token_rate=0.0, output_tokens=1, jitter=0.0))
+    # Read by the anthropic SDK when llm.get_client() first builds the client
+    os.environ["ANTHROPIC_BASE_URL"] = url
+
+    def count(contexts, question):
+        system_prompt, user_prompt = build_prompts(contexts, question, args.level, args.tone)
+        response = get_client().messages.create(
+            model=MODEL,
+            max_tokens=1,
+            system=system_prompt,
+            messages=[{"role": "user", "content": user_prompt}],
+        )
+        return response.usage.input_tokens
+
+    return server, count
+
+
+def print_table(rows):
+    show_tokens = any(row["prompt_tokens"] is not None for row in rows)
+    header = f"{'chunk':>6} {'overlap':>7} {'k':>3} {'hybrid':>6} {'chunks':>7} {'recall@k':>9} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header + (f" {'prompt tok':>10}" if show_tokens else ""))
+    for row in rows:
+        line = (f"{row['chunk_size']:>6} {row['overlap']:>7} {row['k']:>3} {row['hybrid']:>6} {row['chunks']:>7} "
+                f"{row['recall']:>9.3f} {row['mrr']:>6.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+        if show_tokens:
+            line += f" {row['prompt_tokens']:>10.0f}"
+        print(line)
+
+
+def run(args):
+    backend_dir = os.getcwd()
+    if args.synthetic:
+        corpus, golden = synthetic_inputs(args.files_per_topic, args.questions, args.seed)
+    else:
+        if not args.corpus or not args.golden:
+            raise SystemExit("--corpus and --golden are required unless --synthetic is given")
+        golden = load_golden(os.path.abspath(args.golden))
+        corpus_dir = os.path.abspath(args.corpus)
+
+    # The backend modules use ./data relative paths, so work in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="teachtwin-eval-")
+    sys.path.insert(0, backend_dir)
+    # No answers are generated; query.py and ingest.py only need a key to import
+    os.environ.setdefault("ANTHROPIC_API_KEY", "unused")
+    server = None
+    os.chdir(workdir)
+    try:
+        if not args.synthetic:
+            corpus = load_corpus(corpus_dir)
+        missing = {s for entry in golden for s in entry["sources"]} - set(corpus)
+        if missing:
+            print(f"warning: golden sources not in corpus: {', '.join(sorted(missing))}")
+        print(f"{len(corpus)} files, {len(golden)} questions")
+
+        llm = None
+        if args.llm_stub:
+            server, llm = stub_prompt_counter(args)
+
+        rows = evaluate(corpus, golden, args.chunk_sizes, args.overlaps, args.k, args.hybrid, llm)
+        print_table(rows)
+        if args.output:
+            with open(os.path.join(backend_dir, args.output), "w") as f:
+                json.dump(rows, f, indent=2)
+    finally:
+        if server is not None:
+            server.shutdown()
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval recall/MRR/latency over golden question sets")
+    parser.add_argument("--corpus", help="Directory of class materials (.pdf, .txt, .md)")
+    parser.add_argument("--golden", help="JSON or JSONL file of {question, sources}")
+    parser.add_argument("--synthetic", action="store_true", help="Use a generated corpus and question set")
+    parser.add_argument("--files-per-topic", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[800])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[100])
+    parser.add_argument("--k", type=int, nargs="+", default=[4])
+    parser.add_argument("--hybrid", choices=["off", "on"], nargs="+", default=["off"])
+    parser.add_argument("--llm-stub", action="store_true", help="Measure answer-prompt input tokens via benchmarks.llm_stub")
+    parser.add_argument("--level", default="beginner")
+    parser.add_argument("--tone", default="neutral")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the rows as JSON to this path")
+    run(parser.parse_args())
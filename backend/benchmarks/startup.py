@@ -0,0 +1,118 @@
+"""
+Backend startup time. Measures, in fresh interpreters:
+
+  cold     import app, create_app(), first /health, first vector-store request
+  preload  the gunicorn --preload path: the parent imports and preloads once,
+           then each forked worker's time to serve /health and to open its
+           own vector store
+
+Runs in a scratch directory, so ./data is never touched.
+
+Usage (from the backend directory):
+    python -m benchmarks.startup [--repeat 5] [--workers 4]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+COLD = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+client = flask_app.test_client()
+assert client.get("/health").status_code == 200
+t3 = time.perf_counter()
+assert client.get("/health/vectorstore").status_code == 200
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "first_vectorstore_ms": (t4 - t3) * 1000,
+}))
+"""
+
+PRELOAD = """
+import json, os, time
+t0 = time.perf_counter()
+import app
+app.preload()
+flask_app = app.create_app()
+master_ms = (time.perf_counter() - t0) * 1000
+
+results = []
+for _ in range({workers}):
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        app.init_worker()
+        client = flask_app.test_client()
+        assert client.get("/health").status_code == 200
+        ready = time.perf_counter()
+        assert client.get("/health/vectorstore").status_code == 200
+        opened = time.perf_counter()
+        os.write(write_fd, json.dumps({{
+            "worker_ready_ms": (ready - start) * 1000,
+            "worker_vectorstore_ms": (opened - start) * 1000,
+        }}).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        results.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+
+print(json.dumps({{
+    "master_preload_ms": master_ms,
+    "worker_ready_ms": max(r["worker_ready_ms"] for r in results),
+    "worker_vectorstore_ms": max(r["worker_vectorstore_ms"] for r in results),
+}}))
+"""
+
+
+def run_snippet(code: str, backend_dir: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="teachtwin-startup-")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = backend_dir + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("ANTHROPIC_API_KEY", "unused")
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=workdir, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        raise SystemExit(f"startup run failed:\n{e.stderr}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label: str, runs):
+    for key in runs[0]:
+        values = [r[key] for r in runs]
+        print(f"{label:<8} {key:<24} median {statistics.median(values):9.1f}ms  max {max(values):9.1f}ms")
+
+
+def run(repeat: int, workers: int):
+    backend_dir = os.getcwd()
+    report("cold", [run_snippet(COLD, backend_dir) for _ in range(repeat)])
+    if hasattr(os, "fork"):
+        snippet = PRELOAD.format(workers=workers)
+        report("preload", [run_snippet(snippet, backend_dir) for _ in range(repeat)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend import, app factory and worker boot times")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="Workers forked per preload run")
+    args = parser.parse_args()
+    run(args.repeat, args.workers)
@@ -0,0 +1,147 @@
+"""
+Two-level (summary-routed) retrieval versus flat chunk search as a class
+grows. For each class size a synthetic class is built in a scratch
+directory: every document focuses on one term of one topic, and its summary
+is a short description like the ones generate_summary writes. Questions ask
+about a topic's term; the documents focused on it are the expected sources.
+
+Both modes run through query.search_class, with summary routing forced on or
+off, and each reports per-question latency (including the query embedding),
+hit@k (any expected document retrieved), precision@k (share of retrieved
+chunks from expected documents) and MRR.
+
+Usage (from the backend directory):
+    python -m benchmarks.summary_routing [--documents 36 144 432] [--words 1500] [--questions 60] [--k 4] [--top-documents 8]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from benchmarks.common import percentiles
+from benchmarks.load_benchmark import TOPICS, FILLER
+
+
+def make_focused_document(rng: random.Random, topic: str, focus: str, words: int) -> str:
+    terms = TOPICS[topic]
+    out = [f"Lecture notes: {focus} in {topic}."]
+    while len(out) < words:
+        term = focus if rng.random() < 0.6 else rng.choice(terms)
+        out.append(f"The {term} is central to {topic}.")
+        out.extend(rng.choice(FILLER) for _ in range(rng.randint(8, 20)))
+    return " ".join(out)
+
+
+def make_summary(rng: random.Random, topic: str, focus: str) -> str:
+    others = rng.sample([t for t in TOPICS[topic] if t != focus], 2)
+    return (f"These lecture notes explain {focus} within {topic}. "
+            f"They connect {focus} to {others[0]} and {others[1]} with worked examples.")
+
+
+def synthetic_class(documents: int, words: int, questions: int, seed: int):
+    """(corpus {filename: text}, summaries {filename: summary}, golden [{question, sources}])"""
+    rng = random.Random(seed)
+    pairs = [(topic, focus) for topic in TOPICS for focus in TOPICS[topic]]
+    corpus, summaries, by_pair = {}, {}, {}
+    for i in range(documents):
+        topic, focus = pairs[i % len(pairs)]
+        filename = f"{topic.replace(' ', '_')}_{focus.replace(' ', '_')}_{i // len(pairs)}.txt"
+        corpus[filename] = make_focused_document(rng, topic, focus, words)
+        summaries[filename] = make_summary(rng, topic, focus)
+        by_pair.setdefault((topic, focus), []).append(filename)
+
+    golden = []
+    for _ in range(questions):
+        topic, focus = rng.choice(sorted(by_pair))
+        question = rng.choice([
+            f"What is the role of {focus} in {topic}?",
+            f"Can you explain {focus}?",
+            f"How does {focus} relate to {topic}?",
+        ])
+        golden.append({"question": question, "sources": by_pair[(topic, focus)]})
+    return corpus, summaries, golden
+
+
+def build_class(class_id: str, corpus: dict, summaries: dict):
+    """Chunk and index the corpus as a class upload would, with its summaries"""
+    from ingest import chunk_text
+    from user_storage import add_files_for_class
+    from vectorstore import get_class_collection, refresh_search_indexes
+
+    collection = get_class_collection(class_id)
+    ids, documents, metadatas, entries = [], [], [], {}
+    for filename, text in corpus.items():
+        chunk_ids = []
+        for i, chunk in enumerate(chunk_text(text)):
+            chunk_ids.append(f"{class_id}:{filename}:{i}")
+            documents.append(chunk)
+            metadatas.append({"source": filename, "class_id": class_id})
+        ids.extend(chunk_ids)
+        entries[filename] = {"chunk_ids": chunk_ids, "uploaded_by": "bench", "summary": summaries[filename]}
+    for start in range(0, len(ids), 1000):
+        collection.add(ids=ids[start:start + 1000], documents=documents[start:start + 1000], metadatas=metadatas[start:start + 1000])
+    add_files_for_class(class_id, entries)
+    refresh_search_indexes(collection)
+    return collection, len(ids)
+
+
+def evaluate(collection, class_id: str, golden, k: int, mode: str) -> dict:
+    import summary_index
+    from query import search_class
+
+    summary_index.SUMMARY_ROUTING = "on" if mode == "routed" else "off"
+    latencies, hits, precisions, rrs = [], [], [], []
+    for entry in golden:
+        expected = set(entry["sources"])
+        start = time.perf_counter()
+        results = search_class(collection, class_id, entry["question"], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        sources = [m["source"] for m in results["metadatas"][0]]
+        hits.append(1.0 if expected & set(sources) else 0.0)
+        precisions.append(sum(s in expected for s in sources) / k)
+        rrs.append(next((1.0 / rank for rank, s in enumerate(sources, start=1) if s in expected), 0.0))
+
+    stats = percentiles(latencies)
+    n = len(golden)
+    return {"p50": stats["p50"], "p95": stats["p95"], "hit": sum(hits) / n, "precision": sum(precisions) / n, "mrr": sum(rrs) / n}
+
+
+def run(args):
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="teachtwin-routing-")
+    sys.path.insert(0, backend_dir)
+    os.environ.setdefault("ANTHROPIC_API_KEY", "unused")
+    os.chdir(workdir)
+    try:
+        import summary_index
+        summary_index.SUMMARY_ROUTING_TOP_DOCUMENTS = args.top_documents
+
+        print(f"k={args.k}, top documents={args.top_documents}, {args.questions} questions per size")
+        print(f"{'documents':>9} {'chunks':>7} {'mode':>7} {'p50 ms':>8} {'p95 ms':>8} {'hit@k':>6} {'prec@k':>7} {'MRR':>6}")
+        for documents in args.documents:
+            corpus, summaries, golden = synthetic_class(documents, args.words, args.questions, args.seed)
+            class_id = f"routing_{documents}"
+            collection, chunks = build_class(class_id, corpus, summaries)
+            # Embed the summaries once up front, as the first routed question after an upload would
+            summary_index.get_summary_index(class_id)
+            for mode in ("flat", "routed"):
+                row = evaluate(collection, class_id, golden, args.k, mode)
+                print(f"{documents:>9} {chunks:>7} {mode:>7} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+                      f"{row['hit']:>6.3f} {row['precision']:>7.3f} {row['mrr']:>6.3f}")
+    finally:
+        os.chdir(backend_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary-routed vs flat class retrieval as the document count grows")
+    parser.add_argument("--documents", type=int, nargs="+", default=[36, 144, 432])
+    parser.add_argument("--words", type=int, default=1500, help="Words per document")
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--top-documents", type=int, default=8, help="Documents kept by the summary routing step")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,62 @@
+"""
+Personal-upload query latency: one shared collection filtered by
+`where={"user": ...}` versus hash-bucketed shard collections.
+
+Usage (from the backend directory):
+    python -m benchmarks.user_shards [--users 200] [--chunks-per-user 100] [--buckets 32] [--queries 300]
+"""
+import argparse
+import random
+import shutil
+from benchmarks.common import temp_client, random_embeddings, add_in_batches, timed, percentiles, format_row
+from vectorstore import user_collection_name
+
+
+def run(users: int, chunks_per_user: int, buckets: int, queries: int, n_results: int = 4):
+    client, path = temp_client()
+    try:
+        emails = [f"user{u}@example.edu" for u in range(users)]
+        total = users * chunks_per_user
+        vectors = random_embeddings(total)
+        ids = [f"{email}:notes.pdf:{i}" for email in emails for i in range(chunks_per_user)]
+        metadatas = [{"source": "notes.pdf", "user": email} for email in emails for _ in range(chunks_per_user)]
+
+        shared = client.create_collection("course_materials")
+        add_in_batches(shared, ids, vectors, metadatas)
+
+        shards = {}
+        for start in range(0, total, chunks_per_user):
+            email = metadatas[start]["user"]
+            name = user_collection_name(email, buckets)
+            if name not in shards:
+                shards[name] = client.create_collection(name)
+            end = start + chunks_per_user
+            add_in_batches(shards[name], ids[start:end], vectors[start:end], metadatas[start:end])
+
+        query_vectors = random_embeddings(queries, seed=1)
+        shared_ms, sharded_ms = [], []
+        rng = random.Random(0)
+        for q in query_vectors:
+            email = rng.choice(emails)
+            embedding = [list(map(float, q))]
+            _, ms = timed(shared.query, query_embeddings=embedding, n_results=n_results, where={"user": email})
+            shared_ms.append(ms)
+            shard = shards[user_collection_name(email, buckets)]
+            _, ms = timed(shard.query, query_embeddings=embedding, n_results=n_results, where={"user": email})
+            sharded_ms.append(ms)
+
+        print(f"{users} users x {chunks_per_user} chunks = {total} vectors, {len(shards)} shard collections")
+        print(format_row("shared + where filter", percentiles(shared_ms)))
+        print(format_row(f"sharded ({buckets or 'per-user'} buckets)", percentiles(sharded_ms)))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared vs sharded personal collection latency")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--chunks-per-user", type=int, default=100)
+    parser.add_argument("--buckets", type=int, default=32, help="0 for one collection per user")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+    run(args.users, args.chunks_per_user, args.buckets, args.queries)
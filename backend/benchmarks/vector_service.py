@@ -0,0 +1,128 @@
+"""
+Throughput of gunicorn workers sharing one vector service, by worker count.
+
+For each run: start a fresh vector service (vector_service.py) in a scratch
+directory, start gunicorn (gunicorn.conf.py) with N workers pointed at it
+through VECTOR_SERVICE_URL, seed and drive it with load_benchmark's request mix
+against the LLM stub, and report requests/s and p50/p95 latency. The
+"embedded" row is the default deployment (one worker opening
+./data/vectorstore itself) as the baseline; several embedded workers on one
+store are what the service mode replaces, so they are not measured.
+
+Scaling is bounded by the host's cores: the workers embed queries and
+uploads, and the service searches, on the same machine.
+
+Usage (from the backend directory):
+    python -m benchmarks.vector_service [--workers 1 2 4] [--threads 8] [--concurrency 32] [--duration 30]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.llm_stub import StubConfig, start_stub
+from benchmarks.load_benchmark import DEFAULT_MIX, Client, drive, free_port, seed, wait_until_healthy
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_process(args: list, workdir: str, env: dict, log_name: str):
+    return subprocess.Popen(
+        args,
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(workdir, log_name), "wb"),
+    )
+
+
+def wait_for_service(url: str, process, timeout: float = 60.0):
+    client = Client(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Vector service exited during startup; see vector_service.log")
+        try:
+            if client.request("GET", "/api/v2/heartbeat")[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit("Vector service did not start in time")
+
+
+def run_once(args, llm_url: str, workers, service: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix="teachtwin-vector-service-")
+    env = dict(os.environ)
+    env.update({
+        "ANTHROPIC_API_KEY": "stub",
+        "ANTHROPIC_BASE_URL": llm_url,
+        "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+        "PORT": str(free_port()),
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_THREADS": str(args.threads),
+    })
+    env.pop("VECTOR_SERVICE_URL", None)
+    processes = []
+    try:
+        if service:
+            port = free_port()
+            env["VECTOR_SERVICE_URL"] = f"http://127.0.0.1:{port}"
+            processes.append(start_process(
+                [sys.executable, os.path.join(BACKEND_DIR, "vector_service.py"), "--port", str(port)],
+                workdir, env, "vector_service.log",
+            ))
+            wait_for_service(env["VECTOR_SERVICE_URL"], processes[-1])
+        processes.append(start_process(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"), "--bind", f"127.0.0.1:{env['PORT']}"],
+            workdir, env, "server.log",
+        ))
+        client = Client(f"http://127.0.0.1:{env['PORT']}")
+        wait_until_healthy(client, process=processes[-1])
+        state = seed(client, random.Random(args.seed), args.classes, args.students, args.files_per_class, args.words)
+        return drive(client, state, DEFAULT_MIX, args.concurrency, args.duration, args.seed)["TOTAL"]
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args) -> int:
+    stub, llm_url, _ = start_stub(StubConfig(args.llm_latency, args.llm_token_rate, args.llm_output_tokens))
+    try:
+        print(f"{os.cpu_count()} CPUs, {args.threads} threads per worker, {args.concurrency} concurrent clients "
+              f"for {args.duration:.0f}s, LLM latency {args.llm_latency}s")
+        print(f"{'store':>10} {'workers':>8} {'reqs':>7} {'errs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'vs embedded':>12}")
+        runs = [("embedded", 1)] + [("service", workers) for workers in args.workers]
+        baseline = None
+        for mode, workers in runs:
+            total = run_once(args, llm_url, workers, service=mode == "service")
+            baseline = baseline or total["rps"]
+            print(f"{mode:>10} {workers:>8} {total['requests']:>7} {total['errors']:>6} {total['rps']:>8.1f} "
+                  f"{total['p50']:>9.1f} {total['p95']:>9.1f} {total['rps'] / baseline:>11.2f}x")
+        return 0
+    finally:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-worker throughput with the vector store as a separate service")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Gunicorn worker counts to run with the service")
+    parser.add_argument("--threads", type=int, default=8, help="GUNICORN_THREADS")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load after seeding")
+    parser.add_argument("--classes", type=int, default=4)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--files-per-class", type=int, default=3)
+    parser.add_argument("--words", type=int, default=1500, help="Approximate words per class document")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Stub seconds before the first token")
+    parser.add_argument("--llm-token-rate", type=float, default=80.0, help="Stub output tokens per second")
+    parser.add_argument("--llm-output-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories and logs")
+    sys.exit(run(parser.parse_args()))
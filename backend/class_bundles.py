@@ -0,0 +1,139 @@
+"""
+Export a class's materials (chunks, embeddings, metadata and summaries) as a
+portable bundle, and import a bundle into another class.
+
+Importing never calls the embedding model or the LLM: stored embeddings are
+written straight into the target's `course_materials_<class_id>` collection
+and the summaries into class_files_index.json, so a teacher can clone last
+term's class without re-uploading anything. Imported chunks are run through
+near-duplicate detection for the target class, which replaces the source
+class's dup_group ids and indexes their signatures for later uploads.
+"""
+from typing import Optional, Tuple
+from snapshots import export_collection, write_snapshot, read_snapshot, load_snapshot
+from user_storage import load_class_files_index, add_files_for_class, get_class_file_chunk_ids
+from vectorstore import get_class_collection, find_class_collection, refresh_search_indexes
+from flat_index import bump_write_version
+from top_questions import materials_changed
+from dedup import detect_duplicates, forget_chunks, class_scope
+
+BUNDLE_KIND = "class_materials"
+
+
+def export_class_bundle(class_id: str, fileobj) -> Tuple[int, int]:
+    """
+    Write a class's materials bundle to a binary file object.
+    Returns (file_count, chunk_count)
+    """
+    files = load_class_files_index().get(class_id, {})
+    collection = find_class_collection(class_id)
+    if collection is None:
+        snapshot = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    else:
+        snapshot = export_collection(collection)
+
+    write_snapshot(fileobj, snapshot, extra={
+        "kind": BUNDLE_KIND,
+        "source_class_id": class_id,
+        "files": files,
+    })
+    return len(files), len(snapshot["ids"])
+
+
+def validate_bundle(bundle: dict, collection) -> Optional[str]:
+    """Return what is wrong with a bundle's manifest, or None if it can be loaded into `collection`"""
+    if not bundle.get("extra", {}).get("source_class_id"):
+        return "missing source_class_id"
+    embeddings = bundle["embeddings"]
+    rows = len(bundle.get("ids") or [])
+    if len(bundle.get("documents") or []) != rows or len(bundle.get("metadatas") or []) != rows:
+        return "ids, documents and metadatas differ in length"
+    if rows and (embeddings.ndim != 2 or embeddings.shape[0] != rows):
+        return f"{embeddings.shape[0] if embeddings.ndim else 0} embeddings for {rows} chunks"
+    existing = collection.get(limit=1, include=["embeddings"])
+    if existing["ids"] and rows and len(existing["embeddings"][0]) != embeddings.shape[1]:
+        return f"embeddings have {embeddings.shape[1]} dimensions, the class uses {len(existing['embeddings'][0])}"
+    return None
+
+
+def import_class_bundle(teacher_email: str, class_id: str, fileobj) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Load a materials bundle into a class. Files with the same name as an
+    existing material replace it.
+    Returns ({"files": n, "chunks": n}, error)
+    """
+    try:
+        bundle = read_snapshot(fileobj)
+    except Exception as e:
+        return None, f"Invalid bundle: {e}"
+
+    extra = bundle.get("extra", {})
+    if extra.get("kind") != BUNDLE_KIND:
+        return None, "Not a class materials bundle"
+
+    collection = get_class_collection(class_id)
+    error = validate_bundle(bundle, collection)
+    if error:
+        return None, f"Invalid bundle: {error}"
+
+    source_prefix = f"{extra['source_class_id']}:"
+    files = extra.get("files", {})
+
+    # Chunk ids and metadata carry the class id, so re-key them for the target
+    def rekey(chunk_id: str) -> str:
+        if chunk_id.startswith(source_prefix):
+            return f"{class_id}:{chunk_id[len(source_prefix):]}"
+        return chunk_id
+
+    bundle["ids"] = [rekey(chunk_id) for chunk_id in bundle["ids"]]
+    bundle["metadatas"] = [
+        {**(metadata or {}), "class_id": class_id, "uploaded_by": teacher_email}
+        for metadata in bundle["metadatas"]
+    ]
+
+    stale_ids = []
+    for filename in files:
+        stale_ids.extend(get_class_file_chunk_ids(class_id, filename))
+
+    # Group ids from the source class mean nothing here; match against this class instead
+    keep = detect_duplicates(
+        class_scope(class_id), bundle["ids"], bundle["documents"], bundle["metadatas"], stale_ids, label="class"
+    )
+    if not all(keep):
+        rows = [i for i, kept in enumerate(keep) if kept]
+        skipped = {chunk_id for chunk_id, kept in zip(bundle["ids"], keep) if not kept}
+        for key in ("ids", "documents", "metadatas"):
+            bundle[key] = [bundle[key][i] for i in rows]
+        bundle["embeddings"] = bundle["embeddings"][rows]
+    else:
+        skipped = set()
+
+    # Write the new chunks before dropping anything, so a failed import leaves the old materials in place
+    try:
+        load_snapshot(collection, bundle)
+    except Exception:
+        added = list(set(bundle["ids"]) - set(stale_ids))
+        if added:
+            collection.delete(ids=added)
+            bump_write_version(collection.name)
+        forget_chunks(class_scope(class_id), added)
+        raise
+
+    # Chunks of replaced materials that the import did not overwrite
+    leftover = list(set(stale_ids) - set(bundle["ids"]))
+    if leftover:
+        collection.delete(ids=leftover)
+        bump_write_version(collection.name)
+
+    add_files_for_class(class_id, {
+        filename: {
+            "chunk_ids": [rekey(chunk_id) for chunk_id in entry["chunk_ids"] if rekey(chunk_id) not in skipped],
+            "uploaded_by": teacher_email,
+            "summary": entry.get("summary", ""),
+        }
+        for filename, entry in files.items()
+    })
+    refresh_search_indexes(collection)
+    materials_changed(class_id)
+
+    return {"files": len(files), "chunks": len(bundle["ids"])}, None
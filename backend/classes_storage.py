@@ -1,12 +1,19 @@
 import os
+import re
+import csv
+import io
 import json
 import secrets
 from typing import List, Dict, Optional, Tuple
+from metrics import timed
 
 # Storage files
 CLASSES_FILE = "./data/classes.json"
 MEMBERSHIPS_FILE = "./data/memberships.json"
 
+MAX_ROSTER_ROWS = 5000
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
 
 def ensure_class_files():
     """Ensure storage files exist"""
@@ -21,6 +28,7 @@ def ensure_class_files():
             json.dump({}, f)
 
 
+@timed("classes_load")
 def load_classes() -> Dict:
     """Load all classes"""
     ensure_class_files()
@@ -28,12 +36,14 @@ def load_classes() -> Dict:
         return json.load(f)
 
 
+@timed("classes_save")
 def save_classes(classes: Dict):
     """Save classes"""
     with open(CLASSES_FILE, "w") as f:
         json.dump(classes, f, indent=2)
 
 
+@timed("memberships_load")
 def load_memberships() -> Dict:
     """Load all memberships"""
     ensure_class_files()
@@ -41,10 +51,13 @@ def load_memberships() -> Dict:
         return json.load(f)
 
 
+@timed("memberships_save")
 def save_memberships(memberships: Dict):
-    """Save memberships"""
-    with open(MEMBERSHIPS_FILE, "w") as f:
+    """Save memberships (written to a temp file and renamed, so a crash mid-write keeps the old file)"""
+    tmp_path = MEMBERSHIPS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(memberships, f, indent=2)
+    os.replace(tmp_path, MEMBERSHIPS_FILE)
 
 
 def generate_invite_code() -> str:
@@ -121,6 +134,28 @@ def update_class(class_id: str, teacher_email: str, name: Optional[str] = None,
     return True, None
 
 
+def delete_class(class_id: str, teacher_email: str) -> Tuple[bool, Optional[str]]:
+    """
+    Delete a class and all of its memberships (teacher only).
+    Returns (success, error)
+    """
+    if not is_teacher_for_class(teacher_email, class_id):
+        return False, "Only teachers can delete a class"
+    
+    classes = load_classes()
+    memberships = load_memberships()
+    
+    if class_id not in classes:
+        return False, "Class not found"
+    
+    del classes[class_id]
+    memberships.pop(class_id, None)
+    
+    save_classes(classes)
+    save_memberships(memberships)
+    return True, None
+
+
 def list_classes_for_user(user_email: str) -> List[Dict]:
     """
     List all classes the user is a member of (as teacher or student).
@@ -247,3 +282,94 @@ def get_class_members(class_id: str) -> List[Dict]:
         })
     
     return members
+
+
+def parse_roster_csv(text: str) -> List[str]:
+    """
+    Emails from a roster CSV. Uses the `email` column when there is a header
+    row with one, otherwise the first column of every row.
+    """
+    rows = [row for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "email" in header:
+        column = header.index("email")
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column].strip() if len(row) > column else "" for row in rows]
+
+
+def add_members_bulk(class_id: str, teacher_email: str, emails: List[str], dry_run: bool = False) -> Tuple[Optional[List[Dict]], Optional[str]]:
+    """
+    Enroll a roster of students in one pass (teacher only). Every row is
+    validated, then all new memberships are written with a single save.
+    Returns (per-row results, error)
+    """
+    if len(emails) > MAX_ROSTER_ROWS:
+        return None, f"Roster is limited to {MAX_ROSTER_ROWS} rows"
+
+    memberships = load_memberships()
+    class_members = memberships.get(class_id)
+    if class_members is None or class_members.get(teacher_email, {}).get("role") != "teacher":
+        return None, "Only teachers can manage the class roster"
+
+    results = []
+    seen = set()
+    added = 0
+    joined_at = str(os.times())
+    for row, email in enumerate(emails, start=1):
+        email = (email or "").strip()
+        if not EMAIL_RE.match(email):
+            results.append({"row": row, "email": email, "status": "error", "error": "Invalid email address"})
+        elif email in seen:
+            results.append({"row": row, "email": email, "status": "error", "error": "Duplicate row"})
+        elif email in class_members:
+            results.append({"row": row, "email": email, "status": "already_member"})
+        else:
+            class_members[email] = {
+                "role": "student",
+                "status": "active",
+                "joined_at": joined_at
+            }
+            results.append({"row": row, "email": email, "status": "added"})
+            added += 1
+        seen.add(email)
+
+    if added and not dry_run:
+        save_memberships(memberships)
+    return results, None
+
+
+def remove_members_bulk(class_id: str, teacher_email: str, emails: List[str]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+    """
+    Remove many students from a class with a single save (teacher only).
+    Teachers cannot be removed this way.
+    Returns (per-row results, error)
+    """
+    if len(emails) > MAX_ROSTER_ROWS:
+        return None, f"Roster is limited to {MAX_ROSTER_ROWS} rows"
+
+    memberships = load_memberships()
+    class_members = memberships.get(class_id)
+    if class_members is None or class_members.get(teacher_email, {}).get("role") != "teacher":
+        return None, "Only teachers can manage the class roster"
+
+    results = []
+    removed = 0
+    for row, email in enumerate(emails, start=1):
+        email = (email or "").strip()
+        member = class_members.get(email)
+        if member is None:
+            results.append({"row": row, "email": email, "status": "not_member"})
+        elif member.get("role") == "teacher":
+            results.append({"row": row, "email": email, "status": "error", "error": "Teachers cannot be removed"})
+        else:
+            del class_members[email]
+            results.append({"row": row, "email": email, "status": "removed"})
+            removed += 1
+
+    if removed:
+        save_memberships(memberships)
+    return results, None
@@ -0,0 +1,348 @@
+"""
+Server-side conversation sessions, so follow-up questions ("explain that
+more simply") work without the client resending earlier turns.
+
+Every turn is kept in ./data/conversations/<owner>/<id>.json, but prompts
+never carry the whole transcript. Once the verbatim turns outgrow
+CONVERSATION_TOKEN_BUDGET, the oldest are folded into a rolling summary
+(off the request path), and history_block() fills the budget with that
+summary plus the newest turns, clipping whatever does not fit. Prompt size is
+therefore bounded however long the conversation runs, even if summarizing
+falls behind.
+
+Follow-ups are rewritten into standalone questions before retrieval, so the
+vector search sees what the student actually means rather than "that".
+
+Turns within one conversation are serialized per process; summarizing runs
+beside them rather than holding them up.
+"""
+import os
+import json
+import time
+import hashlib
+import secrets
+import threading
+from typing import List, Optional
+from metrics import span, record_llm_usage, Histogram
+from llm import create_message, estimate_tokens, MODEL, INTERACTIVE, BACKGROUND, CHARS_PER_TOKEN
+
+CONVERSATION_DIR = "./data/conversations"
+# Tokens of conversation history (summary + recent turns) allowed in a prompt
+CONVERSATION_TOKEN_BUDGET = int(os.environ.get("CONVERSATION_TOKEN_BUDGET", "1500"))
+# Newest turns that are never folded into the summary
+CONVERSATION_RECENT_TURNS = int(os.environ.get("CONVERSATION_RECENT_TURNS", "2"))
+CONVERSATION_MODEL = os.environ.get("CONVERSATION_MODEL", MODEL)
+
+SUMMARY_MAX_TOKENS = max(100, CONVERSATION_TOKEN_BUDGET // 3)
+REWRITE_HISTORY_TOKENS = min(600, CONVERSATION_TOKEN_BUDGET)
+MAX_STANDALONE_CHARS = 500
+
+# Words that usually point back at an earlier turn
+FOLLOWUP_WORDS = {
+    "it", "its", "that", "this", "those", "these", "they", "them", "their", "he", "she", "his", "her",
+    "above", "previous", "earlier", "again", "more", "simpler", "simply", "elaborate", "example",
+    "examples", "another", "else", "same", "instead",
+}
+FOLLOWUP_PREFIXES = ("and ", "but ", "so ", "what about", "how about", "why not", "then ")
+
+HISTORY_TOKENS = Histogram(
+    "teachtwin_conversation_history_tokens",
+    "Estimated tokens of conversation history sent with a question",
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000),
+)
+
+# One lock per existing conversation, dropped when it is deleted
+_locks = {}
+_locks_lock = threading.Lock()
+# Conversations with a summary being written
+_compressing = set()
+
+
+def is_conversation_id(conversation_id: str) -> bool:
+    # Ids are generated here; anything else (e.g. path separators) is not a conversation
+    return bool(conversation_id) and conversation_id.startswith("conv_") and os.path.basename(conversation_id) == conversation_id
+
+
+def conversation_lock(conversation_id: str) -> threading.Lock:
+    """
+    Held while a turn is answered and recorded. Look the conversation up
+    first: locks are only made for ids that could name one.
+    """
+    if not is_conversation_id(conversation_id):
+        raise ValueError(f"Not a conversation id: {conversation_id!r}")
+    with _locks_lock:
+        lock = _locks.get(conversation_id)
+        if lock is None:
+            lock = _locks[conversation_id] = threading.Lock()
+        return lock
+
+
+def _owner_dir(user_email: str) -> str:
+    owner = hashlib.sha1(user_email.lower().encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CONVERSATION_DIR, owner)
+
+
+def _path(user_email: str, conversation_id: str) -> Optional[str]:
+    if not is_conversation_id(conversation_id):
+        return None
+    return os.path.join(_owner_dir(user_email), f"{conversation_id}.json")
+
+
+def save_conversation(conversation: dict):
+    path = _path(conversation["user"], conversation["conversation_id"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conversation["updated_at"] = time.time()
+    with open(path + ".tmp", "w") as f:
+        json.dump(conversation, f)
+    os.replace(path + ".tmp", path)
+
+
+def create_conversation(user_email: str, class_id: Optional[str] = None) -> dict:
+    now = time.time()
+    conversation = {
+        "conversation_id": f"conv_{secrets.token_urlsafe(8)}",
+        "user": user_email,
+        "class_id": class_id,
+        "title": None,
+        "summary": "",
+        "summarized_turns": 0,
+        "turns": [],
+        "created_at": now,
+        "updated_at": now,
+    }
+    save_conversation(conversation)
+    return conversation
+
+
+def get_conversation(user_email: str, conversation_id: str) -> Optional[dict]:
+    """The conversation if it exists and belongs to user_email"""
+    path = _path(user_email, conversation_id)
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        conversation = json.load(f)
+    if conversation.get("user") != user_email:
+        return None
+    return conversation
+
+
+def list_conversations(user_email: str) -> List[dict]:
+    """Newest first, without turns"""
+    directory = _owner_dir(user_email)
+    if not os.path.isdir(directory):
+        return []
+    conversations = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), "r") as f:
+                conversation = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if conversation.get("user") != user_email:
+            continue
+        conversations.append({
+            "conversation_id": conversation["conversation_id"],
+            "class_id": conversation.get("class_id"),
+            "title": conversation.get("title"),
+            "turns": len(conversation.get("turns", [])),
+            "created_at": conversation.get("created_at"),
+            "updated_at": conversation.get("updated_at"),
+        })
+    conversations.sort(key=lambda c: c["updated_at"] or 0, reverse=True)
+    return conversations
+
+
+def delete_conversation(user_email: str, conversation_id: str) -> bool:
+    path = _path(user_email, conversation_id)
+    if path is None or get_conversation(user_email, conversation_id) is None:
+        return False
+    os.remove(path)
+    with _locks_lock:
+        _locks.pop(conversation_id, None)
+    return True
+
+
+def _clip(text: str, tokens: int) -> str:
+    """At most `tokens` of text, cut at the end"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, tokens * CHARS_PER_TOKEN - 3)].rstrip() + "..."
+
+
+def _turn_text(turn: dict) -> str:
+    return f"Student: {turn['question']}\nProfessor: {turn['answer']}"
+
+
+def history_block(conversation: dict, budget: int = CONVERSATION_TOKEN_BUDGET) -> str:
+    """Rolling summary plus the newest turns that fit in `budget` tokens"""
+    remaining = budget
+    summary_part = []
+    if conversation.get("summary"):
+        text = _clip(f"Summary of the earlier conversation:\n{conversation['summary']}", remaining)
+        summary_part.append(text)
+        remaining -= estimate_tokens(text)
+
+    recent = []
+    for turn in reversed(conversation["turns"][conversation["summarized_turns"]:]):
+        if remaining <= 0:
+            break
+        text = _clip(_turn_text(turn), remaining)
+        recent.append(text)
+        remaining -= estimate_tokens(text)
+
+    return "\n\n".join(summary_part + recent[::-1])
+
+
+def is_followup(question: str) -> bool:
+    """Cheap check for questions that lean on earlier turns"""
+    q = " ".join(question.lower().split())
+    words = {w.strip(".,!?;:'\"()") for w in q.split()}
+    return len(words) <= 4 or bool(words & FOLLOWUP_WORDS) or q.startswith(FOLLOWUP_PREFIXES)
+
+
+def rewrite_followup(conversation: dict, question: str) -> str:
+    """A standalone version of `question` for retrieval; unchanged for a first or self-contained question"""
+    if not conversation["turns"] or not is_followup(question):
+        return question
+
+    previous = conversation["turns"][-1].get("standalone") or conversation["turns"][-1]["question"]
+    try:
+        with span("question_rewrite"):
+            response = create_message(
+                priority=INTERACTIVE,
+                model=CONVERSATION_MODEL,
+                max_tokens=100,
+                system=(
+                    "Rewrite the student's latest question as a single standalone question that can be "
+                    "understood without the conversation. Keep the subject matter specific. "
+                    "Reply with the question only."
+                ),
+                messages=[{
+                    "role": "user",
+                    "content": f"Conversation:\n{history_block(conversation, REWRITE_HISTORY_TOKENS)}\n\nLatest question: {question}",
+                }],
+            )
+        record_llm_usage(response, CONVERSATION_MODEL, "conversation_rewrite")
+        rewritten = "".join(block.text for block in response.content).strip()
+        if rewritten and len(rewritten) <= MAX_STANDALONE_CHARS:
+            return rewritten
+    except Exception as e:
+        print("Question rewrite error:", e)
+
+    # Fall back to searching with the previous topic attached
+    return f"{previous} {question}"
+
+
+def add_turn(conversation: dict, question: str, standalone: str, answer: str, sources: List[str]):
+    """Record an answered turn and, if history is over budget, compress it in the background"""
+    conversation["turns"].append({
+        "question": question,
+        "standalone": standalone,
+        "answer": answer,
+        "sources": sources,
+        "asked_at": time.time(),
+    })
+    if not conversation.get("title"):
+        conversation["title"] = _clip(standalone, 20)
+    save_conversation(conversation)
+
+    if _needs_compression(conversation):
+        threading.Thread(
+            target=_compress_later,
+            args=(conversation["user"], conversation["conversation_id"]),
+            name="conversation-compress",
+            daemon=True,
+        ).start()
+
+
+def _needs_compression(conversation: dict) -> bool:
+    pending = conversation["turns"][conversation["summarized_turns"]:]
+    if len(pending) <= CONVERSATION_RECENT_TURNS:
+        return False
+    used = estimate_tokens(conversation.get("summary", "")) + sum(estimate_tokens(_turn_text(t)) for t in pending)
+    return used > CONVERSATION_TOKEN_BUDGET
+
+
+def _compress_later(user_email: str, conversation_id: str):
+    """
+    Summarize without holding the conversation's lock, so the next turn is
+    not kept waiting on a BACKGROUND-priority LLM call, then apply the
+    summary unless another one was applied meanwhile.
+    """
+    with _locks_lock:
+        if conversation_id in _compressing:
+            return
+        _compressing.add(conversation_id)
+    try:
+        if get_conversation(user_email, conversation_id) is None:
+            return
+        with conversation_lock(conversation_id):
+            conversation = get_conversation(user_email, conversation_id)
+        if conversation is None:
+            return
+        summarized_turns = conversation["summarized_turns"]
+        if not compress_history(conversation):
+            return
+
+        with conversation_lock(conversation_id):
+            current = get_conversation(user_email, conversation_id)
+            # Deleted, or summarized by another process, while the summarizer ran
+            if current is None or current["summarized_turns"] != summarized_turns:
+                return
+            # Turns added meanwhile are kept; only the summary is replaced
+            current["summary"] = conversation["summary"]
+            current["summarized_turns"] = conversation["summarized_turns"]
+            save_conversation(current)
+    except Exception as e:
+        # History stays bounded by history_block(); the next turn retries
+        print(f"Conversation compression error for {conversation_id}:", e)
+    finally:
+        with _locks_lock:
+            _compressing.discard(conversation_id)
+
+
+def compress_history(conversation: dict) -> bool:
+    """Fold the oldest unsummarized turns into the rolling summary. Returns True if it changed."""
+    if not _needs_compression(conversation):
+        return False
+
+    start = conversation["summarized_turns"]
+    foldable = conversation["turns"][start:len(conversation["turns"]) - CONVERSATION_RECENT_TURNS]
+    # Keep the summarizer's own prompt bounded when it has fallen behind
+    fold, used = [], 0
+    for turn in foldable:
+        text = _clip(_turn_text(turn), CONVERSATION_TOKEN_BUDGET)
+        if fold and used + estimate_tokens(text) > 2 * CONVERSATION_TOKEN_BUDGET:
+            break
+        fold.append(text)
+        used += estimate_tokens(text)
+
+    with span("history_compress"):
+        response = create_message(
+            priority=BACKGROUND,
+            model=CONVERSATION_MODEL,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            system=(
+                "You maintain a running summary of a tutoring conversation between a student and a professor. "
+                "Merge the new turns into the existing summary. Keep the topics covered, key facts and "
+                "explanations given, and anything the student said they found confusing. "
+                f"Stay under {SUMMARY_MAX_TOKENS * 3 // 4} words."
+            ),
+            messages=[{
+                "role": "user",
+                "content": (
+                    f"Existing summary:\n{conversation.get('summary') or '(none)'}\n\n"
+                    "New turns:\n\n" + "\n\n".join(fold)
+                ),
+            }],
+        )
+    record_llm_usage(response, CONVERSATION_MODEL, "conversation_summary")
+    summary = "".join(block.text for block in response.content).strip()
+    if not summary:
+        return False
+
+    conversation["summary"] = summary
+    conversation["summarized_turns"] = start + len(fold)
+    return True
@@ -0,0 +1,344 @@
+"""
+Near-duplicate chunk detection with MinHash and LSH.
+
+Teachers often upload several versions of the same slides, which fills the
+top-k with copies of one passage. During ingestion every chunk gets a MinHash
+signature over its word 3-grams; LSH banding finds earlier chunks that are
+likely similar, and the signature estimate confirms Jaccard similarity of at
+least DEDUP_THRESHOLD.
+
+DEDUP_MODE:
+  mark (default)  duplicates are stored with a `dup_group` metadata field
+                  (the id of the first chunk seen with that content) and
+                  retrieval keeps only the best-ranked chunk of each group.
+                  Other chunks get an empty `dup_group`, so a re-upload
+                  that is no longer a duplicate overwrites its old tag
+  skip            duplicates are not stored at all. Saves space, but the
+                  passage then lives only in the version that was kept:
+                  deleting that file removes it from the others too
+  off             no detection
+
+There is one index per corpus (a class, or one user's personal uploads),
+stored in ./data/dedup/<scope>.npz as chunk ids, signatures and groups; the
+LSH buckets are rebuilt from the signatures on load. Only chunks ingested
+while detection is on are indexed. Updates hold a lock file next to the
+index, so gunicorn workers uploading to the same corpus do not overwrite
+each other's signatures.
+
+    python dedup.py stats [<scope> ...]
+"""
+import os
+import re
+import sys
+import zlib
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+import numpy as np
+from metrics import Counter
+
+DEDUP_DIR = "./data/dedup"
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "mark").lower()  # mark | skip | off
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.85"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+# Smallest prime above 2**32; the permutations are (a * x + b) mod PRIME
+PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(20240901)
+_A = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+TOKEN_RE = re.compile(r"\w+")
+
+# dup_group of a chunk that duplicates nothing. Chroma merges metadata on
+# upsert, so the key is always written rather than left out.
+NO_DUP_GROUP = ""
+
+# How long an update waits for another process holding the scope's lock file
+LOCK_WAIT_SECONDS = 30
+LOCK_STALE_SECONDS = 300
+
+DUPLICATE_CHUNKS = Counter(
+    "teachtwin_duplicate_chunks_total",
+    "Near-duplicate chunks found during ingestion",
+    ["scope", "action"],
+)
+
+
+def class_scope(class_id: str) -> str:
+    return f"class_{class_id}"
+
+
+def user_scope(user_email: str) -> str:
+    # Users share shard collections, so each user's uploads get their own index
+    return f"user_{hashlib.sha1(user_email.encode('utf-8')).hexdigest()[:16]}"
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32) of the text's word 3-grams, None for empty text"""
+    tokens = TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    if len(tokens) < SHINGLE_WORDS:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # a < 2**32 and x < 2**32, so a * x + b stays below 2**64
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % PRIME
+    return (permuted.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class DuplicateIndex:
+    def __init__(self, ids: List[str] = None, signatures: np.ndarray = None, groups: List[str] = None):
+        self.ids = list(ids or [])
+        self.signatures = list(signatures) if signatures is not None else []
+        self.groups = list(groups or [])
+        self._rebuild_buckets()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _band_keys(self, sig: np.ndarray):
+        return [sig[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+
+    def _rebuild_buckets(self):
+        self._buckets = [{} for _ in range(BANDS)]
+        self._row = {}
+        for row, (chunk_id, sig) in enumerate(zip(self.ids, self.signatures)):
+            self._index_row(row, chunk_id, sig)
+
+    def _index_row(self, row: int, chunk_id: str, sig: np.ndarray):
+        self._row[chunk_id] = row
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(key, []).append(row)
+
+    def find(self, sig: np.ndarray) -> Optional[tuple]:
+        """(chunk_id, group, similarity) of the most similar indexed chunk above the threshold"""
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            candidates.update(band.get(key, ()))
+        best = None
+        for row in candidates:
+            score = similarity(sig, self.signatures[row])
+            if score >= DEDUP_THRESHOLD and (best is None or score > best[2]):
+                best = (self.ids[row], self.groups[row], score)
+        return best
+
+    def add(self, chunk_id: str, sig: np.ndarray, group: str):
+        if chunk_id in self._row:
+            self.remove([chunk_id])
+        self.ids.append(chunk_id)
+        self.signatures.append(sig)
+        self.groups.append(group)
+        self._index_row(len(self.ids) - 1, chunk_id, sig)
+
+    def remove(self, chunk_ids):
+        drop = set(chunk_ids) & set(self._row)
+        if not drop:
+            return
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.signatures = [self.signatures[i] for i in keep]
+        self.groups = [self.groups[i] for i in keep]
+        self._rebuild_buckets()
+
+    def group_sizes(self) -> dict:
+        sizes = {}
+        for group in self.groups:
+            sizes[group] = sizes.get(group, 0) + 1
+        return sizes
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+# scope -> (file mtime, index); reloaded when another process rewrote the file
+_cache = {}
+
+
+def _scope_lock(scope: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(scope, threading.Lock())
+
+
+def _path(scope: str) -> str:
+    return os.path.join(DEDUP_DIR, f"{scope}.npz")
+
+
+def _lock_path(scope: str) -> str:
+    return os.path.join(DEDUP_DIR, f"{scope}.lock")
+
+
+@contextmanager
+def _locked(scope: str):
+    """Hold the scope's thread lock and its cross-process lock file"""
+    with _scope_lock(scope):
+        os.makedirs(DEDUP_DIR, exist_ok=True)
+        path = _lock_path(scope)
+        deadline = time.time() + LOCK_WAIT_SECONDS
+        while True:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                break
+            except FileExistsError:
+                if time.time() >= deadline:
+                    raise RuntimeError(f"Timed out waiting for the {scope} duplicate index")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _mtime(scope: str) -> Optional[int]:
+    try:
+        return os.stat(_path(scope)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_index(scope: str) -> DuplicateIndex:
+    try:
+        with np.load(_path(scope)) as data:
+            return DuplicateIndex(data["ids"].tolist(), data["signatures"], data["groups"].tolist())
+    except (OSError, KeyError, ValueError):
+        return DuplicateIndex()
+
+
+def _cached_index(scope: str) -> DuplicateIndex:
+    """The scope's index, from memory unless the file changed. Call inside _locked(scope)."""
+    mtime = _mtime(scope)
+    cached = _cache.get(scope)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    index = load_index(scope)
+    _cache[scope] = (mtime, index)
+    return index
+
+
+def save_index(scope: str, index: DuplicateIndex):
+    os.makedirs(DEDUP_DIR, exist_ok=True)
+    path = _path(scope)
+    signatures = np.array(index.signatures, dtype=np.uint32).reshape(len(index), NUM_PERM)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, ids=np.array(index.ids, dtype=str), signatures=signatures, groups=np.array(index.groups, dtype=str))
+    os.replace(path + ".tmp", path)
+    _cache[scope] = (_mtime(scope), index)
+
+
+def detect_duplicates(scope: str, ids: List[str], documents: List[str], metadatas: List[dict],
+                      replaced_ids=(), label: str = "class") -> List[bool]:
+    """
+    Check new chunks against the corpus (and each other) and update its index.
+    Duplicates get metadatas[i]["dup_group"], every other chunk NO_DUP_GROUP. `replaced_ids` are chunks about
+    to be overwritten by this upload (a re-uploaded file), which are not
+    matched against. Returns which chunks to store: all of them unless
+    DEDUP_MODE is skip.
+    """
+    keep = [True] * len(ids)
+    for metadata in metadatas:
+        metadata["dup_group"] = NO_DUP_GROUP
+    if DEDUP_MODE not in ("mark", "skip"):
+        return keep
+
+    with _locked(scope):
+        index = _cached_index(scope)
+        index.remove(set(replaced_ids) | set(ids))
+        for i, (chunk_id, text) in enumerate(zip(ids, documents)):
+            sig = signature(text)
+            if sig is None:
+                continue
+            match = index.find(sig)
+            if match is None:
+                index.add(chunk_id, sig, chunk_id)
+                continue
+            metadatas[i]["dup_group"] = match[1]
+            if DEDUP_MODE == "skip":
+                keep[i] = False
+                DUPLICATE_CHUNKS.inc(scope=label, action="skipped")
+            else:
+                index.add(chunk_id, sig, match[1])
+                DUPLICATE_CHUNKS.inc(scope=label, action="marked")
+        save_index(scope, index)
+    return keep
+
+
+def forget_chunks(scope: str, chunk_ids):
+    """Drop deleted chunks from a corpus index"""
+    if not chunk_ids or not os.path.exists(_path(scope)):
+        return
+    with _locked(scope):
+        index = _cached_index(scope)
+        before = len(index)
+        index.remove(chunk_ids)
+        if len(index) != before:
+            save_index(scope, index)
+
+
+def discard_index(scope: str):
+    with _locked(scope):
+        _cache.pop(scope, None)
+        try:
+            os.remove(_path(scope))
+        except OSError:
+            pass
+
+
+def collapse_duplicates(results: dict, n_results: int) -> dict:
+    """Keep the best-ranked chunk of each dup_group in a Chroma-shaped result, up to n_results"""
+    if not results.get("ids") or not results["ids"][0]:
+        return results
+    seen = set()
+    rows = []
+    for row, (chunk_id, metadata) in enumerate(zip(results["ids"][0], results["metadatas"][0])):
+        group = (metadata or {}).get("dup_group") or chunk_id
+        if group in seen:
+            continue
+        seen.add(group)
+        rows.append(row)
+        if len(rows) == n_results:
+            break
+    return {
+        key: [[values[0][row] for row in rows]]
+        for key, values in results.items()
+        if isinstance(values, list) and values and isinstance(values[0], list)
+    }
+
+
+def main(args):
+    if not args or args[0] != "stats":
+        print(__doc__)
+        return 1
+    scopes = args[1:]
+    if not scopes and os.path.isdir(DEDUP_DIR):
+        scopes = sorted(name[:-4] for name in os.listdir(DEDUP_DIR) if name.endswith(".npz"))
+    for scope in scopes:
+        index = load_index(scope)
+        duplicates = sum(size - 1 for size in index.group_sizes().values())
+        size = os.path.getsize(_path(scope)) if os.path.exists(_path(scope)) else 0
+        print(f"{scope}: {len(index)} chunks indexed, {duplicates} duplicates, {size / 1024:.1f} KiB on disk")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,296 @@
+import os
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Collections with at most this many chunks are searched exactly with NumPy
+# instead of through the HNSW graph. Set to 0 to always use HNSW.
+FLAT_INDEX_MAX_CHUNKS = int(os.environ.get("FLAT_INDEX_MAX_CHUNKS", "2000"))
+
+# Keep flat matrices in memory-mapped .npy files instead of process memory
+FLAT_INDEX_MMAP = os.environ.get("FLAT_INDEX_MMAP", "").lower() in ("1", "true", "yes")
+FLAT_INDEX_DIR = "./data/flat_index"
+
+# Searches limited to a few source files on collections too large for a flat
+# index (summary-routed class searches) read just those files' chunks and
+# keep the most recently used ones, up to this many chunks per process
+SOURCE_CACHE_MAX_CHUNKS = int(os.environ.get("SOURCE_CACHE_MAX_CHUNKS", "20000"))
+
+# Flat indexes are kept for the most recently searched collections, up to
+# this many chunks in total per process
+FLAT_CACHE_MAX_CHUNKS = int(os.environ.get("FLAT_CACHE_MAX_CHUNKS", "50000"))
+
+# Every write to a collection replaces its stamp here. Cached search
+# structures (the flat matrices and source chunks below, and quantized_index)
+# are keyed on it, so a write that leaves the chunk count unchanged (a
+# same-size re-upload) is noticed by this worker and every other one.
+WRITE_VERSION_DIR = "./data/write_versions"
+
+
+class FlatIndex:
+    """Exact nearest-neighbour search over one contiguous float32 matrix"""
+
+    def __init__(self, ids, embeddings, documents, metadatas, mmap_path=None, space: str = "l2"):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if space == "cosine":
+            # Normalise once so cosine distance is one minus a dot product
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1.0, norms)
+        if mmap_path:
+            matrix = _save_mapped(mmap_path, matrix)
+
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.matrix = matrix
+        self.space = space
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        self._rows_by_source = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _candidate_rows(self, where):
+        """Row numbers matching `where`, or None for every row"""
+        if not where:
+            return None
+        if set(where) == {"source"}:
+            # Filters on the source file (e.g. summary-routed searches) use a
+            # prebuilt grouping instead of testing every row's metadata
+            if self._rows_by_source is None:
+                groups = {}
+                for i, metadata in enumerate(self.metadatas):
+                    groups.setdefault((metadata or {}).get("source"), []).append(i)
+                self._rows_by_source = {source: np.array(rows, dtype=np.int64) for source, rows in groups.items()}
+            value = where["source"]
+            sources = value["$in"] if isinstance(value, dict) else [value]
+            groups = [self._rows_by_source[source] for source in sources if source in self._rows_by_source]
+            return np.sort(np.concatenate(groups)) if groups else np.empty(0, dtype=np.int64)
+        mask = np.fromiter((matches_where(m, where) for m in self.metadatas), dtype=bool, count=len(self))
+        return np.flatnonzero(mask)
+
+    def query(self, query_embedding, n_results: int, where=None) -> dict:
+        """Top-k using the collection's distance space, shaped like a Chroma query result"""
+        q = np.asarray(query_embedding, dtype=np.float32)
+        rows = self._candidate_rows(where)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if self.space == "l2":
+            sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+            distances = sq_norms - 2.0 * (matrix @ q) + float(q @ q)
+        elif self.space == "cosine":
+            norm = float(np.linalg.norm(q))
+            distances = 1.0 - matrix @ (q / norm if norm else q)
+        else:
+            distances = 1.0 - matrix @ q
+
+        k = min(n_results, len(distances))
+        if k <= 0:
+            top = np.empty(0, dtype=np.int64)
+        else:
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+        found = top if rows is None else rows[top]
+
+        return {
+            "ids": [[self.ids[i] for i in found]],
+            "documents": [[self.documents[i] for i in found]],
+            "metadatas": [[self.metadatas[i] for i in found]],
+            "distances": [[float(distances[i]) for i in top]],
+        }
+
+
+def _save_mapped(path: str, matrix):
+    """
+    Write the matrix to a new file, map it and move it to `path`. Other
+    workers may still be reading an index mapped from the old file, so it is
+    replaced, never truncated and rewritten in place.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        mapped = np.load(tmp_path, mmap_mode="r")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return mapped
+
+
+def supports_where(where) -> bool:
+    """The flat index handles equality and $in filters, optionally joined with $and"""
+    if not where:
+        return True
+    if set(where) == {"$and"}:
+        return all(supports_where(clause) for clause in where["$and"])
+    return all(
+        not key.startswith("$") and (not isinstance(value, dict) or set(value) == {"$in"})
+        for key, value in where.items()
+    )
+
+
+def matches_where(metadata, where) -> bool:
+    metadata = metadata or {}
+    if "$and" in where:
+        return all(matches_where(metadata, clause) for clause in where["$and"])
+    return all(
+        metadata.get(key) in value["$in"] if isinstance(value, dict) else metadata.get(key) == value
+        for key, value in where.items()
+    )
+
+
+def _write_version_path(collection_name: str) -> str:
+    return os.path.join(WRITE_VERSION_DIR, collection_name)
+
+
+def write_version(collection_name: str) -> str:
+    """The collection's current write stamp ("" if it was never written through bump_write_version)"""
+    try:
+        with open(_write_version_path(collection_name), "r") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def bump_write_version(collection_name: str):
+    """Record a write to the collection; call after every add/upsert/delete"""
+    os.makedirs(WRITE_VERSION_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=WRITE_VERSION_DIR, prefix=f".{collection_name}.", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp_path, _write_version_path(collection_name))
+    invalidate(collection_name)
+
+
+def _cache_key(collection) -> tuple:
+    # Read before the data, so a write landing in between makes the entry stale, never current
+    return (collection.id, write_version(collection.name), collection.count())
+
+
+# collection name -> ((collection id, write version, chunk count) when loaded, FlatIndex)
+_indexes = OrderedDict()
+_index_chunk_total = 0
+_lock = threading.Lock()
+
+
+def get_flat_index(collection):
+    """
+    Return an exact index for a small collection, or None when it is empty or
+    above FLAT_INDEX_MAX_CHUNKS. The cached matrix is reloaded after any
+    write to the collection (see bump_write_version), in this worker or
+    another, and whenever a rebuild swaps in a new collection.
+    """
+    global _index_chunk_total
+    key = _cache_key(collection)
+    count = key[2]
+    if count == 0 or count > FLAT_INDEX_MAX_CHUNKS:
+        invalidate(collection.name)
+        return None
+
+    with _lock:
+        cached = _indexes.get(collection.name)
+        if cached and cached[0] == key:
+            _indexes.move_to_end(collection.name)
+            return cached[1]
+
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    mmap_path = None
+    if FLAT_INDEX_MMAP:
+        os.makedirs(FLAT_INDEX_DIR, exist_ok=True)
+        mmap_path = os.path.join(FLAT_INDEX_DIR, f"{collection.name}.npy")
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    index = FlatIndex(data["ids"], data["embeddings"], data["documents"], data["metadatas"], mmap_path, space)
+
+    with _lock:
+        previous = _indexes.pop(collection.name, None)
+        if previous:
+            _index_chunk_total -= len(previous[1])
+        _indexes[collection.name] = (key, index)
+        _index_chunk_total += len(index)
+        while _index_chunk_total > FLAT_CACHE_MAX_CHUNKS and len(_indexes) > 1:
+            _, evicted = _indexes.popitem(last=False)
+            _index_chunk_total -= len(evicted[1])
+    return index
+
+
+def invalidate(collection_name: str):
+    """Drop this process's cached matrix and source chunks for a collection"""
+    global _source_chunk_total, _index_chunk_total
+    with _lock:
+        previous = _indexes.pop(collection_name, None)
+        if previous:
+            _index_chunk_total -= len(previous[1])
+        for cache_key in [k for k in _source_chunks if k[0] == collection_name]:
+            _source_chunk_total -= len(_source_chunks.pop(cache_key)[1])
+
+
+def source_filter(where):
+    """The source filenames of a plain {"source": ...} filter, or None for any other filter"""
+    if not where or set(where) != {"source"}:
+        return None
+    value = where["source"]
+    if isinstance(value, dict):
+        return list(value["$in"]) if set(value) == {"$in"} else None
+    return [value]
+
+
+# (collection name, source) -> ((collection id, write version, chunk count) when loaded, ids, embeddings, documents, metadatas)
+_source_chunks = OrderedDict()
+_source_chunk_total = 0
+
+
+def query_sources(collection, query_embedding, sources, n_results: int) -> dict:
+    """
+    Exact top-k over the chunks of `sources` only. Chunks are read with one
+    collection.get() for the files not already cached; any write to the
+    collection (see bump_write_version) makes its cached files stale.
+    """
+    global _source_chunk_total
+    key = _cache_key(collection)
+    found, missing = {}, []
+    with _lock:
+        for source in sources:
+            cached = _source_chunks.get((collection.name, source))
+            if cached and cached[0] == key:
+                _source_chunks.move_to_end((collection.name, source))
+                found[source] = cached
+            else:
+                missing.append(source)
+
+    if missing:
+        data = collection.get(where={"source": {"$in": missing}}, include=["embeddings", "documents", "metadatas"])
+        grouped = {source: ([], [], [], []) for source in missing}
+        for row in zip(data["ids"], data["embeddings"], data["documents"], data["metadatas"]):
+            group = grouped.get((row[3] or {}).get("source"))
+            if group is not None:
+                for column, value in zip(group, row):
+                    column.append(value)
+        with _lock:
+            for source, (ids, embeddings, documents, metadatas) in grouped.items():
+                entry = (key, ids, embeddings, documents, metadatas)
+                previous = _source_chunks.pop((collection.name, source), None)
+                if previous:
+                    _source_chunk_total -= len(previous[1])
+                _source_chunks[(collection.name, source)] = entry
+                _source_chunk_total += len(ids)
+                found[source] = entry
+            while _source_chunk_total > SOURCE_CACHE_MAX_CHUNKS and len(_source_chunks) > 1:
+                _, evicted = _source_chunks.popitem(last=False)
+                _source_chunk_total -= len(evicted[1])
+
+    ids, embeddings, documents, metadatas = [], [], [], []
+    for source in sources:
+        entry = found.get(source)
+        if entry:
+            ids.extend(entry[1])
+            embeddings.extend(entry[2])
+            documents.extend(entry[3])
+            metadatas.extend(entry[4])
+    if not ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    return FlatIndex(ids, embeddings, documents, metadatas, space=space).query(query_embedding, n_results)
@@ -0,0 +1,38 @@
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py
+
+The master imports the app and the heavy libraries once (preload_app), and
+workers fork from it, so a worker boots in milliseconds instead of
+re-importing chromadb and anthropic. The vector store, embedding model and
+Anthropic client are opened lazily inside each worker after the fork, never
+in the master.
+"""
+import os
+import multiprocessing
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# Requests mostly wait on the LLM, so a few processes with many threads each
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = True
+
+
+def on_starting(server):
+    # Runs in the master before the app is loaded
+    import app
+    app.preload()
+
+
+def post_fork(server, worker):
+    # Background jobs (maintenance, tiering) run per worker, never in the master
+    import app
+    app.init_worker()
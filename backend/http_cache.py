@@ -0,0 +1,152 @@
+"""
+Conditional GET, pagination, field selection and compression for listing
+endpoints.
+
+Listing ETags are derived from the versions (mtime, size, inode) of the JSON
+stores a response is built from, plus the caller and the query string, so an
+unchanged poll is answered 304 from a few stat() calls without parsing any
+JSON. Pagination and field selection are opt-in (`?limit=`, `?cursor=`,
+`?fields=`); without them responses keep their existing shape.
+"""
+import os
+import gzip
+import base64
+import hashlib
+from typing import List, Optional, Tuple
+from flask import request, jsonify, Response
+
+MAX_PAGE_SIZE = 500
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/csv")
+
+
+def store_version(*paths) -> Tuple:
+    """Cheap fingerprint of the files a response depends on"""
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((path, st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            version.append((path, None))
+    return tuple(version)
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag for a response built from `parts` and the current query string"""
+    digest = hashlib.sha1(repr((request.path, sorted(request.args.items(multi=True)), parts)).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """A 304 response if the client already has `etag`, otherwise None"""
+    if not request.if_none_match:
+        return None
+    tag = etag.strip('"')
+    # The compressed representation carries a suffixed tag (see compress_response)
+    if request.if_none_match.contains(tag) or request.if_none_match.contains(tag + "-gzip"):
+        response = Response(status=304)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return None
+
+
+def with_etag(response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+
+
+def page_args() -> Tuple[Optional[int], Optional[str], Optional[List[str]], Optional[str]]:
+    """
+    Parse ?limit=, ?cursor= and ?fields= from the request.
+    Returns (limit, cursor_key, fields, error)
+    """
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
+    try:
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError
+            limit = min(limit, MAX_PAGE_SIZE)
+        if cursor:
+            cursor = _decode_cursor(cursor)
+    except (ValueError, UnicodeDecodeError):
+        return None, None, None, "Invalid limit or cursor"
+    if fields is not None:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    return limit, cursor or None, fields, None
+
+
+def paginate(items: List[dict], key: str, limit: Optional[int], cursor: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+    """
+    Keyset pagination: items sorted by `key`, starting after the cursor's key.
+    Without limit or cursor the list is returned unchanged (and unsorted).
+    Returns (page, next_cursor)
+    """
+    if limit is None and cursor is None:
+        return items, None
+    ordered = sorted(items, key=lambda item: item[key])
+    if cursor is not None:
+        ordered = [item for item in ordered if item[key] > cursor]
+    if limit is None or len(ordered) <= limit:
+        return ordered, None
+    page = ordered[:limit]
+    return page, _encode_cursor(page[-1][key])
+
+
+def select_fields(items: List[dict], fields: Optional[List[str]], always=()) -> List[dict]:
+    """Keep only the requested fields (plus `always`, e.g. the pagination key)"""
+    if not fields:
+        return items
+    keep = set(fields) | set(always)
+    return [{k: v for k, v in item.items() if k in keep} for item in items]
+
+
+def listing_response(name: str, items: List[dict], key: str, etag: str):
+    """Paginate, project and return `{name: [...], "next_cursor": ...}` with its ETag"""
+    limit, cursor, fields, error = page_args()
+    if error:
+        return jsonify({"error": error}), 400
+    page, next_cursor = paginate(items, key, limit, cursor)
+    body = {name: select_fields(page, fields, always=(key,))}
+    if limit is not None or cursor is not None:
+        body["next_cursor"] = next_cursor
+    return with_etag(jsonify(body), etag)
+
+
+def compress_response(response):
+    """after_request hook: gzip sizeable JSON/text responses for clients that accept it"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "gzip" not in request.headers.get("Accept-Encoding", "").lower()
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    etag = response.headers.get("ETag")
+    if etag and etag.startswith('"'):
+        # A strong ETag identifies exact bytes, so the gzip variant needs its own
+        response.headers["ETag"] = etag[:-1] + '-gzip"'
+    return response
@@ -0,0 +1,240 @@
+"""
+Per-collection HNSW index configuration, plus the optional int8 compressed
+search path (see quantized_index.py).
+
+Settings are kept in ./data/index_config.json keyed by collection name, with
+an optional "default" entry for newly created collections. Chroma only reads
+HNSW settings when a collection is created, so changing them on an existing
+collection means rebuilding it:
+
+    python index_config.py show course_materials_<class_id>
+    python index_config.py set course_materials_<class_id> --M 32 --search-ef 64
+    python index_config.py set course_materials_<class_id> --quantization int8 --rescore-factor 4
+"""
+import os
+import json
+import argparse
+from typing import Dict, Optional, Tuple
+from flat_index import write_version, bump_write_version
+from tiering import (
+    LOCK_WAIT_SECONDS, ensure_resident, acquire_collection_lock, refresh_collection_lock, release_collection_lock,
+)
+
+INDEX_CONFIG_FILE = "./data/index_config.json"
+
+SPACES = ("l2", "cosine", "ip")
+QUANTIZATIONS = ("none", "int8")
+HNSW_PARAMS = ("space", "M", "construction_ef", "search_ef")
+# Settings for the compressed search path in quantized_index.py. These do not
+# touch the Chroma collection, so changing them never needs a rebuild.
+QUANTIZATION_PARAMS = ("quantization", "rescore_factor")
+PARAMS = HNSW_PARAMS + QUANTIZATION_PARAMS
+
+# Used when nothing is configured; the HNSW values are Chroma's own defaults
+DEFAULT_INDEX_CONFIG = {
+    "space": "l2", "M": 16, "construction_ef": 100, "search_ef": 10,
+    "quantization": "none", "rescore_factor": 4,
+}
+
+
+def ensure_index_config_file():
+    os.makedirs("./data", exist_ok=True)
+    if not os.path.exists(INDEX_CONFIG_FILE):
+        with open(INDEX_CONFIG_FILE, "w") as f:
+            json.dump({}, f)
+
+
+def load_index_configs() -> Dict:
+    ensure_index_config_file()
+    with open(INDEX_CONFIG_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_index_configs(configs: Dict):
+    with open(INDEX_CONFIG_FILE, "w") as f:
+        json.dump(configs, f, indent=2)
+
+
+def get_index_config(collection_name: str) -> Dict:
+    """Configured settings for a collection, falling back to the default entry"""
+    configs = load_index_configs()
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update(configs.get("default", {}))
+    config.update(configs.get(collection_name, {}))
+    return config
+
+
+def validate_index_config(config: Dict) -> Optional[str]:
+    """Return an error message, or None if the settings are usable"""
+    unknown = set(config) - set(PARAMS)
+    if unknown:
+        return f"Unknown index settings: {', '.join(sorted(unknown))}"
+    if "space" in config and config["space"] not in SPACES:
+        return f"space must be one of {', '.join(SPACES)}"
+    if "quantization" in config and config["quantization"] not in QUANTIZATIONS:
+        return f"quantization must be one of {', '.join(QUANTIZATIONS)}"
+    for key in ("M", "construction_ef", "search_ef", "rescore_factor"):
+        if key in config and (not isinstance(config[key], int) or config[key] < 1):
+            return f"{key} must be a positive integer"
+    return None
+
+
+def set_index_config(collection_name: str, **settings) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Store settings for a collection (or "default").
+    Returns (effective_config, error)
+    """
+    settings = {k: v for k, v in settings.items() if v is not None}
+    error = validate_index_config(settings)
+    if error:
+        return None, error
+
+    configs = load_index_configs()
+    configs.setdefault(collection_name, {}).update(settings)
+    save_index_configs(configs)
+    return get_index_config(collection_name), None
+
+
+def collection_metadata(collection_name: str) -> Dict:
+    """Chroma collection metadata carrying the HNSW settings"""
+    config = get_index_config(collection_name)
+    return {f"hnsw:{key}": config[key] for key in HNSW_PARAMS}
+
+
+def _copy_collection(source, target, batch_size: int, on_batch=None) -> set:
+    """Upsert every chunk of source into target. Returns the ids copied."""
+    copied = set()
+    offset = 0
+    while True:
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not batch["ids"]:
+            break
+        target.upsert(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"],
+            embeddings=batch["embeddings"],
+        )
+        copied.update(batch["ids"])
+        offset += len(batch["ids"])
+        if on_batch:
+            on_batch()
+    return copied
+
+
+def rebuild_collection(client, collection_name: str, batch_size: int = 1000) -> Tuple[int, Optional[str]]:
+    """
+    Rebuild a collection with its configured HNSW settings.
+
+    Stored embeddings are copied into a new collection in batches, the copy is
+    checked against the original, and only then are the two swapped by name.
+    The collection's tiering lock is held throughout, so it is not archived,
+    rehydrated or cleaned up by maintenance mid-swap. Writes that reach the
+    original while it is being copied are copied again after the swap.
+    If anything fails before the swap, the original is left untouched.
+    Returns (chunks_copied, error)
+    """
+    # Archived collections are rebuilt from their snapshot first
+    ensure_resident(client, collection_name)
+    if not acquire_collection_lock(collection_name, wait=LOCK_WAIT_SECONDS):
+        return 0, "Collection is being moved by another process"
+    try:
+        return _rebuild_locked(client, collection_name, batch_size)
+    finally:
+        release_collection_lock(collection_name)
+
+
+def _rebuild_locked(client, collection_name: str, batch_size: int) -> Tuple[int, Optional[str]]:
+    try:
+        source = client.get_collection(collection_name)
+    except Exception:
+        return 0, "Collection not found"
+
+    staging_name = f"{collection_name}__rebuild"
+    retired_name = f"{collection_name}__retired"
+    for leftover in (staging_name, retired_name):
+        try:
+            client.delete_collection(leftover)
+        except Exception:
+            pass
+
+    def keep_lock():
+        refresh_collection_lock(collection_name)
+
+    # Read before copying, so any write landing during the copy changes it
+    version = write_version(collection_name)
+    staging = client.create_collection(staging_name, metadata=collection_metadata(collection_name))
+    try:
+        copied = len(_copy_collection(source, staging, batch_size, keep_lock))
+        if staging.count() != source.count():
+            raise RuntimeError("chunk count changed during rebuild, retry when uploads are idle")
+    except Exception as e:
+        client.delete_collection(staging_name)
+        return 0, str(e)
+
+    source.modify(name=retired_name)
+    try:
+        staging.modify(name=collection_name)
+    except Exception:
+        # A worker recreated the live name between the two renames. Keep the
+        # one it is now writing to and fold the original's chunks into it.
+        live = client.get_collection(collection_name)
+        _copy_collection(source, live, batch_size, keep_lock)
+        client.delete_collection(staging_name)
+        client.delete_collection(retired_name)
+        bump_write_version(collection_name)
+        return 0, "Collection was recreated during the swap; rebuild again to apply the settings"
+
+    if write_version(collection_name) != version:
+        # Uploads or deletes reached the original while it was copied
+        current = _copy_collection(source, staging, batch_size, keep_lock)
+        removed = list(set(staging.get(include=[])["ids"]) - current)
+        if removed:
+            staging.delete(ids=removed)
+        copied = len(current)
+
+    client.delete_collection(retired_name)
+    bump_write_version(collection_name)
+    return copied, None
+
+
+if __name__ == "__main__":
+    from vectorstore import get_chroma_client
+
+    parser = argparse.ArgumentParser(description="Show or change a collection's HNSW settings")
+    parser.add_argument("action", choices=["show", "set"])
+    parser.add_argument("collection", help='collection name, or "default" for new collections')
+    parser.add_argument("--space", choices=SPACES)
+    parser.add_argument("--M", type=int)
+    parser.add_argument("--construction-ef", type=int)
+    parser.add_argument("--search-ef", type=int)
+    parser.add_argument("--quantization", choices=QUANTIZATIONS)
+    parser.add_argument("--rescore-factor", type=int)
+    parser.add_argument("--no-rebuild", action="store_true", help="only record the settings")
+    args = parser.parse_args()
+
+    if args.action == "show":
+        print(json.dumps(get_index_config(args.collection), indent=2))
+    else:
+        config, error = set_index_config(
+            args.collection,
+            space=args.space,
+            M=args.M,
+            construction_ef=args.construction_ef,
+            search_ef=args.search_ef,
+            quantization=args.quantization,
+            rescore_factor=args.rescore_factor,
+        )
+        if error:
+            raise SystemExit(error)
+        print(json.dumps(config, indent=2))
+        hnsw_changed = any(v is not None for v in (args.space, args.M, args.construction_ef, args.search_ef))
+        if args.collection != "default" and hnsw_changed and not args.no_rebuild:
+            copied, error = rebuild_collection(get_chroma_client(), args.collection)
+            if error:
+                raise SystemExit(f"Rebuild failed: {error}")
+            print(f"Rebuilt {args.collection} ({copied} chunks)")
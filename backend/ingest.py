@@ -1,54 +1,87 @@
-import os
 import io
-from typing import List
-import chromadb
-from chromadb.config import Settings
-from pypdf import PdfReader
-from user_storage import add_file_for_user, add_file_for_class
+import math
+import codecs
+from typing import List, Tuple
+from user_storage import add_file_for_user, add_file_for_class, get_user_file_chunk_ids, get_class_file_chunk_ids
 from classes_storage import is_teacher_for_class
-import anthropic
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Ensure data directory exists
-os.makedirs("./data/vectorstore", exist_ok=True)
-
-# Initialize ChromaDB with proper settings for 0.5.x
-chroma_client = chromadb.PersistentClient(
-    path="./data/vectorstore",
-    settings=Settings(anonymized_telemetry=False)
+from vectorstore import (
+    get_legacy_collection, get_user_collection, find_user_collection, get_class_collection, refresh_search_indexes,
+    delete_legacy_user_file,
 )
+from flat_index import bump_write_version
+from metrics import span, record_llm_usage, UPLOAD_BYTES, UPLOAD_CHUNKS, NORMALIZE_REMOVED_CHARS, NORMALIZE_SAVED_CHUNKS
+from normalize import normalize_pages
+from dedup import detect_duplicates, user_scope, class_scope
+from top_questions import materials_changed
+from llm import create_message, BACKGROUND
 
-# Initialize Anthropic client for summaries
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-collection = chroma_client.get_or_create_collection("course_materials")
+SUMMARY_MODEL = "claude-3-5-haiku-20241022"
 
 
 def get_collection():
-    """Return the ChromaDB collection for external use"""
-    return collection
-
-
-def extract_text_from_pdf(file_storage) -> str:
-    # file_storage is Werkzeug FileStorage
-    file_bytes = file_storage.read()
-    pdf = PdfReader(io.BytesIO(file_bytes))
+    """Return the legacy shared ChromaDB collection for external use"""
+    return get_legacy_collection()
+
+
+def extract_pages_from_pdf(file_storage) -> List[str]:
+    # file_storage is Werkzeug FileStorage (or an uploads.SpooledUpload). A
+    # seekable stream is read in place rather than copied into memory
+    from pypdf import PdfReader
+    stream = getattr(file_storage, "stream", None)
+    if stream is None or not stream.seekable():
+        stream = io.BytesIO(file_storage.read())
+    pdf = PdfReader(stream)
     pages = []
     for page in pdf.pages:
         text = page.extract_text()
         if text:
             pages.append(text)
-    return "\n".join(pages)
+    return pages
+
+
+def extract_text_from_pdf(file_storage) -> str:
+    return "\n".join(extract_pages_from_pdf(file_storage))
 
 
 def extract_text_from_plain(file_storage) -> str:
-    file_bytes = file_storage.read()
+    # Decoded block by block so the raw bytes and the text are not both held
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
     try:
-        return file_bytes.decode("utf-8", errors="ignore")
+        for block in iter(lambda: file_storage.read(1024 * 1024), b""):
+            parts.append(decoder.decode(block))
+        parts.append(decoder.decode(b"", final=True))
     except Exception:
         return ""
+    return "".join(parts)
+
+
+def upload_size(file_storage) -> int:
+    try:
+        position = file_storage.tell()
+        size = file_storage.seek(0, io.SEEK_END)
+        file_storage.seek(position)
+        return size
+    except Exception:
+        return 0
+
+
+def extract_text(file_storage, scope: str) -> Tuple[str, dict]:
+    """
+    Extract text from an uploaded PDF or plain-text file and strip repeated
+    headers/footers (see normalize.py). Returns (text, normalization stats)
+    """
+    filename = file_storage.filename or "unknown"
+    size = upload_size(file_storage)
+    with span("extract"):
+        if filename.lower().endswith(".pdf"):
+            pages = extract_pages_from_pdf(file_storage)
+        else:
+            # Form feeds, where present, separate pages
+            pages = extract_text_from_plain(file_storage).split("\f")
+    UPLOAD_BYTES.inc(size, scope=scope)
+    with span("normalize"):
+        return normalize_pages(pages)
 
 
 def chunk_text(text: str, size: int = 800, overlap: int = 100) -> List[str]:
@@ -63,43 +96,85 @@ def chunk_text(text: str, size: int = 800, overlap: int = 100) -> List[str]:
     return chunks
 
 
+def count_chunks(length: int, size: int = 800, overlap: int = 100) -> int:
+    """How many chunks chunk_text() makes from `length` characters"""
+    return math.ceil(length / (size - overlap)) if length > 0 else 0
+
+
+def chunk_document(filename: str, text: str, stats: dict, scope: str) -> List[str]:
+    """Chunk normalized text and complete its stats with what normalization saved"""
+    with span("chunk"):
+        chunks = chunk_text(text)
+    removed = max(0, stats["chars_before"] - stats["chars_after"])
+    saved = max(0, count_chunks(stats["chars_before"]) - len(chunks))
+    stats.update(filename=filename, chunks=len(chunks), chunks_saved=saved, chars_removed=removed)
+    NORMALIZE_REMOVED_CHARS.inc(removed, scope=scope)
+    NORMALIZE_SAVED_CHUNKS.inc(saved, scope=scope)
+    return chunks
+
+
 def generate_summary(text: str, filename: str) -> str:
     """Generate a concise summary of the document using Claude"""
     try:
         # Limit text to first 15000 characters to stay within token limits
         text_sample = text[:15000] if len(text) > 15000 else text
         
-        message = anthropic_client.messages.create(
-            model="claude-3-5-haiku-20241022",
-            max_tokens=300,
-            messages=[{
-                "role": "user",
-                "content": f"Please provide a concise 2-3 sentence summary of this educational material titled '{filename}':\n\n{text_sample}"
-            }]
-        )
+        with span("summary"):
+            message = create_message(
+                priority=BACKGROUND,
+                model=SUMMARY_MODEL,
+                max_tokens=300,
+                messages=[{
+                    "role": "user",
+                    "content": f"Please provide a concise 2-3 sentence summary of this educational material titled '{filename}':\n\n{text_sample}"
+                }]
+            )
+        record_llm_usage(message, SUMMARY_MODEL, "summary")
         return message.content[0].text
     except Exception as e:
         print(f"Error generating summary: {e}")
         return "Summary not available"
 
 
+def count_duplicates(report, metadatas):
+    """Add each file's near-duplicate chunk count to its upload report"""
+    counts = {}
+    for metadata in metadatas:
+        if metadata.get("dup_group"):
+            counts[metadata["source"]] = counts.get(metadata["source"], 0) + 1
+    for stats in report:
+        stats["duplicate_chunks"] = counts.get(stats["filename"], 0)
+
+
+def drop_skipped(keep, docs, ids, metadatas, file_chunk_map):
+    """Leave out chunks detect_duplicates() decided not to store"""
+    if all(keep):
+        return docs, ids, metadatas, file_chunk_map
+    skipped = {chunk_id for chunk_id, kept in zip(ids, keep) if not kept}
+    rows = [i for i, kept in enumerate(keep) if kept]
+    file_chunk_map = {
+        filename: ([cid for cid in chunk_ids if cid not in skipped], text)
+        for filename, (chunk_ids, text) in file_chunk_map.items()
+    }
+    return [docs[i] for i in rows], [ids[i] for i in rows], [metadatas[i] for i in rows], file_chunk_map
+
+
 def ingest_documents(files):
     docs = []
     ids = []
     metadatas = []
+    report = []  # per-file normalization stats
 
     for f in files:
         filename = f.filename or "unknown"
 
-        if filename.lower().endswith(".pdf"):
-            text = extract_text_from_pdf(f)
-        else:
-            text = extract_text_from_plain(f)
+        text, stats = extract_text(f, scope="legacy")
 
         if not text.strip():
             continue
 
-        chunks = chunk_text(text)
+        chunks = chunk_document(filename, text, stats, scope="legacy")
+        report.append(stats)
 
         for i, chunk in enumerate(chunks):
             docs.append(chunk)
@@ -107,12 +182,17 @@ def ingest_documents(files):
             metadatas.append({"source": filename})
 
     if docs:
-        collection.add(
-            documents=docs,
-            ids=ids,
-            metadatas=metadatas,
-        )
+        with span("vector_write"):
+            legacy_collection = get_legacy_collection()
+            legacy_collection.add(
+                documents=docs,
+                ids=ids,
+                metadatas=metadatas,
+            )
+        bump_write_version(legacy_collection.name)
+        UPLOAD_CHUNKS.inc(len(docs), scope="legacy")
         # PersistentClient auto-persists, no need to call persist()
+    return report
 
 
 def ingest_documents_for_user(user_email: str, files):
@@ -120,20 +200,19 @@ def ingest_documents_for_user(user_email: str, files):
     docs = []
     ids = []
     metadatas = []
+    report = []  # per-file normalization stats
     file_chunk_map = {}  # filename -> (list of chunk ids, full text)
 
     for f in files:
         filename = f.filename or "unknown"
         
-        if filename.lower().endswith(".pdf"):
-            text = extract_text_from_pdf(f)
-        else:
-            text = extract_text_from_plain(f)
+        text, stats = extract_text(f, scope="user")
 
         if not text.strip():
             continue
 
-        chunks = chunk_text(text)
+        chunks = chunk_document(filename, text, stats, scope="user")
+        report.append(stats)
         chunk_ids = []
 
         for i, chunk in enumerate(chunks):
@@ -150,22 +229,39 @@ def ingest_documents_for_user(user_email: str, files):
             file_chunk_map[filename] = (chunk_ids, text)
 
     if docs:
-        collection.add(
-            documents=docs,
-            ids=ids,
-            metadatas=metadatas,
-        )
-        
+        replaced = [cid for filename in file_chunk_map for cid in get_user_file_chunk_ids(user_email, filename)]
+        with span("dedup"):
+            keep = detect_duplicates(user_scope(user_email), ids, docs, metadatas, replaced, label="user")
+        count_duplicates(report, metadatas)
+        docs, ids, metadatas, file_chunk_map = drop_skipped(keep, docs, ids, metadatas, file_chunk_map)
+
+    # Personal uploads live in the user's shard, not the shared collection
+    user_collection = get_user_collection(user_email) if file_chunk_map else None
+    if docs:
+        with span("vector_write"):
+            user_collection.upsert(
+                documents=docs,
+                ids=ids,
+                metadatas=metadatas,
+            )
+        bump_write_version(user_collection.name)
+        UPLOAD_CHUNKS.inc(len(docs), scope="user")
+
+    if file_chunk_map:
         # Track files for this user with summaries
         for filename, (chunk_ids, full_text) in file_chunk_map.items():
+            # A re-upload that produced fewer chunks leaves the tail behind
+            stale_ids = set(get_user_file_chunk_ids(user_email, filename)) - set(chunk_ids)
+            if stale_ids:
+                user_collection.delete(ids=list(stale_ids))
+                bump_write_version(user_collection.name)
+            # The old version may still be in the shared collection if the user was not migrated
+            delete_legacy_user_file(user_email, filename)
             summary = generate_summary(full_text, filename)
             add_file_for_user(user_email, filename, chunk_ids, summary)
 
-
-def get_class_collection(class_id: str):
-    """Get or create a class-specific ChromaDB collection"""
-    collection_name = f"course_materials_{class_id}"
-    return chroma_client.get_or_create_collection(collection_name)
+        refresh_search_indexes(user_collection)
+    return report
 
 
 def ingest_documents_for_class(teacher_email: str, class_id: str, files):
@@ -183,20 +279,19 @@ def ingest_documents_for_class(teacher_email: str, class_id: str, files):
     docs = []
     ids = []
     metadatas = []
+    report = []  # per-file normalization stats
     file_chunk_map = {}  # filename -> (list of chunk ids, full text for summary)
 
     for f in files:
         filename = f.filename or "unknown"
         
-        if filename.lower().endswith(".pdf"):
-            text = extract_text_from_pdf(f)
-        else:
-            text = extract_text_from_plain(f)
+        text, stats = extract_text(f, scope="class")
 
         if not text.strip():
             continue
 
-        chunks = chunk_text(text)
+        chunks = chunk_document(filename, text, stats, scope="class")
+        report.append(stats)
         chunk_ids = []
 
         for i, chunk in enumerate(chunks):
@@ -214,17 +309,37 @@ def ingest_documents_for_class(teacher_email: str, class_id: str, files):
             file_chunk_map[filename] = (chunk_ids, text)
 
     if docs:
-        class_collection.add(
-            documents=docs,
-            ids=ids,
-            metadatas=metadatas,
-        )
-        
+        replaced = [cid for filename in file_chunk_map for cid in get_class_file_chunk_ids(class_id, filename)]
+        with span("dedup"):
+            keep = detect_duplicates(class_scope(class_id), ids, docs, metadatas, replaced, label="class")
+        count_duplicates(report, metadatas)
+        docs, ids, metadatas, file_chunk_map = drop_skipped(keep, docs, ids, metadatas, file_chunk_map)
+
+    if docs:
+        with span("vector_write"):
+            class_collection.upsert(
+                documents=docs,
+                ids=ids,
+                metadatas=metadatas,
+            )
+        bump_write_version(class_collection.name)
+        UPLOAD_CHUNKS.inc(len(docs), scope="class")
+
+    if file_chunk_map:
         # Track files for this class with summaries
         for filename, (chunk_ids, full_text) in file_chunk_map.items():
+            # A re-upload that produced fewer chunks leaves the tail behind
+            stale_ids = set(get_class_file_chunk_ids(class_id, filename)) - set(chunk_ids)
+            if stale_ids:
+                class_collection.delete(ids=list(stale_ids))
+                bump_write_version(class_collection.name)
             summary = generate_summary(full_text, filename)
             add_file_for_class(class_id, filename, chunk_ids, teacher_email, summary)
 
+        refresh_search_indexes(class_collection)
+        materials_changed(class_id)
+    return report
+
 
 def get_material_text_from_collection(class_id: str, filename: str) -> str:
     """Retrieve the full text of a material from its chunks"""
@@ -260,10 +375,15 @@ def regenerate_material_summary(class_id: str, filename: str) -> str:
 def get_user_file_text_from_collection(user_email: str, filename: str) -> str:
     """Retrieve the full text of a user file from its chunks"""
     try:
-        # Get all chunks for this file
-        results = collection.get(
-            where={"$and": [{"source": filename}, {"user": user_email}]}
-        )
+        # Get all chunks for this file, falling back to the shared
+        # collection for users that have not been migrated yet
+        where = {"$and": [{"source": filename}, {"user": user_email}]}
+        results = None
+        shard = find_user_collection(user_email)
+        if shard is not None:
+            results = shard.get(where=where)
+        if not results or not results['documents']:
+            results = get_legacy_collection().get(where=where)
         
         if not results or not results['documents']:
             return ""
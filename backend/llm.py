@@ -0,0 +1,219 @@
+"""
+Shared Anthropic client and admission control for every LLM call.
+
+The client is created on first use and re-created after a fork, so a
+gunicorn master that preloads the app never hands its HTTP connection pool
+to the workers. A missing ANTHROPIC_API_KEY is reported when the first LLM
+call is made rather than when the module is imported.
+
+create_message() runs each call through a gateway that caps concurrent
+calls (LLM_MAX_CONCURRENCY) and tokens per minute (LLM_TOKENS_PER_MINUTE,
+0 = unlimited). Callers that cannot start right away wait in a bounded
+queue (LLM_MAX_QUEUE), where interactive questions go ahead of background
+summaries. When the queue is full, or a caller has waited longer than its
+priority allows, LLMOverloaded is raised with a Retry-After estimate so the
+route can answer 429 instead of piling more load onto the API. A 429 from
+Anthropic itself is reported the same way.
+
+Limits apply per process; with several gunicorn workers, divide the
+account's budget between them.
+"""
+import os
+import math
+import time
+import heapq
+import itertools
+import threading
+from metrics import Gauge, Histogram, Counter
+
+MODEL = "claude-3-5-haiku-20241022"
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "64"))
+LLM_MAX_WAIT_SECONDS = float(os.environ.get("LLM_MAX_WAIT_SECONDS", "10"))
+LLM_BACKGROUND_MAX_WAIT_SECONDS = float(os.environ.get("LLM_BACKGROUND_MAX_WAIT_SECONDS", "120"))
+
+# Lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_client = None
+_client_pid = None
+
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing ANTHROPIC_API_KEY environment variable.")
+        from anthropic import Anthropic
+        _client = Anthropic(api_key=api_key)
+        _client_pid = os.getpid()
+    return _client
+
+
+class LLMOverloaded(Exception):
+    """The LLM budget is exhausted; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int, tokens_per_minute: int, max_queue: int, max_wait: dict):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queue = []  # heap of [priority, seq]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._service_seconds = 2.0  # moving average of call duration, for Retry-After
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _refill(self):
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0,
+        )
+        self._refilled_at = now
+
+    def _token_wait(self, tokens: int) -> float:
+        """Seconds until `tokens` fit in the budget (0 if they fit now)"""
+        if self.tokens_per_minute <= 0:
+            return 0.0
+        # A single call larger than the whole budget waits for a full bucket
+        needed = min(tokens, self.tokens_per_minute) - self._tokens
+        return max(0.0, needed * 60.0 / self.tokens_per_minute)
+
+    def _retry_after(self, tokens: int) -> int:
+        backlog = (len(self._queue) + self.in_flight) * self._service_seconds / self.max_concurrency
+        return max(1, math.ceil(max(backlog, self._token_wait(tokens))))
+
+    def acquire(self, priority: int, tokens: int) -> float:
+        """Wait for a slot and `tokens` of budget. Returns seconds spent waiting."""
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority, LLM_MAX_WAIT_SECONDS)
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        with self._cond:
+            self._refill()
+            if not self._queue and self.in_flight < self.max_concurrency and self._token_wait(tokens) == 0:
+                return self._admit(tokens, start)
+
+            if len(self._queue) >= self.max_queue:
+                LLM_REJECTIONS.inc(priority=name, reason="queue_full")
+                raise LLMOverloaded("The assistant is busy right now. Please try again shortly.", self._retry_after(tokens))
+
+            ticket = [priority, next(self._seq)]
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    self._refill()
+                    token_wait = self._token_wait(tokens)
+                    if self._queue[0] is ticket and self.in_flight < self.max_concurrency and token_wait == 0:
+                        heapq.heappop(self._queue)
+                        self._cond.notify_all()
+                        return self._admit(tokens, start)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        LLM_REJECTIONS.inc(priority=name, reason="timeout")
+                        raise LLMOverloaded("The assistant is busy right now. Please try again shortly.", self._retry_after(tokens))
+                    # Budget refills continuously, so wake up when it should suffice
+                    self._cond.wait(min(remaining, token_wait) if token_wait else remaining)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    def _admit(self, tokens: int, start: float) -> float:
+        self.in_flight += 1
+        if self.tokens_per_minute > 0:
+            self._tokens -= tokens
+        return time.monotonic() - start
+
+    def release(self, reserved: int, used: int = None, seconds: float = None):
+        """Free the slot and settle the token reservation against actual usage"""
+        with self._cond:
+            self.in_flight -= 1
+            if self.tokens_per_minute > 0 and used is not None:
+                self._tokens += reserved - used
+            if seconds is not None:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+            self._cond.notify_all()
+
+
+gateway = LLMGateway(
+    LLM_MAX_CONCURRENCY,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_QUEUE,
+    {INTERACTIVE: LLM_MAX_WAIT_SECONDS, BACKGROUND: LLM_BACKGROUND_MAX_WAIT_SECONDS},
+)
+
+LLM_QUEUE_DEPTH = Gauge("teachtwin_llm_queue_depth", "LLM calls waiting for admission", function=lambda: gateway.queue_depth)
+LLM_IN_FLIGHT = Gauge("teachtwin_llm_in_flight", "LLM calls currently running", function=lambda: gateway.in_flight)
+LLM_QUEUE_WAIT = Histogram("teachtwin_llm_queue_wait_seconds", "Time LLM calls waited for admission", ["priority"])
+LLM_REJECTIONS = Counter("teachtwin_llm_rejections_total", "LLM calls turned away with 429", ["priority", "reason"])
+
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters each); no tokenizer needed"""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def _estimate_tokens(kwargs) -> int:
+    """Prompt tokens plus the output allowance"""
+    chars = len(kwargs.get("system") or "")
+    for message in kwargs.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(block.get("text", "")) for block in content if isinstance(block, dict))
+    return chars // CHARS_PER_TOKEN + int(kwargs.get("max_tokens", 0))
+
+
+def create_message(priority: int = INTERACTIVE, **kwargs):
+    """client.messages.create(**kwargs), admitted through the gateway"""
+    reserved = _estimate_tokens(kwargs)
+    waited = gateway.acquire(priority, reserved)
+    LLM_QUEUE_WAIT.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+
+    used = None
+    start = time.monotonic()
+    try:
+        response = get_client().messages.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            used = (usage.input_tokens or 0) + (usage.output_tokens or 0)
+        return response
+    except Exception as e:
+        from anthropic import RateLimitError
+        if isinstance(e, RateLimitError):
+            LLM_REJECTIONS.inc(priority=PRIORITY_NAMES.get(priority, str(priority)), reason="upstream")
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            try:
+                retry_after = max(1, math.ceil(float(retry_after)))
+            except (TypeError, ValueError):
+                retry_after = gateway._retry_after(reserved)
+            raise LLMOverloaded("The assistant is busy right now. Please try again shortly.", retry_after) from e
+        raise
+    finally:
+        gateway.release(reserved, used, time.monotonic() - start)
@@ -0,0 +1,424 @@
+"""
+Vector-store maintenance.
+
+Reconciles files_index.json / class_files_index.json / classes.json against
+the Chroma collections, deletes orphan chunks and collections of deleted
+classes, removes segment directories nothing references any more, and
+reports how many bytes that reclaimed. Abandoned resumable-upload spools
+(see uploads.py) are removed too.
+
+Run it by hand (from the backend directory):
+    python maintenance.py [--dry-run] [--rebuild] [--vacuum]
+
+or set MAINTENANCE_INTERVAL_SECONDS to have app.py run it in a throttled
+background thread.
+
+With VECTOR_SERVICE_URL set the store's files belong to the vector service:
+chunks and collections are still reconciled through it, but segment
+directories and VACUUM are left alone. To compact those, stop the service
+and run this script on its host without VECTOR_SERVICE_URL.
+"""
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import argparse
+import threading
+from user_storage import load_files_index, load_class_files_index
+from classes_storage import load_classes
+from vectorstore import get_chroma_client, VECTORSTORE_PATH, VECTOR_SERVICE_URL, is_personal_collection, class_id_from_collection_name
+from flat_index import FLAT_INDEX_DIR, WRITE_VERSION_DIR, bump_write_version
+from quantized_index import QUANTIZED_INDEX_DIR, remove_path, remove_retired_builds
+from tiering import ARCHIVE_DIR, list_archived, discard_snapshot, acquire_collection_lock, release_collection_lock
+from index_config import rebuild_collection
+from uploads import UPLOAD_SPOOL_DIR, expire_uploads
+from top_questions import materials_changed
+
+# 0 disables the background thread
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", "0"))
+
+# Deletes are issued in batches with a pause in between so a large cleanup
+# does not hold the SQLite write lock away from uploads for long
+MAINTENANCE_BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", "500"))
+MAINTENANCE_BATCH_PAUSE = float(os.environ.get("MAINTENANCE_BATCH_PAUSE", "0.1"))
+
+# With --rebuild, collections that lost at least this fraction of their
+# chunks are rebuilt so HNSW drops the deleted entries
+REBUILD_ORPHAN_RATIO = 0.2
+
+# Chunks must still be unindexed this many seconds after the first scan
+# before they are deleted
+ORPHAN_GRACE_SECONDS = float(os.environ.get("ORPHAN_GRACE_SECONDS", "300"))
+
+# Only one process (or gunicorn worker) runs maintenance at a time
+LOCK_FILE = "./data/maintenance.lock"
+LOCK_STALE_SECONDS = 3600
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def scan_collection(collection, batch_size: int = MAINTENANCE_BATCH_SIZE):
+    """Yield (ids, metadatas) pages of a collection without loading embeddings"""
+    offset = 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            return
+        yield page["ids"], page["metadatas"]
+        offset += len(page["ids"])
+
+
+def delete_in_batches(collection, ids, batch_size: int = MAINTENANCE_BATCH_SIZE, pause: float = MAINTENANCE_BATCH_PAUSE):
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+        bump_write_version(collection.name)
+        if pause:
+            time.sleep(pause)
+
+
+def load_expected_ids():
+    """(class ids, class_id -> indexed chunk ids, all indexed personal chunk ids)"""
+    classes = set(load_classes())
+    class_chunk_ids = {
+        class_id: {chunk_id for data in files.values() for chunk_id in data["chunk_ids"]}
+        for class_id, files in load_class_files_index().items()
+    }
+    user_chunk_ids = {
+        chunk_id
+        for files in load_files_index().values()
+        for data in files.values()
+        for chunk_id in data["chunk_ids"]
+    }
+    return classes, class_chunk_ids, user_chunk_ids
+
+
+def restore_retired(client, retired, live_name: str) -> bool:
+    """
+    Put back the original a rebuild retired but never replaced (the swap
+    failed or the process died mid-swap). Skipped while that rebuild still
+    holds the collection's lock.
+    """
+    if not acquire_collection_lock(live_name):
+        return False
+    try:
+        try:
+            client.get_collection(live_name)
+            return False
+        except Exception:
+            pass
+        retired.modify(name=live_name)
+        bump_write_version(live_name)
+        print(f"Restored {live_name} from {retired.name}")
+        return True
+    except Exception as e:
+        print(f"Error restoring {live_name}: {e}")
+        return False
+    finally:
+        release_collection_lock(live_name)
+
+
+def reconcile(dry_run: bool = False, rebuild: bool = False, grace: float = ORPHAN_GRACE_SECONDS) -> dict:
+    """Delete chunks and collections that no index entry points at"""
+    client = get_chroma_client()
+    classes, class_chunk_ids, user_chunk_ids = load_expected_ids()
+
+    report = {
+        "orphan_chunks": {}, "dead_collections": [], "rebuilt_collections": [], "restored_collections": [],
+        "missing_chunks": 0,
+    }
+    personal_present = set()
+    candidates = []  # (collection, orphan ids, total chunks)
+
+    collections = client.list_collections()
+    names = {collection.name for collection in collections}
+    for collection in collections:
+        name = collection.name
+        if name.endswith("__retired"):
+            live_name = name[:-len("__retired")]
+            if live_name in names:
+                # Left behind by a rebuild that swapped but did not finish cleaning up
+                report["dead_collections"].append(name)
+            elif not dry_run and restore_retired(client, collection, live_name):
+                report["restored_collections"].append(live_name)
+            continue
+        if name.endswith("__rebuild"):
+            # May belong to a rebuild that is still running
+            continue
+
+        personal = is_personal_collection(name)
+        if personal:
+            expected = user_chunk_ids
+        else:
+            class_id = class_id_from_collection_name(name)
+            if class_id is None:
+                continue
+            if class_id not in classes:
+                report["dead_collections"].append(name)
+                continue
+            expected = class_chunk_ids.get(class_id, set())
+
+        orphans, present, total = [], set(), 0
+        for ids, metadatas in scan_collection(collection):
+            total += len(ids)
+            for chunk_id, metadata in zip(ids, metadatas):
+                # Chunks from the old anonymous ingest have no owner to check against
+                if personal and not (metadata or {}).get("user"):
+                    continue
+                if chunk_id in expected:
+                    present.add(chunk_id)
+                else:
+                    orphans.append(chunk_id)
+
+        if personal:
+            personal_present |= present
+        else:
+            report["missing_chunks"] += len(expected - present)
+        if orphans:
+            candidates.append((collection, orphans, total))
+
+    report["missing_chunks"] += len(user_chunk_ids - personal_present)
+
+    if dry_run:
+        report["orphan_chunks"] = {c.name: len(orphans) for c, orphans, _ in candidates}
+        return report
+
+    # Uploads write chunks before their index entry (the summary is generated
+    # in between), so give in-flight uploads time to land and check again
+    if candidates and grace:
+        time.sleep(grace)
+        classes, class_chunk_ids, user_chunk_ids = load_expected_ids()
+    indexed = user_chunk_ids.union(*class_chunk_ids.values())
+
+    for collection, orphans, total in candidates:
+        orphans = [chunk_id for chunk_id in orphans if chunk_id not in indexed]
+        if not orphans:
+            continue
+        report["orphan_chunks"][collection.name] = len(orphans)
+        delete_in_batches(collection, orphans)
+        class_id = class_id_from_collection_name(collection.name)
+        if class_id is not None:
+            materials_changed(class_id)
+        if rebuild and len(orphans) / total >= REBUILD_ORPHAN_RATIO:
+            _, error = rebuild_collection(client, collection.name)
+            if error:
+                print(f"Rebuild of {collection.name} failed: {error}")
+            else:
+                report["rebuilt_collections"].append(collection.name)
+
+    for name in report["dead_collections"]:
+        if name.endswith("__retired"):
+            # Only while its rebuild is not running; the swap may still need it
+            live_name = name[:-len("__retired")]
+            if not acquire_collection_lock(live_name):
+                continue
+            try:
+                client.delete_collection(name)
+            except Exception as e:
+                print(f"Error deleting collection {name}: {e}")
+            finally:
+                release_collection_lock(live_name)
+            continue
+        class_id = class_id_from_collection_name(name)
+        if class_id is not None and class_id in classes:
+            continue
+        try:
+            client.delete_collection(name)
+        except Exception as e:
+            print(f"Error deleting collection {name}: {e}")
+
+    return report
+
+
+def compact(dry_run: bool = False, vacuum: bool = False, grace: float = ORPHAN_GRACE_SECONDS) -> dict:
+    """
+    Remove segment directories, flat-index files and quantized indexes that
+    no live collection uses. Segment directories modified within the last
+    `grace` seconds are left for the next run. VACUUM needs an exclusive lock on chroma.sqlite3, so only ask for it
+    while the app is stopped.
+    """
+    report = {"segment_dirs": [], "flat_index_files": [], "quantized_indexes": [], "dead_snapshots": [], "expired_uploads": [], "write_versions": []}
+    client = get_chroma_client()
+    live_collections = {collection.name for collection in client.list_collections()}
+
+    db_path = os.path.join(VECTORSTORE_PATH, "chroma.sqlite3")
+    # The service owns its files (and they may be on another host)
+    local_store = not VECTOR_SERVICE_URL
+    if local_store:
+        # Directories first, then the segments table: a collection created
+        # in between has its segment row by the time the table is read
+        candidates = []
+        for entry in os.listdir(VECTORSTORE_PATH):
+            path = os.path.join(VECTORSTORE_PATH, entry)
+            try:
+                uuid.UUID(entry)
+            except ValueError:
+                continue
+            if os.path.isdir(path):
+                candidates.append(entry)
+
+        db = sqlite3.connect(db_path)
+        try:
+            live_segments = {row[0] for row in db.execute("SELECT id FROM segments")}
+        finally:
+            db.close()
+
+        cutoff = time.time() - grace
+        for entry in candidates:
+            path = os.path.join(VECTORSTORE_PATH, entry)
+            if entry in live_segments:
+                continue
+            try:
+                # Recently written directories may belong to a collection still being created
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            report["segment_dirs"].append(entry)
+            if not dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+
+    if os.path.isdir(FLAT_INDEX_DIR):
+        for entry in os.listdir(FLAT_INDEX_DIR):
+            # Matrices still being written are ".<name>.npy.<random>.tmp"
+            if entry.endswith(".npy") and entry[:-len(".npy")] not in live_collections:
+                report["flat_index_files"].append(entry)
+                if not dry_run:
+                    os.remove(os.path.join(FLAT_INDEX_DIR, entry))
+
+    if os.path.isdir(QUANTIZED_INDEX_DIR):
+        for entry in os.listdir(QUANTIZED_INDEX_DIR):
+            # "<collection>" links, "<collection>@<random>" builds and ".<collection>@<random>.link" swaps
+            if entry.lstrip(".").split("@", 1)[0] not in live_collections:
+                report["quantized_indexes"].append(entry)
+                if not dry_run:
+                    remove_path(os.path.join(QUANTIZED_INDEX_DIR, entry))
+        if not dry_run:
+            # Builds of live collections that a newer one replaced
+            report["quantized_indexes"].extend(remove_retired_builds())
+
+    # Write stamps of collections that are gone; a recreated or rehydrated one gets a new stamp on its first write
+    if os.path.isdir(WRITE_VERSION_DIR):
+        for entry in os.listdir(WRITE_VERSION_DIR):
+            if entry not in live_collections and not entry.startswith("."):
+                report["write_versions"].append(entry)
+                if not dry_run:
+                    os.remove(os.path.join(WRITE_VERSION_DIR, entry))
+
+    # Snapshots of classes deleted while archived
+    classes = load_classes()
+    for name in list_archived():
+        class_id = class_id_from_collection_name(name)
+        if class_id is not None and class_id not in classes:
+            report["dead_snapshots"].append(name)
+            if not dry_run:
+                discard_snapshot(name)
+
+    report["expired_uploads"] = expire_uploads(dry_run=dry_run)
+
+    if vacuum and local_store and not dry_run:
+        db = sqlite3.connect(db_path)
+        try:
+            db.execute("VACUUM")
+        finally:
+            db.close()
+
+    return report
+
+
+def acquire_lock() -> bool:
+    os.makedirs("./data", exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(LOCK_FILE) > LOCK_STALE_SECONDS:
+            os.remove(LOCK_FILE)
+    except OSError:
+        pass
+    try:
+        fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+
+def release_lock():
+    try:
+        os.remove(LOCK_FILE)
+    except OSError:
+        pass
+
+
+def run_maintenance(dry_run: bool = False, rebuild: bool = False, vacuum: bool = False, grace: float = ORPHAN_GRACE_SECONDS):
+    """Reconcile then compact. Returns the report, or None if another process holds the lock."""
+    if not acquire_lock():
+        return None
+    try:
+        size_before = sum(directory_size(path) for path in (VECTORSTORE_PATH, FLAT_INDEX_DIR, QUANTIZED_INDEX_DIR, ARCHIVE_DIR, UPLOAD_SPOOL_DIR))
+        report = reconcile(dry_run=dry_run, rebuild=rebuild, grace=grace)
+        report.update(compact(dry_run=dry_run, vacuum=vacuum, grace=grace))
+        size_after = sum(directory_size(path) for path in (VECTORSTORE_PATH, FLAT_INDEX_DIR, QUANTIZED_INDEX_DIR, ARCHIVE_DIR, UPLOAD_SPOOL_DIR))
+        report["reclaimed_bytes"] = max(size_before - size_after, 0)
+        return report
+    finally:
+        release_lock()
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"{sum(report['orphan_chunks'].values())} orphan chunks in {len(report['orphan_chunks'])} collections, "
+        f"{len(report['dead_collections'])} dead collections, "
+        f"{len(report['restored_collections'])} restored collections, "
+        f"{len(report['segment_dirs'])} unreferenced segment dirs, "
+        f"{report['missing_chunks']} indexed chunks missing from Chroma, "
+        f"{len(report['expired_uploads'])} expired upload spools, "
+        f"{report['reclaimed_bytes']} bytes reclaimed"
+    )
+
+
+def start_background_maintenance(interval: int = MAINTENANCE_INTERVAL_SECONDS):
+    """Run maintenance every `interval` seconds in a daemon thread (0 disables)"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                report = run_maintenance()
+                if report:
+                    print("Vector-store maintenance:", format_report(report))
+            except Exception as e:
+                print("Vector-store maintenance error:", e)
+
+    thread = threading.Thread(target=loop, name="vectorstore-maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean up orphan chunks and dead collections")
+    parser.add_argument("--dry-run", action="store_true", help="report without deleting anything")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild collections that lost many chunks")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM chroma.sqlite3 (stop the app first)")
+    parser.add_argument("--grace", type=float, default=ORPHAN_GRACE_SECONDS,
+                        help="seconds to wait for in-flight uploads before deleting (0 if the app is stopped)")
+    args = parser.parse_args()
+
+    report = run_maintenance(dry_run=args.dry_run, rebuild=args.rebuild, vacuum=args.vacuum, grace=args.grace)
+    if report is None:
+        raise SystemExit(f"Maintenance is already running (remove {LOCK_FILE} if it is stale)")
+    print(("[dry run] " if args.dry_run else "") + format_report(report))
+    for name, count in sorted(report["orphan_chunks"].items()):
+        print(f"  {name}: {count} orphan chunks")
+    for name in report["dead_collections"]:
+        print(f"  dead collection: {name}")
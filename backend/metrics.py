@@ -0,0 +1,247 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+    with span("retrieval"):
+        results = query_collection(...)
+
+records the time into the `teachtwin_stage_seconds{stage="retrieval"}`
+histogram. Set METRICS_ENABLED=0 to turn every span into a shared no-op.
+Each worker process keeps its own registry, so /metrics reports the worker
+that served the scrape.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Seconds; spans range from sub-millisecond JSON loads to multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+
+class Gauge(Counter):
+    """A value that can go up and down, or be computed at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels=(), function=None):
+        super().__init__(name, help_text, labels)
+        self._function = function
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self._function is not None:
+            try:
+                yield f"{self.name} {self._function()}"
+            except Exception as e:
+                print(f"Error computing {self.name}: {e}")
+            return
+        yield from super().render()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', bound))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}"
+
+
+def render_metrics() -> str:
+    """Every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "teachtwin_stage_seconds",
+    "Time spent in each stage of request handling",
+    ["stage"],
+)
+REQUEST_SECONDS = Histogram(
+    "teachtwin_request_seconds",
+    "End-to-end request latency by endpoint",
+    ["endpoint", "method", "status"],
+)
+LLM_TOKENS = Counter(
+    "teachtwin_llm_tokens_total",
+    "Tokens reported by the Anthropic API in response.usage",
+    ["model", "purpose", "direction"],
+)
+UPLOAD_BYTES = Counter(
+    "teachtwin_upload_bytes_total",
+    "Bytes of uploaded files read during ingestion",
+    ["scope"],
+)
+UPLOAD_CHUNKS = Counter(
+    "teachtwin_upload_chunks_total",
+    "Chunks written to the vector store during ingestion",
+    ["scope"],
+)
+NORMALIZE_REMOVED_CHARS = Counter(
+    "teachtwin_normalize_removed_chars_total",
+    "Characters of repeated headers/footers, page numbers and whitespace removed before chunking",
+    ["scope"],
+)
+NORMALIZE_SAVED_CHUNKS = Counter(
+    "teachtwin_normalize_saved_chunks_total",
+    "Chunks not created because of text normalization",
+    ["scope"],
+)
+
+
+# Per-thread stage totals for the request being profiled (see profiler.py)
+_stage_capture = threading.local()
+
+
+def begin_stage_capture():
+    """Start collecting this thread's span timings"""
+    _stage_capture.stages = {}
+
+
+def end_stage_capture() -> dict:
+    """Stop collecting and return {stage: seconds} since begin_stage_capture()"""
+    stages = getattr(_stage_capture, "stages", None)
+    _stage_capture.stages = None
+    return stages or {}
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        stages = getattr(_stage_capture, "stages", None)
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """Context manager timing one stage into teachtwin_stage_seconds"""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+def timed(stage: str):
+    """Decorator form of span()"""
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(response, model: str, purpose: str):
+    """Count input/output tokens from an Anthropic response"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, model=model, purpose=purpose, direction="input")
+    LLM_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, model=model, purpose=purpose, direction="output")
@@ -0,0 +1,85 @@
+"""
+Move personal uploads out of the shared `course_materials` collection into
+per-user shard collections.
+
+The migration is online: chunks are copied with their stored embeddings
+(nothing is re-embedded), then deleted from the shared collection one batch
+at a time. Queries search both the shared collection and the user's shard
+until all of a user's chunks have moved, so the app can keep serving while
+this runs. It is safe to
+interrupt and re-run.
+
+Usage (from the backend directory):
+    python migrate_user_shards.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+from collections import defaultdict
+from vectorstore import get_chroma_client, get_legacy_collection, user_collection_name
+from index_config import collection_metadata
+from flat_index import bump_write_version
+
+
+def migrate(batch_size: int = 500, dry_run: bool = False) -> dict:
+    client = get_chroma_client()
+    legacy = get_legacy_collection()
+    stats = {"moved": 0, "skipped": 0, "collections": set()}
+
+    # Chunks without a user (from the old anonymous ingest) stay behind, so
+    # the read offset only advances past those.
+    offset = 0
+    while True:
+        batch = legacy.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not batch["ids"]:
+            break
+
+        by_shard = defaultdict(lambda: {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+        skipped = 0
+        for i, chunk_id in enumerate(batch["ids"]):
+            metadata = batch["metadatas"][i] or {}
+            user_email = metadata.get("user")
+            if not user_email:
+                skipped += 1
+                continue
+            shard = by_shard[user_collection_name(user_email)]
+            shard["ids"].append(chunk_id)
+            shard["documents"].append(batch["documents"][i])
+            shard["metadatas"].append(metadata)
+            shard["embeddings"].append(batch["embeddings"][i])
+
+        moved_ids = []
+        for name, shard in by_shard.items():
+            stats["collections"].add(name)
+            if dry_run:
+                continue
+            client.get_or_create_collection(name, metadata=collection_metadata(name)).upsert(**shard)
+            bump_write_version(name)
+            moved_ids.extend(shard["ids"])
+
+        # Only delete once every shard in the batch has been written
+        if moved_ids:
+            legacy.delete(ids=moved_ids)
+            bump_write_version(legacy.name)
+
+        stats["moved"] += sum(len(shard["ids"]) for shard in by_shard.values())
+        stats["skipped"] += skipped
+        offset += len(batch["ids"]) if dry_run else skipped
+        print(f"Processed {stats['moved'] + stats['skipped']} chunks ({stats['moved']} moved)")
+
+    stats["collections"] = sorted(stats["collections"])
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard personal uploads into per-user collections")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would move without writing")
+    args = parser.parse_args()
+
+    result = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {result['moved']} chunks into {len(result['collections'])} collections; "
+          f"{result['skipped']} chunks without a user left in place")
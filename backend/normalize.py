@@ -0,0 +1,132 @@
+"""
+Text normalization between extraction and chunking.
+
+Slide decks and lecture handouts repeat the course title, instructor name,
+page numbers and copyright footers on every page. Left in, they inflate the
+chunk count, get embedded and stored, and are sent to the LLM as context.
+
+normalize_pages() looks at a document's pages together:
+
+  - a short line seen in the first or last NORMALIZE_EDGE_LINES lines of at
+    least NORMALIZE_EDGE_FRACTION of the pages is a running header/footer
+  - a line of at least BODY_MIN_WORDS words, with at least one letter, seen
+    verbatim anywhere on at least NORMALIZE_BODY_FRACTION of the pages is
+    boilerplate (footers that extract mid-page)
+  - page numbers ("7", "Page 7 of 40", "7/40") at a page's edges are dropped
+    when they count along with the pages: the number minus the page's
+    position is the same offset on at least NORMALIZE_EDGE_FRACTION of the
+    pages. A lone figure at the end of a page ("Total" / "1250") is kept.
+
+Other header/footer lines are compared with digits masked, so "Lecture 3"
+and "Lecture 4" count as the same line, and are only removed where they
+appear at a page's edges. The body rule compares exact text, so numbers and short labels that
+recur on every page (table cells such as "42", column headers such as
+"Value") are kept. Documents with fewer than NORMALIZE_MIN_PAGES pages are
+only whitespace-collapsed. Set NORMALIZE_TEXT=0 to turn stripping off.
+"""
+import os
+import re
+from collections import Counter
+from typing import List, Tuple
+
+NORMALIZE_TEXT = os.environ.get("NORMALIZE_TEXT", "1").lower() not in ("0", "false", "no")
+NORMALIZE_MIN_PAGES = int(os.environ.get("NORMALIZE_MIN_PAGES", "3"))
+NORMALIZE_EDGE_LINES = int(os.environ.get("NORMALIZE_EDGE_LINES", "3"))
+NORMALIZE_EDGE_FRACTION = float(os.environ.get("NORMALIZE_EDGE_FRACTION", "0.5"))
+NORMALIZE_BODY_FRACTION = float(os.environ.get("NORMALIZE_BODY_FRACTION", "0.8"))
+# Longer lines are content even when repeated (e.g. a definition restated on each slide)
+MAX_BOILERPLATE_WORDS = 20
+# Shorter lines repeated mid-page are more likely table headers or labels than footers
+BODY_MIN_WORDS = 3
+
+PAGE_NUMBER_RE = re.compile(r"^(?:(?:page|slide|p\.)\s*)?\d+(?:\s*(?:/|of)\s*\d+)?$", re.IGNORECASE)
+SPACES_RE = re.compile(r"[ \t\u00a0]+")
+DIGITS_RE = re.compile(r"\d+")
+LETTER_RE = re.compile(r"[^\W\d_]")
+
+
+def _line_key(line: str) -> str:
+    return DIGITS_RE.sub("#", line.lower())
+
+
+def _edges(lines: List[str]) -> set:
+    return set(lines[:NORMALIZE_EDGE_LINES] + lines[-NORMALIZE_EDGE_LINES:])
+
+
+def _body_candidate(line: str) -> bool:
+    return len(line.split()) >= BODY_MIN_WORDS and LETTER_RE.search(line) is not None
+
+
+def _page_number_offset(line: str, position: int):
+    """How far a page-number line's number is from the page's 1-based position, None for other lines"""
+    if not PAGE_NUMBER_RE.match(line):
+        return None
+    return int(DIGITS_RE.search(line).group()) - position
+
+
+def find_boilerplate(pages: List[List[str]]) -> Tuple[set, set, set]:
+    """
+    (digit-masked keys of repeated header/footer lines, exact text of lines
+    repeated anywhere on the page, offsets of page numbers that count along
+    with the pages)
+    """
+    edge_pages = Counter()
+    body_pages = Counter()
+    offset_pages = Counter()
+    for position, lines in enumerate(pages, start=1):
+        short = [line for line in lines if len(line.split()) <= MAX_BOILERPLATE_WORDS]
+        edges = _edges(lines)
+        edge_pages.update({_line_key(line) for line in short if line in edges and not PAGE_NUMBER_RE.match(line)})
+        body_pages.update({line for line in short if _body_candidate(line)})
+        offset_pages.update({_page_number_offset(line, position) for line in edges} - {None})
+
+    n = len(pages)
+    edge_keys = {key for key, count in edge_pages.items() if count >= max(2, NORMALIZE_EDGE_FRACTION * n)}
+    body_lines = {line for line, count in body_pages.items() if count >= max(2, NORMALIZE_BODY_FRACTION * n)}
+    offsets = {offset for offset, count in offset_pages.items() if count >= max(2, NORMALIZE_EDGE_FRACTION * n)}
+    return edge_keys, body_lines, offsets
+
+
+def normalize_pages(pages: List[str]) -> Tuple[str, dict]:
+    """
+    Strip repeated headers/footers and page numbers and collapse whitespace
+    (runs of spaces to one, runs of blank lines to one).
+    Returns (text, stats) where stats has pages, lines_removed,
+    chars_before and chars_after.
+    """
+    chars_before = sum(len(page) for page in pages) + max(0, len(pages) - 1)
+    cleaned = [[SPACES_RE.sub(" ", line).strip() for line in page.splitlines()] for page in pages]
+    content = [[line for line in lines if line] for lines in cleaned]
+
+    strip = NORMALIZE_TEXT and len(pages) >= NORMALIZE_MIN_PAGES
+    edge_keys, body_lines, offsets = find_boilerplate(content) if strip else (set(), set(), set())
+
+    kept_pages = []
+    lines_removed = 0
+    for position, (lines, nonblank) in enumerate(zip(cleaned, content), start=1):
+        edges = _edges(nonblank)
+        kept = []
+        for line in lines:
+            if not line:
+                if kept and kept[-1]:
+                    kept.append("")
+                continue
+            edge_boilerplate = line in edges and (
+                _line_key(line) in edge_keys or _page_number_offset(line, position) in offsets
+            )
+            if strip and (line in body_lines or edge_boilerplate):
+                lines_removed += 1
+                continue
+            kept.append(line)
+        while kept and not kept[-1]:
+            kept.pop()
+        if kept:
+            kept_pages.append("\n".join(kept))
+
+    text = "\n".join(kept_pages)
+    return text, {
+        "pages": len(pages),
+        "lines_removed": lines_removed,
+        "chars_before": chars_before,
+        "chars_after": len(text),
+    }
@@ -0,0 +1,199 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A request is profiled when it is picked by PROFILE_SAMPLE_RATE (a fraction
+of requests) or, with PROFILE_SLOW_MS set, when it turns out to be slower
+than that. While at least one request is being watched, a single daemon
+thread snapshots the watched threads' stacks every PROFILE_INTERVAL_MS via
+sys._current_frames(); nothing runs when profiling is off.
+
+Captured profiles are written to ./data/profiles/<id>.json with the endpoint,
+class_id, status, duration, per-stage timings from metrics spans and the
+stacks in folded format ("frame;frame;frame count" lines), which
+flamegraph.pl, speedscope and inferno read directly.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from typing import List, Optional
+
+PROFILE_DIR = "./data/profiles"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+MAX_STACK_DEPTH = 128
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or PROFILE_SLOW_MS > 0
+
+
+class _Sampler:
+    """One background thread sampling every registered thread's stack"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._watched = {}  # thread id -> {folded stack: count}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+
+    def watch(self, thread_id: int):
+        with self._lock:
+            self._watched[thread_id] = {}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def unwatch(self, thread_id: int) -> dict:
+        with self._lock:
+            return self._watched.pop(thread_id, {})
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._watched:
+                    self._wake.wait()
+                watched = list(self._watched)
+            frames = sys._current_frames()
+            for thread_id in watched:
+                if thread_id == me:
+                    continue
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = _fold(frame)
+                with self._lock:
+                    counts = self._watched.get(thread_id)
+                    if counts is not None:
+                        counts[stack] = counts.get(stack, 0) + 1
+            del frames
+            time.sleep(self.interval)
+
+
+def _fold(frame) -> str:
+    """Root-first `file:function:line` frames joined with ';'"""
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+_sampler = _Sampler(PROFILE_INTERVAL_MS / 1000.0)
+
+
+class RequestProfile:
+    """Handle returned by start_request(); pass it to finish_request()"""
+    __slots__ = ("thread_id", "sampled", "start")
+
+    def __init__(self, thread_id: int, sampled: bool):
+        self.thread_id = thread_id
+        self.sampled = sampled
+        self.start = time.perf_counter()
+
+
+def start_request() -> Optional[RequestProfile]:
+    """
+    Begin watching the current thread if this request may need a profile.
+    Returns None when profiling is off.
+    """
+    if not profiling_enabled():
+        return None
+    sampled = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if not sampled and PROFILE_SLOW_MS <= 0:
+        return None
+    thread_id = threading.get_ident()
+    _sampler.watch(thread_id)
+    return RequestProfile(thread_id, sampled)
+
+
+def finish_request(profile: Optional[RequestProfile], tags: dict, stages: dict = None) -> Optional[str]:
+    """
+    Stop watching and keep the profile if it was sampled or slow.
+    Returns the profile id, or None if nothing was stored.
+    """
+    if profile is None:
+        return None
+    counts = _sampler.unwatch(profile.thread_id)
+    duration_ms = (time.perf_counter() - profile.start) * 1000
+    slow = PROFILE_SLOW_MS > 0 and duration_ms >= PROFILE_SLOW_MS
+    if not (profile.sampled or slow) or not counts:
+        return None
+
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    record = {
+        "id": profile_id,
+        "captured_at": time.time(),
+        "reason": "slow" if slow else "sampled",
+        "duration_ms": round(duration_ms, 2),
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "samples": sum(counts.values()),
+        "stages": {stage: round(seconds * 1000, 2) for stage, seconds in (stages or {}).items()},
+        **tags,
+        "folded": "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items())),
+    }
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(record, f)
+        os.replace(path + ".tmp", path)
+        _prune()
+    except OSError as e:
+        print(f"Error saving profile {profile_id}: {e}")
+        return None
+    return profile_id
+
+
+def discard_request(profile: Optional[RequestProfile]):
+    """Stop watching without storing anything"""
+    if profile is not None:
+        _sampler.unwatch(profile.thread_id)
+
+
+def _prune():
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for name in names[:max(0, len(names) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[dict]:
+    """Newest first, without the stacks"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        record.pop("folded", None)
+        profiles.append(record)
+    return profiles
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    # Ids are generated here; anything else (e.g. path separators) is not a profile
+    if not profile_id or os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
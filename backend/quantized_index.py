@@ -0,0 +1,377 @@
+"""
+Int8 scalar-quantized search for large collections.
+
+When a collection's index config sets quantization to "int8", its embeddings
+are kept in RAM as one byte per dimension instead of four. A query scans the
+int8 codes for the top `k * rescore_factor` candidates, then rescores only
+those with the full-precision vectors, which stay in a memory-mapped float32
+file on disk. Queries for such a collection never load its HNSW graph.
+Documents are fetched from Chroma for the final top-k only. Chunk ids and
+metadata (for where filters) are held in memory as Python objects.
+
+After a write the index is rebuilt in a background thread; queries keep
+using the previous build until the new one is ready, or HNSW if there is
+none yet.
+
+On disk, a collection's index is a directory "<name>@<random>" that the
+symlink "<name>" points at. Every build writes a directory of its own and
+swaps the link, so readers never see half a build and concurrent builds in
+several workers do not overwrite each other.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import numpy as np
+from flat_index import matches_where, write_version
+from index_config import get_index_config
+
+QUANTIZED_INDEX_DIR = "./data/quantized"
+# Replaced builds are removed after this long, so readers that resolved the
+# link just before a swap can finish loading them
+RETIRED_INDEX_GRACE_SECONDS = float(os.environ.get("RETIRED_INDEX_GRACE_SECONDS", "600"))
+
+# Rows converted to float32 at a time while scanning codes, to bound scratch memory
+SCAN_BLOCK_ROWS = 16384
+# Chunks read from Chroma per get() while building
+BUILD_PAGE_ROWS = 1000
+
+
+def quantize(vectors: np.ndarray):
+    """Per-dimension min/max scalar quantization to int8. Returns (codes, mins, scales)."""
+    mins, scales = _scale(vectors.min(axis=0), vectors.max(axis=0))
+    return _encode(vectors, mins, scales), mins, scales
+
+
+def _scale(mins: np.ndarray, maxs: np.ndarray):
+    """(mins, scales) mapping each dimension's [min, max] onto the 256 int8 codes"""
+    scales = (maxs - mins) / 255.0
+    scales[scales == 0] = 1.0
+    return mins.astype(np.float32), scales.astype(np.float32)
+
+
+def _encode(vectors: np.ndarray, mins: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint((vectors - mins) / scales) - 128, -128, 127).astype(np.int8)
+
+
+class QuantizedIndex:
+    """int8 codes in memory, float32 vectors memory-mapped for rescoring"""
+
+    def __init__(self, path: str):
+        # Resolve the link once, so every file comes from the same build
+        path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.metadatas = meta["metadatas"]
+        self.space = meta["space"]
+        self.collection_id = meta["collection_id"]
+        self.write_version = meta.get("write_version")
+        self.codes = np.load(os.path.join(path, "codes.npy"))
+        self.mins = np.load(os.path.join(path, "mins.npy"))
+        self.scales = np.load(os.path.join(path, "scales.npy"))
+        self.sq_norms = np.load(os.path.join(path, "sq_norms.npy"))
+        self.full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+
+    @staticmethod
+    def build(path: str, collection_id: str, ids, embeddings, metadatas, space: str = "l2", version: str = ""):
+        return QuantizedIndex.build_paged(path, collection_id, [(ids, embeddings, metadatas)], len(ids), space, version)
+
+    @staticmethod
+    def build_paged(path: str, collection_id: str, pages, rows: int, space: str = "l2", version: str = ""):
+        """
+        Build from (ids, embeddings, metadatas) pages holding up to `rows`
+        chunks. Each page's float32 vectors go straight to the memory-mapped
+        file; the int8 codes are then filled from it a block at a time, so
+        only one page or block of float32 is in process memory at once.
+        """
+        directory, name = os.path.split(path)
+        staging = tempfile.mkdtemp(dir=directory or ".", prefix=f"{name}@")
+        full_path = os.path.join(staging, "full.npy")
+        try:
+            ids, metadatas = [], []
+            full = sq_norms = mins = maxs = None
+            n = 0
+            for page_ids, page_embeddings, page_metadatas in pages:
+                # Chunks added after `rows` was read are left for the next build
+                vectors = np.asarray(page_embeddings, dtype=np.float32)[:rows - n]
+                if not len(vectors):
+                    break
+                if space == "cosine":
+                    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                    vectors = vectors / np.where(norms == 0, 1.0, norms)
+                if full is None:
+                    full = np.lib.format.open_memmap(full_path, mode="w+", dtype=np.float32, shape=(rows, vectors.shape[1]))
+                    sq_norms = np.empty(rows, dtype=np.float32)
+                    mins, maxs = vectors.min(axis=0), vectors.max(axis=0)
+                else:
+                    mins, maxs = np.minimum(mins, vectors.min(axis=0)), np.maximum(maxs, vectors.max(axis=0))
+                full[n:n + len(vectors)] = vectors
+                sq_norms[n:n + len(vectors)] = np.einsum("ij,ij->i", vectors, vectors)
+                ids.extend(page_ids[:len(vectors)])
+                metadatas.extend(page_metadatas[:len(vectors)])
+                n += len(vectors)
+            if full is None:
+                raise ValueError("no embeddings to index")
+            if n < rows:
+                # Chunks deleted while paging: rewrite the file at its real length
+                np.save(os.path.join(staging, "full.tmp.npy"), full[:n])
+                del full
+                os.replace(os.path.join(staging, "full.tmp.npy"), full_path)
+                full = np.load(full_path, mmap_mode="r")
+                sq_norms = sq_norms[:n]
+            else:
+                full.flush()
+
+            mins, scales = _scale(mins, maxs)
+            codes = np.empty(full.shape, dtype=np.int8)
+            for start in range(0, n, SCAN_BLOCK_ROWS):
+                codes[start:start + SCAN_BLOCK_ROWS] = _encode(full[start:start + SCAN_BLOCK_ROWS], mins, scales)
+            del full
+
+            np.save(os.path.join(staging, "codes.npy"), codes)
+            np.save(os.path.join(staging, "mins.npy"), mins)
+            np.save(os.path.join(staging, "scales.npy"), scales)
+            np.save(os.path.join(staging, "sq_norms.npy"), sq_norms)
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({
+                    "collection_id": collection_id,
+                    "write_version": version,
+                    "space": space,
+                    "ids": ids,
+                    "metadatas": metadatas,
+                }, f)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        _point_link(path, staging)
+        remove_retired_builds(directory or ".", name)
+        return QuantizedIndex(staging)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def memory_bytes(self) -> int:
+        """Estimated resident size, ids and metadata included (the float32 copy is on disk)"""
+        arrays = self.codes.nbytes + self.sq_norms.nbytes + self.mins.nbytes + self.scales.nbytes
+        ids = sys.getsizeof(self.ids) + sum(sys.getsizeof(chunk_id) for chunk_id in self.ids)
+        metadatas = sys.getsizeof(self.metadatas) + sum(
+            sys.getsizeof(metadata) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in metadata.items())
+            for metadata in self.metadatas if metadata
+        )
+        return arrays + ids + metadatas
+
+    def _distances(self, rows: np.ndarray, q: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        dots = rows @ q
+        if self.space == "l2":
+            return sq_norms - 2.0 * dots + float(q @ q)
+        return 1.0 - dots
+
+    def search(self, query_embedding, n_results: int, where=None, rescore_factor: int = 4):
+        """Return [(id, distance)] for the top n_results after full-precision rescoring"""
+        q = np.asarray(query_embedding, dtype=np.float32)
+        if self.space == "cosine":
+            norm = float(np.linalg.norm(q))
+            q = q / norm if norm else q
+
+        # x ~= mins + scales * (code + 128), so x.q = (code + 128).(scales * q) + mins.q
+        q_scaled = self.scales * q
+        offset = float(self.mins @ q) + 128.0 * float(q_scaled.sum())
+        approx = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            approx[start:start + len(block)] = block @ q_scaled + offset
+        if self.space == "l2":
+            approx = self.sq_norms - 2.0 * approx + float(q @ q)
+        else:
+            approx = 1.0 - approx
+
+        if where:
+            mask = np.fromiter((matches_where(m, where) for m in self.metadatas), dtype=bool, count=len(self))
+            approx = np.where(mask, approx, np.inf)
+            available = int(mask.sum())
+        else:
+            available = len(self)
+
+        n_candidates = min(n_results * rescore_factor, available)
+        if n_candidates <= 0:
+            return []
+        candidates = np.argpartition(approx, n_candidates - 1)[:n_candidates]
+        candidates.sort()  # sequential reads from the memory-mapped file
+
+        exact = self._distances(np.asarray(self.full[candidates]), q, self.sq_norms[candidates])
+        order = np.argsort(exact)[:n_results]
+        return [(self.ids[candidates[i]], float(exact[i])) for i in order]
+
+
+def _point_link(path: str, target: str):
+    """Atomically make the link at `path` point at the build directory `target`"""
+    directory, name = os.path.split(path)
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    link = os.path.join(directory or ".", f".{name}@{uuid.uuid4().hex}.link")
+    os.symlink(os.path.basename(target), link)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # Built in place before builds were versioned; replaced once
+        shutil.rmtree(path, ignore_errors=True)
+    os.replace(link, path)
+    if previous and os.path.isdir(previous):
+        # Its grace period starts now, not when it was built
+        os.utime(previous)
+
+
+def remove_path(path: str):
+    """Remove a link or build directory"""
+    if os.path.islink(path) or not os.path.isdir(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_retired_builds(directory: str = QUANTIZED_INDEX_DIR, collection_name: str = None,
+                          grace: float = RETIRED_INDEX_GRACE_SECONDS) -> list:
+    """
+    Remove build directories no link points at (replaced, or left by a build
+    that failed) and leftover temporary links, once older than `grace`
+    seconds. Returns the entries removed.
+    """
+    if not os.path.isdir(directory):
+        return []
+    entries = os.listdir(directory)
+    current = {
+        os.path.basename(os.path.realpath(os.path.join(directory, entry)))
+        for entry in entries
+        if "@" not in entry and os.path.islink(os.path.join(directory, entry))
+    }
+    cutoff = time.time() - grace
+    removed = []
+    for entry in entries:
+        owner = entry.lstrip(".").split("@", 1)[0]
+        if "@" not in entry or entry in current or (collection_name is not None and owner != collection_name):
+            continue
+        path = os.path.join(directory, entry)
+        try:
+            if os.lstat(path).st_mtime > cutoff:
+                continue
+            remove_path(path)
+        except OSError:
+            continue
+        removed.append(entry)
+    return removed
+
+
+# collection name -> QuantizedIndex
+_indexes = {}
+# Collections with a build running in the background
+_building = set()
+_lock = threading.Lock()
+
+
+def quantization_enabled(collection_name: str) -> bool:
+    return get_index_config(collection_name).get("quantization") == "int8"
+
+
+def _load_or_build(collection, current, version: str, build: bool):
+    path = os.path.join(QUANTIZED_INDEX_DIR, collection.name)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        # Another worker may already have built this version
+        index = QuantizedIndex(path)
+        if current(index):
+            return index
+    if not build:
+        return None
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    os.makedirs(QUANTIZED_INDEX_DIR, exist_ok=True)
+    return QuantizedIndex.build_paged(path, str(collection.id), _pages(collection), collection.count(), space, version)
+
+
+def _pages(collection, batch_size: int = BUILD_PAGE_ROWS):
+    """Yield (ids, embeddings, metadatas) for every chunk, one get() page at a time"""
+    offset = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=offset, include=["embeddings", "metadatas"])
+        if not batch["ids"]:
+            return
+        yield batch["ids"], batch["embeddings"], batch["metadatas"]
+        offset += len(batch["ids"])
+
+
+def _refresh(collection, current, version: str, build: bool):
+    try:
+        index = _load_or_build(collection, current, version, build)
+        if index is not None:
+            with _lock:
+                _indexes[collection.name] = index
+    except Exception as e:
+        print(f"Error building quantized index for {collection.name}: {e}")
+    finally:
+        with _lock:
+            _building.discard(collection.name)
+
+
+def get_quantized_index(collection, build: bool = True):
+    """
+    Return the int8 index for a collection configured with quantization, or
+    None. When the collection's id, write version (see
+    flat_index.bump_write_version) or chunk count no longer match the cached
+    index, a rebuild starts in the background and the previous build of the
+    same collection is returned meanwhile (None if there is none, so the
+    caller falls back to HNSW).
+    """
+    if not quantization_enabled(collection.name):
+        return None
+    # Read before the data, so a write landing in between leaves the build stale, never current
+    version = write_version(collection.name)
+    count = collection.count()
+    if count == 0:
+        return None
+    collection_id = str(collection.id)
+
+    def current(index) -> bool:
+        return (index is not None and len(index) == count and index.collection_id == collection_id
+                and index.write_version == version)
+
+    with _lock:
+        cached = _indexes.get(collection.name)
+        if current(cached):
+            return cached
+        start = collection.name not in _building
+        if start:
+            _building.add(collection.name)
+    if start:
+        threading.Thread(
+            target=_refresh, args=(collection, current, version, build),
+            name=f"quantize-{collection.name}", daemon=True,
+        ).start()
+
+    # Chunks deleted since are dropped in query_quantized; new ones appear with the next build
+    if cached is not None and cached.collection_id == collection_id:
+        return cached
+    return None
+
+
+def query_quantized(collection, index: QuantizedIndex, query_embedding, n_results: int, where=None) -> dict:
+    """Search the int8 index and return a Chroma-shaped result"""
+    rescore_factor = get_index_config(collection.name).get("rescore_factor", 4)
+    hits = index.search(query_embedding, n_results, where, rescore_factor)
+    ids = [chunk_id for chunk_id, _ in hits]
+    if not ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+    # Chroma returns get() results in its own order
+    found = collection.get(ids=ids, include=["documents", "metadatas"])
+    by_id = {chunk_id: i for i, chunk_id in enumerate(found["ids"])}
+    ids = [chunk_id for chunk_id in ids if chunk_id in by_id]
+    distances = dict(hits)
+    return {
+        "ids": [ids],
+        "documents": [[found["documents"][by_id[chunk_id]] for chunk_id in ids]],
+        "metadatas": [[found["metadatas"][by_id[chunk_id]] for chunk_id in ids]],
+        "distances": [[distances[chunk_id] for chunk_id in ids]],
+    }
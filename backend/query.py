@@ -1,62 +1,98 @@
 import os
-import chromadb
-from chromadb.config import Settings
+import time
+from vectorstore import (
+    get_legacy_collection, find_user_collection, find_class_collection, query_collection, embed_query,
+    user_has_legacy_chunks,
+)
 from user_storage import get_user_chunk_ids
 from classes_storage import is_member_of_class
+from metrics import span, record_llm_usage, Counter, Histogram
+from llm import create_message, estimate_tokens, MODEL, INTERACTIVE
+from singleflight import SingleFlight
+from conversations import rewrite_followup, history_block, HISTORY_TOKENS
+from summary_index import route_sources, ROUTED_SEARCHES
+from dedup import collapse_duplicates, DEDUP_MODE
+
+# Identical questions asked at the same time share one retrieval + LLM call
+_answers_in_flight = SingleFlight("answers")
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer"""
+    return " ".join(question.lower().split()).rstrip(" ?!.")
+
+
+# Answer routes: how much context to retrieve, which model to ask and how long
+# the answer may be. Models can be overridden per route, e.g. ROUTE_DEEP_MODEL.
+ROUTES = {
+    # Short factual lookups: dates, rooms, deadlines, names
+    "lookup": {"model": os.environ.get("ROUTE_LOOKUP_MODEL", MODEL), "max_tokens": 250, "n_results": 2},
+    "standard": {"model": os.environ.get("ROUTE_STANDARD_MODEL", MODEL), "max_tokens": 800, "n_results": 4},
+    # Explanations, comparisons, derivations
+    "deep": {"model": os.environ.get("ROUTE_DEEP_MODEL", MODEL), "max_tokens": 1200, "n_results": 6},
+}
+
+LOOKUP_PREFIXES = (
+    "when", "where", "who", "what time", "what day", "what date", "what room", "which room",
+    "which day", "how many", "is there", "is the", "are there", "do we", "does the", "what is the deadline",
+    "what is the due", "when is", "where is",
+)
+DEEP_MARKERS = (
+    "why", "how does", "how do", "explain", "compare", "difference between", "differences between",
+    "derive", "prove", "walk me through", "step by step", "in depth", "relationship between", "intuition",
+)
 
-# Load Claude API key
-ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
-if not ANTHROPIC_API_KEY:
-    raise RuntimeError("Missing ANTHROPIC_API_KEY environment variable.")
-
-# Lazy load Anthropic client to avoid initialization errors
-_client = None
+ROUTE_CHOSEN = Counter("teachtwin_answer_routes_total", "Questions answered per route", ["route"])
+ROUTE_SECONDS = Histogram("teachtwin_answer_seconds", "Retrieval + LLM time per answer route", ["route"])
 
-def get_client():
-    global _client
-    if _client is None:
-        from anthropic import Anthropic
-        _client = Anthropic(api_key=ANTHROPIC_API_KEY)
-    return _client
 
-MODEL = "claude-3-5-haiku-20241022"
+def classify_question(question: str) -> str:
+    """Cheap keyword/length heuristic; no model call"""
+    q = normalize_question(question)
+    words = q.split()
+    padded = f" {q} "
+    if len(words) > 30 or any(f" {marker} " in padded or q.startswith(marker + " ") for marker in DEEP_MARKERS):
+        return "deep"
+    if len(words) <= 12 and q.startswith(LOOKUP_PREFIXES):
+        return "lookup"
+    return "standard"
 
-# ChromaDB persistent store with same settings as ingest.py
-chroma_client = chromadb.PersistentClient(
-    path="./data/vectorstore",
-    settings=Settings(anonymized_telemetry=False)
-)
-collection = chroma_client.get_or_create_collection("course_materials")
 
+LEVEL_INSTRUCTIONS = {
+    "beginner": "Explain as if the student is new to the topic. Use plain language, concrete examples, and analogies.",
+    "advanced": "Provide a concise, technical explanation assuming strong background knowledge.",
+}
+TONE_INSTRUCTIONS = {
+    "friendly": "Use an encouraging, friendly tone.",
+    "neutral": "Use a clear and neutral tone.",
+    "formal": "Use a professional, formal academic tone.",
+}
 
-def answer_question(question: str, level: str, tone: str):
-    # RAG retrieval
-    results = collection.query(query_texts=[question], n_results=4)
 
-    if not results["documents"] or not results["documents"][0]:
-        return (
-            "I couldn't find anything in the uploaded course materials that answers this.",
-            [],
-        )
+def prompt_variant(level: str, tone: str):
+    """The (level, tone) the prompt actually uses; unknown values fall back to beginner/neutral"""
+    return (level if level in LEVEL_INSTRUCTIONS else "beginner", tone if tone in TONE_INSTRUCTIONS else "neutral")
 
-    contexts = results["documents"][0]
-    sources_meta = results["metadatas"][0]
 
+def build_prompts(contexts, question: str, level: str, tone: str, history: str = ""):
+    """
+    Return (system_prompt, user_prompt) for a question and its retrieved context.
+    `history` is the bounded conversation history for follow-up questions.
+    """
     context_block = "\n\n---\n\n".join(contexts)
-    source_list = list({m["source"] for m in sources_meta if "source" in m})
+    history_section = ""
+    if history:
+        history_section = f"""
+Conversation so far (use it to understand the question; answer from the course materials):
 
-    level_instructions = {
-        "beginner": "Explain as if the student is new to the topic. Use plain language, concrete examples, and analogies.",
-        "advanced": "Provide a concise, technical explanation assuming strong background knowledge.",
-    }
+{history}
 
-    style_prompt = level_instructions.get(level, level_instructions["beginner"])
+---
+"""
 
-    tone_prompt = {
-        "friendly": "Use an encouraging, friendly tone.",
-        "neutral": "Use a clear and neutral tone.",
-        "formal": "Use a professional, formal academic tone.",
-    }.get(tone, "Use a clear and neutral tone.")
+    level, tone = prompt_variant(level, tone)
+    style_prompt = LEVEL_INSTRUCTIONS[level]
+    tone_prompt = TONE_INSTRUCTIONS[tone]
 
     system_prompt = (
         "You are a digital twin of a university professor. "
@@ -64,7 +100,7 @@ def answer_question(question: str, level: str, tone: str):
         "If the answer is not clearly present, say you cannot find it."
     )
 
-    user_prompt = f"""
+    user_prompt = f"""{history_section}
 Course materials context:
 
 {context_block}
@@ -80,17 +116,31 @@ Instructions:
 
 Question: {question}
 """
-
-    # Get client and make API call
-    client = get_client()
-    response = client.messages.create(
-        model=MODEL,
-        max_tokens=800,
-        system=system_prompt,
-        messages=[
-            {"role": "user", "content": user_prompt},
-        ],
-    )
+    return system_prompt, user_prompt
+
+
+def generate_answer(results, question: str, level: str, tone: str, route: str = "standard", history: str = "",
+                    priority: int = INTERACTIVE):
+    """Turn retrieval results into (answer_text, source_list) with one LLM call"""
+    settings = ROUTES[route]
+    with span("prompt_build"):
+        contexts = results["documents"][0]
+        sources_meta = results["metadatas"][0]
+        source_list = list({m["source"] for m in sources_meta if "source" in m})
+        system_prompt, user_prompt = build_prompts(contexts, question, level, tone, history)
+
+    # Admitted through the shared LLM gateway; raises LLMOverloaded when saturated
+    with span("llm"):
+        response = create_message(
+            priority=priority,
+            model=settings["model"],
+            max_tokens=settings["max_tokens"],
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+        )
+    record_llm_usage(response, settings["model"], f"answer_{route}")
 
     # Anthropic returns a list of content blocks
     answer_text = "".join(block.text for block in response.content)
@@ -98,23 +148,72 @@ Question: {question}
     return answer_text, source_list
 
 
+def _run_route(route: str, answer_fn, *args):
+    """Call answer_fn(*args) and record the route's latency"""
+    ROUTE_CHOSEN.inc(route=route)
+    start = time.perf_counter()
+    try:
+        return answer_fn(*args)
+    finally:
+        ROUTE_SECONDS.observe(time.perf_counter() - start, route=route)
+
+
+def answer_question(question: str, level: str, tone: str):
+    route = classify_question(question)
+    return _run_route(route, _answer_from_shared_materials, question, level, tone, route)
+
+
+def _answer_from_shared_materials(question: str, level: str, tone: str, route: str):
+    # RAG retrieval
+    with span("retrieval"):
+        results = query_collection(get_legacy_collection(), question, n_results=ROUTES[route]["n_results"])
+
+    if not results["documents"] or not results["documents"][0]:
+        return (
+            "I couldn't find anything in the uploaded course materials that answers this.",
+            [],
+        )
+
+    return generate_answer(results, question, level, tone, route)
+
+
 def answer_question_for_user(user_email: str, question: str, level: str, tone: str):
     """Answer a question using only documents belonging to the specified user"""
+    route = classify_question(question)
+    key = (f"user:{user_email}", normalize_question(question), level, tone)
+    answer, _ = _answers_in_flight.do(
+        key, lambda: _run_route(route, _answer_from_user_materials, user_email, question, level, tone, route)
+    )
+    return answer
+
+
+def _answer_from_user_materials(user_email: str, question: str, level: str, tone: str, route: str,
+                                search: str = None, history: str = ""):
     # Get all chunk IDs for this user
-    user_chunk_ids = get_user_chunk_ids(user_email)
-    
+    with span("index_load"):
+        user_chunk_ids = get_user_chunk_ids(user_email)
+
     if not user_chunk_ids:
         return (
             "You haven't uploaded any course materials yet. Please upload documents first.",
             [],
         )
-    
-    # Query only user's documents using where filter
-    results = collection.query(
-        query_texts=[question],
-        n_results=4,
-        where={"user": user_email}
-    )
+
+    # Query only user's documents in their shard. While a migration is moving
+    # them, a user's chunks may be split between the shard and the shared
+    # collection, so both are searched and the results merged.
+    n_results = ROUTES[route]["n_results"]
+    with span("retrieval"):
+        text = search or question
+        where = {"user": user_email}
+        embedding = embed_query(text)
+        found = []
+        shard = find_user_collection(user_email)
+        if shard is not None:
+            found.append(query_collection(shard, text, fetch_count(n_results), where, query_embedding=embedding))
+        if shard is None or user_has_legacy_chunks(user_email):
+            found.append(query_collection(get_legacy_collection(), text, fetch_count(n_results), where, query_embedding=embedding))
+        results = collapse_duplicates(merge_by_distance(found), n_results)
 
     if not results["documents"] or not results["documents"][0]:
         return (
@@ -122,92 +221,98 @@ def answer_question_for_user(user_email: str, question: str, level: str, tone: s
             [],
         )
 
-    contexts = results["documents"][0]
-    sources_meta = results["metadatas"][0]
-
-    context_block = "\n\n---\n\n".join(contexts)
-    source_list = list({m["source"] for m in sources_meta if "source" in m})
-
-    level_instructions = {
-        "beginner": "Explain as if the student is new to the topic. Use plain language, concrete examples, and analogies.",
-        "advanced": "Provide a concise, technical explanation assuming strong background knowledge.",
-    }
+    return generate_answer(results, question, level, tone, route, history)
 
-    style_prompt = level_instructions.get(level, level_instructions["beginner"])
 
-    tone_prompt = {
-        "friendly": "Use an encouraging, friendly tone.",
-        "neutral": "Use a clear and neutral tone.",
-        "formal": "Use a professional, formal academic tone.",
-    }.get(tone, "Use a clear and neutral tone.")
+def answer_question_for_class(class_id: str, user_email: str, question: str, level: str, tone: str):
+    """
+    Answer a question using documents from a specific class.
+    User must be a member (teacher or student) of the class.
+    """
+    # Verify membership
+    with span("membership_check"):
+        is_member = is_member_of_class(user_email, class_id)
+    if not is_member:
+        return (
+            "You are not a member of this class.",
+            [],
+        )
 
-    system_prompt = (
-        "You are a digital twin of a university professor. "
-        "Answer ONLY using the provided course materials. "
-        "If the answer is not clearly present, say you cannot find it."
+    # Membership is checked per caller; the answer itself is shared
+    route = classify_question(question)
+    key = (f"class:{class_id}", normalize_question(question), level, tone)
+    answer, _ = _answers_in_flight.do(
+        key, lambda: _run_route(route, _answer_from_class, class_id, question, level, tone, route)
     )
+    return answer
 
-    user_prompt = f"""
-Course materials context:
 
-{context_block}
-
----
-
-Instructions:
-- {style_prompt}
-- {tone_prompt}
-- Answer ONLY using the context.
-- Cite which document filenames were used.
-- If unclear, say: "This is not clearly specified in the course materials."
-
-Question: {question}
-"""
-
-    # Get client and make API call
-    client = get_client()
-    response = client.messages.create(
-        model=MODEL,
-        max_tokens=800,
-        system=system_prompt,
-        messages=[
-            {"role": "user", "content": user_prompt},
-        ],
+def merge_by_distance(results: list) -> dict:
+    """
+    Chroma-shaped results from several collections as one, nearest first. A
+    chunk found in more than one (mid-migration) is kept once.
+    """
+    results = [r for r in results if r["ids"] and r["ids"][0]]
+    if not results:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    if len(results) == 1:
+        return results[0]
+    rows = sorted(
+        ((r["distances"][0][i], chunk_id, r, i) for r in results for i, chunk_id in enumerate(r["ids"][0])),
+        key=lambda row: row[0],
     )
+    merged = {key: [[]] for key in ("ids", "documents", "metadatas", "distances")}
+    seen = set()
+    for _, chunk_id, r, i in rows:
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        for key in merged:
+            merged[key][0].append(r[key][0][i])
+    return merged
 
-    # Anthropic returns a list of content blocks
-    answer_text = "".join(block.text for block in response.content)
 
-    return answer_text, source_list
+def fetch_count(n_results: int) -> int:
+    """Chunks to retrieve so that n_results remain after collapsing near-duplicates"""
+    return n_results * 2 if DEDUP_MODE == "mark" else n_results
 
 
-def answer_question_for_class(class_id: str, user_email: str, question: str, level: str, tone: str):
+def search_class(class_collection, class_id: str, text: str, n_results: int) -> dict:
     """
-    Answer a question using documents from a specific class.
-    User must be a member (teacher or student) of the class.
+    Chunk search over a class. For classes with many materials the search is
+    limited to the documents whose summaries best match (see summary_index).
+    Near-duplicate chunks (see dedup) are collapsed to the best-ranked one.
     """
-    # Verify membership
-    if not is_member_of_class(user_email, class_id):
-        return (
-            "You are not a member of this class.",
-            [],
+    embedding = embed_query(text)
+    sources = route_sources(class_id, embedding)
+    if sources is not None:
+        results = query_collection(
+            class_collection, text, fetch_count(n_results), where={"source": {"$in": sources}}, query_embedding=embedding
         )
-    
-    # Get class-specific collection
-    collection_name = f"course_materials_{class_id}"
-    try:
-        class_collection = chroma_client.get_collection(collection_name)
-    except Exception:
+        if results["documents"] and results["documents"][0]:
+            ROUTED_SEARCHES.inc(mode="routed")
+            return collapse_duplicates(results, n_results)
+    ROUTED_SEARCHES.inc(mode="flat")
+    results = query_collection(class_collection, text, fetch_count(n_results), query_embedding=embedding)
+    return collapse_duplicates(results, n_results)
+
+
+def _answer_from_class(class_id: str, question: str, level: str, tone: str, route: str,
+                       search: str = None, history: str = "", priority: int = INTERACTIVE):
+    with span("retrieval"):
+        # Get class-specific collection
+        class_collection = find_class_collection(class_id)
+        if class_collection is None:
+            results = None
+        else:
+            # Query class documents
+            results = search_class(class_collection, class_id, search or question, ROUTES[route]["n_results"])
+
+    if results is None:
         return (
             "No materials have been uploaded to this class yet.",
             [],
         )
-    
-    # Query class documents
-    results = class_collection.query(
-        query_texts=[question],
-        n_results=4
-    )
 
     if not results["documents"] or not results["documents"][0]:
         return (
@@ -215,60 +320,29 @@ def answer_question_for_class(class_id: str, user_email: str, question: str, lev
             [],
         )
 
-    contexts = results["documents"][0]
-    sources_meta = results["metadatas"][0]
-
-    context_block = "\n\n---\n\n".join(contexts)
-    source_list = list({m["source"] for m in sources_meta if "source" in m})
-
-    level_instructions = {
-        "beginner": "Explain as if the student is new to the topic. Use plain language, concrete examples, and analogies.",
-        "advanced": "Provide a concise, technical explanation assuming strong background knowledge.",
-    }
+    return generate_answer(results, question, level, tone, route, history, priority)
 
-    style_prompt = level_instructions.get(level, level_instructions["beginner"])
 
-    tone_prompt = {
-        "friendly": "Use an encouraging, friendly tone.",
-        "neutral": "Use a clear and neutral tone.",
-        "formal": "Use a professional, formal academic tone.",
-    }.get(tone, "Use a clear and neutral tone.")
-
-    system_prompt = (
-        "You are a digital twin of a university professor. "
-        "Answer ONLY using the provided course materials. "
-        "If the answer is not clearly present, say you cannot find it."
-    )
-
-    user_prompt = f"""
-Course materials context:
-
-{context_block}
-
----
-
-Instructions:
-- {style_prompt}
-- {tone_prompt}
-- Answer ONLY using the context.
-- Cite which document filenames were used.
-- If unclear, say: "This is not clearly specified in the course materials."
-
-Question: {question}
-"""
-
-    # Get client and make API call
-    client = get_client()
-    response = client.messages.create(
-        model=MODEL,
-        max_tokens=800,
-        system=system_prompt,
-        messages=[
-            {"role": "user", "content": user_prompt},
-        ],
-    )
-
-    # Anthropic returns a list of content blocks
-    answer_text = "".join(block.text for block in response.content)
-
-    return answer_text, source_list
+def answer_in_conversation(conversation: dict, question: str, level: str, tone: str):
+    """
+    Answer a question in the context of a conversation (class membership is
+    checked by the caller). Retrieval uses a standalone rewrite of the
+    question; the prompt carries the bounded history. Follow-ups are not
+    coalesced, since their answers depend on the conversation.
+    Returns (answer_text, source_list, standalone_question)
+    """
+    standalone = rewrite_followup(conversation, question)
+    history = history_block(conversation)
+    HISTORY_TOKENS.observe(estimate_tokens(history))
+
+    route = classify_question(standalone)
+    class_id = conversation.get("class_id")
+    if class_id:
+        answer, sources = _run_route(
+            route, _answer_from_class, class_id, question, level, tone, route, standalone, history
+        )
+    else:
+        answer, sources = _run_route(
+            route, _answer_from_user_materials, conversation["user"], question, level, tone, route, standalone, history
+        )
+    return answer, sources, standalone
@@ -0,0 +1,67 @@
+"""
+Coalesce identical concurrent work.
+
+    result, shared = group.do(key, compute)
+
+The first caller for a key runs `compute`; callers that arrive with the same
+key while it is running wait for it and receive the same result (or the same
+exception) instead of repeating the work. Nothing is cached: once the call
+finishes, the next caller starts a fresh one. Coalescing is per process.
+"""
+import threading
+from metrics import Counter
+
+COALESCED_CALLS = Counter(
+    "teachtwin_coalesced_calls_total",
+    "Calls answered by joining an identical in-flight call",
+    ["group"],
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        """Returns (result, shared) where shared is True for callers that joined"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            COALESCED_CALLS.inc(group=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = compute()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,88 @@
+"""
+Portable collection snapshots.
+
+A snapshot is a zip file holding `manifest.json` (ids, documents, metadatas,
+collection metadata and any extra data the caller attaches) and
+`embeddings.npy` (one float32 row per chunk). Loading a snapshot writes the
+stored embeddings straight back into Chroma, so nothing is re-embedded.
+"""
+import io
+import os
+import json
+import zipfile
+import numpy as np
+from flat_index import bump_write_version
+
+SNAPSHOT_VERSION = 1
+
+
+def export_collection(collection, batch_size: int = 1000) -> dict:
+    """Read every chunk of a collection, embeddings included"""
+    snapshot = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    offset = 0
+    while True:
+        batch = collection.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not batch["ids"]:
+            break
+        snapshot["ids"].extend(batch["ids"])
+        snapshot["documents"].extend(batch["documents"])
+        snapshot["metadatas"].extend(batch["metadatas"])
+        snapshot["embeddings"].extend(batch["embeddings"])
+        offset += len(batch["ids"])
+
+    snapshot["collection_metadata"] = collection.metadata or {}
+    return snapshot
+
+
+def write_snapshot(path_or_file, snapshot: dict, extra: dict = None):
+    """
+    Write a snapshot to a path or a binary file object. Paths are written
+    atomically (to a temp file, then renamed into place).
+    """
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "collection_metadata": snapshot.get("collection_metadata", {}),
+        "ids": snapshot["ids"],
+        "documents": snapshot["documents"],
+        "metadatas": snapshot["metadatas"],
+        "extra": extra or {},
+    }
+    embeddings = np.asarray(snapshot["embeddings"], dtype=np.float32)
+
+    target = path_or_file + ".tmp" if isinstance(path_or_file, str) else path_or_file
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr("manifest.json", json.dumps(manifest))
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings)
+        bundle.writestr("embeddings.npy", buffer.getvalue())
+    if isinstance(path_or_file, str):
+        os.replace(target, path_or_file)
+
+
+def read_snapshot(path_or_file) -> dict:
+    """Inverse of write_snapshot. Accepts a path or a binary file object."""
+    with zipfile.ZipFile(path_or_file, "r") as bundle:
+        manifest = json.loads(bundle.read("manifest.json"))
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+        embeddings = np.load(io.BytesIO(bundle.read("embeddings.npy")))
+    manifest["embeddings"] = embeddings
+    return manifest
+
+
+def load_snapshot(collection, snapshot: dict, batch_size: int = 1000):
+    """Bulk-write a snapshot's chunks, with their stored embeddings, into a collection (existing ids are overwritten)"""
+    ids = snapshot["ids"]
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            documents=snapshot["documents"][start:end],
+            metadatas=snapshot["metadatas"][start:end],
+            embeddings=snapshot["embeddings"][start:end],
+        )
+    bump_write_version(collection.name)
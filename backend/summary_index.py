@@ -0,0 +1,190 @@
+"""
+Coarse-to-fine retrieval for classes with many materials.
+
+Each material's summary (written by generate_summary at upload) is embedded
+into a small per-class routing index. A question is first matched against
+those summaries to pick the SUMMARY_ROUTING_TOP_DOCUMENTS best documents,
+and the chunk search then runs only within them, instead of over every chunk
+of every file.
+
+SUMMARY_ROUTING=auto (the default) routes classes with at least
+SUMMARY_ROUTING_MIN_DOCUMENTS materials; small classes keep flat search,
+which is already fast and cannot miss a document. Materials without a usable
+summary are always searched.
+
+Summary embeddings are cached in memory and in ./data/summary_index, keyed
+by a hash of each summary, so only new or regenerated summaries are embedded.
+"""
+import os
+import hashlib
+import threading
+from typing import List, Optional
+import numpy as np
+from user_storage import load_class_files_index, CLASS_FILES_INDEX
+from vectorstore import embed_texts
+from metrics import span, Counter
+
+SUMMARY_INDEX_DIR = "./data/summary_index"
+SUMMARY_ROUTING = os.environ.get("SUMMARY_ROUTING", "auto").lower()  # off | auto | on
+SUMMARY_ROUTING_MIN_DOCUMENTS = int(os.environ.get("SUMMARY_ROUTING_MIN_DOCUMENTS", "20"))
+SUMMARY_ROUTING_TOP_DOCUMENTS = int(os.environ.get("SUMMARY_ROUTING_TOP_DOCUMENTS", "8"))
+
+# generate_summary's fallback when the LLM call failed
+UNAVAILABLE_SUMMARY = "Summary not available"
+
+ROUTED_SEARCHES = Counter(
+    "teachtwin_summary_routing_total",
+    "Class searches by retrieval mode (routed through summaries or flat)",
+    ["mode"],
+)
+
+
+class SummaryIndex:
+    """Normalised summary embeddings for one class, plus the materials that have none"""
+
+    def __init__(self, filenames: List[str], hashes: List[str], matrix: np.ndarray, unrouted: List[str]):
+        self.filenames = filenames
+        self.hashes = hashes
+        self.matrix = matrix
+        self.unrouted = unrouted
+
+    def __len__(self):
+        return len(self.filenames) + len(self.unrouted)
+
+    def top_sources(self, query_embedding, n: int) -> List[str]:
+        """The n documents whose summaries best match the query, plus every unrouted one"""
+        top = []
+        if self.filenames:
+            q = np.asarray(query_embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(q))
+            scores = self.matrix @ (q / norm if norm else q)
+            k = min(n, len(self.filenames))
+            best = np.argpartition(-scores, k - 1)[:k]
+            top = [self.filenames[i] for i in best[np.argsort(-scores[best])]]
+        return top + self.unrouted
+
+
+def _routing_text(filename: str, summary: str) -> str:
+    return f"{filename}: {summary}"
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _disk_path(class_id: str) -> str:
+    return os.path.join(SUMMARY_INDEX_DIR, f"{class_id}.npz")
+
+
+def _load_disk(class_id: str) -> dict:
+    """hash -> embedding from the on-disk cache"""
+    try:
+        with np.load(_disk_path(class_id)) as data:
+            return dict(zip(data["hashes"].tolist(), data["matrix"]))
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _save_disk(class_id: str, index: SummaryIndex):
+    try:
+        os.makedirs(SUMMARY_INDEX_DIR, exist_ok=True)
+        path = _disk_path(class_id)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, hashes=np.array(index.hashes), matrix=index.matrix)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Error saving summary index for {class_id}: {e}")
+
+
+# class_id -> (class files index version, SummaryIndex)
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _index_version():
+    try:
+        st = os.stat(CLASS_FILES_INDEX)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+def get_summary_index(class_id: str) -> SummaryIndex:
+    """
+    The class's routing index, rebuilt when class_files_index.json changes.
+    Only summaries not seen before are embedded.
+    """
+    version = _index_version()
+    with _lock:
+        cached = _indexes.get(class_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    if cached:
+        known = dict(zip(cached[1].hashes, cached[1].matrix))
+    else:
+        known = _load_disk(class_id)
+
+    filenames, hashes, texts, unrouted = [], [], [], []
+    for filename, entry in load_class_files_index().get(class_id, {}).items():
+        summary = (entry.get("summary") or "").strip()
+        if not summary or summary == UNAVAILABLE_SUMMARY:
+            unrouted.append(filename)
+            continue
+        text = _routing_text(filename, summary)
+        filenames.append(filename)
+        hashes.append(_hash(text))
+        texts.append(text)
+
+    missing = [i for i, h in enumerate(hashes) if h not in known]
+    if missing:
+        with span("summary_embed"):
+            for i, embedding in zip(missing, embed_texts(texts[i] for i in missing)):
+                known[hashes[i]] = np.asarray(embedding, dtype=np.float32)
+
+    dim = len(next(iter(known.values()))) if known else 0
+    matrix = np.array([known[h] for h in hashes], dtype=np.float32).reshape(len(hashes), dim)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+    index = SummaryIndex(filenames, hashes, matrix, unrouted)
+
+    if missing:
+        _save_disk(class_id, index)
+    with _lock:
+        _indexes[class_id] = (version, index)
+    return index
+
+
+def routing_enabled(document_count: int) -> bool:
+    if SUMMARY_ROUTING == "on":
+        return True
+    if SUMMARY_ROUTING == "auto":
+        return document_count >= SUMMARY_ROUTING_MIN_DOCUMENTS
+    return False
+
+
+def route_sources(class_id: str, query_embedding, top_documents: int = None) -> Optional[List[str]]:
+    """
+    Filenames the chunk search should be limited to, or None to search the
+    whole class (routing off, too few documents, or nothing to narrow).
+    """
+    if SUMMARY_ROUTING not in ("on", "auto"):
+        return None
+    if top_documents is None:
+        top_documents = SUMMARY_ROUTING_TOP_DOCUMENTS
+    with span("summary_route"):
+        index = get_summary_index(class_id)
+        if not routing_enabled(len(index)) or len(index) <= top_documents:
+            return None
+        sources = index.top_sources(query_embedding, top_documents)
+    return sources or None
+
+
+def discard_summary_index(class_id: str):
+    """Forget a deleted class's routing index"""
+    with _lock:
+        _indexes.pop(class_id, None)
+    try:
+        os.remove(_disk_path(class_id))
+    except OSError:
+        pass
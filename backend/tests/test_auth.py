@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("flask")
+bcrypt = pytest.importorskip("bcrypt")
+
+import auth
+from auth import PasswordHashBusy, authenticate_user, hash_rounds, load_users, register_user, save_users
+
+EMAIL = "ada@example.com"
+
+
+@pytest.fixture(autouse=True)
+def users_file(tmp_path, monkeypatch):
+    # users.json lives under ./data relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(auth, "_users_cache", None)
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    return tmp_path / "data" / "users.json"
+
+
+def test_hash_rounds_reads_the_cost_factor():
+    assert hash_rounds("$2b$12$" + "a" * 53) == 12
+    assert hash_rounds(bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=5)).decode()) == 5
+    assert hash_rounds("not a bcrypt hash") is None
+
+
+def test_a_full_queue_is_turned_away_with_retry_after(monkeypatch):
+    monkeypatch.setattr(auth, "PASSWORD_HASH_CONCURRENCY", 2)
+    monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_QUEUE", 2)
+    monkeypatch.setattr(auth, "_hash_seconds", 0.9)
+    monkeypatch.setattr(auth, "_pending", 4)
+
+    with pytest.raises(PasswordHashBusy) as busy:
+        auth._run_in_pool(lambda: "never run")
+    # Four hashes of 0.9s each, two at a time
+    assert busy.value.retry_after == 2
+    assert auth._pending == 4
+
+    monkeypatch.setattr(auth, "_pending", 3)
+    assert auth._run_in_pool(lambda x: x * 2, 21) == 42
+    assert auth._pending == 3
+
+
+def test_login_rehashes_at_the_configured_cost(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    register_user(EMAIL, "secret", "Ada")
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+
+    user, error = authenticate_user(EMAIL, "secret")
+
+    assert error is None
+    assert user["email"] == EMAIL
+    stored = load_users()[EMAIL]["password"]
+    assert hash_rounds(stored) == 4
+    assert authenticate_user(EMAIL, "secret")[1] is None
+
+
+def test_rehash_does_not_overwrite_a_password_changed_meanwhile(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    register_user(EMAIL, "secret", "Ada")
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    changed = bcrypt.hashpw(b"new secret", bcrypt.gensalt(rounds=4)).decode()
+    hash_password = auth.hash_password
+
+    def change_password_while_hashing(password):
+        # Another request saves a new password while the rehash is computed
+        users = load_users()
+        users[EMAIL]["password"] = changed
+        save_users(users)
+        return hash_password(password)
+
+    monkeypatch.setattr(auth, "hash_password", change_password_while_hashing)
+    assert authenticate_user(EMAIL, "secret")[1] is None
+
+    assert load_users()[EMAIL]["password"] == changed
+
+
+def test_busy_pool_skips_the_rehash_but_not_the_login(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    register_user(EMAIL, "secret", "Ada")
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    stored = load_users()[EMAIL]["password"]
+
+    def busy(password):
+        raise PasswordHashBusy("Too many logins in progress, try again shortly", 1)
+
+    monkeypatch.setattr(auth, "hash_password", busy)
+    assert authenticate_user(EMAIL, "secret")[1] is None
+
+    assert load_users()[EMAIL]["password"] == stored
@@ -0,0 +1,46 @@
+from conversations import history_block, is_followup
+from llm import CHARS_PER_TOKEN
+
+
+def turn(n: int, words: int = 5) -> dict:
+    return {"question": f"Question {n}?", "answer": " ".join([f"answer{n}"] * words)}
+
+
+def conversation(turns, summary="", summarized_turns=0) -> dict:
+    return {"summary": summary, "summarized_turns": summarized_turns, "turns": turns}
+
+
+def test_history_has_summary_then_unsummarized_turns_in_order():
+    block = history_block(conversation([turn(1), turn(2), turn(3)], "Covered density.", summarized_turns=1), 1000)
+
+    assert block.startswith("Summary of the earlier conversation:\nCovered density.")
+    assert "Question 1?" not in block
+    assert block.index("Question 2?") < block.index("Question 3?")
+
+
+def test_history_keeps_the_newest_turns_within_budget():
+    turns = [turn(n, words=40) for n in range(1, 11)]
+    budget = 200
+    block = history_block(conversation(turns, "Covered density."), budget)
+
+    assert "Question 10?" in block
+    assert "Question 1?" not in block
+    # Every part is clipped to what is left of the budget; only the separators add to it
+    assert len(block) <= budget * CHARS_PER_TOKEN + 2 * len(turns)
+
+
+def test_summary_alone_is_clipped_to_the_budget():
+    block = history_block(conversation([], "word " * 1000), 50)
+
+    assert block.endswith("...")
+    assert len(block) <= 50 * CHARS_PER_TOKEN
+
+
+def test_empty_conversation_has_no_history():
+    assert history_block(conversation([])) == ""
+
+
+def test_followups_are_detected():
+    assert is_followup("Can you explain that more simply?")
+    assert is_followup("and for gases")
+    assert not is_followup("How is molar mass calculated from a chemical formula?")
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import dedup
+from dedup import (
+    DuplicateIndex, NO_DUP_GROUP, signature, similarity, detect_duplicates, forget_chunks, collapse_duplicates,
+    load_index,
+)
+
+PASSAGE = (
+    "Density is the mass of a substance per unit volume. To measure it, weigh the sample on the balance, "
+    "find its volume by water displacement in a graduated cylinder, and divide the mass by the volume. "
+    "Report the result in grams per cubic centimetre with the correct number of significant figures."
+)
+EDITED = PASSAGE + " Bring your notebook."
+OTHER = (
+    "Titration finds the concentration of an acid by adding base of known molarity from a burette until "
+    "the indicator changes colour, then using the volume added at the end point to work out the moles."
+)
+
+
+@pytest.fixture(autouse=True)
+def dedup_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_DIR", str(tmp_path))
+    monkeypatch.setattr(dedup, "DEDUP_MODE", "mark")
+    dedup._cache.clear()
+    return tmp_path
+
+
+def test_signatures_estimate_jaccard_similarity():
+    assert similarity(signature(PASSAGE), signature(PASSAGE)) == 1.0
+    assert similarity(signature(PASSAGE), signature(EDITED)) >= dedup.DEDUP_THRESHOLD
+    assert similarity(signature(PASSAGE), signature(OTHER)) < 0.2
+    assert signature("   ") is None
+
+
+def test_lsh_finds_near_duplicates_only():
+    index = DuplicateIndex()
+    index.add("a:0", signature(PASSAGE), "a:0")
+    index.add("a:1", signature(OTHER), "a:1")
+
+    chunk_id, group, score = index.find(signature(EDITED))
+    assert (chunk_id, group) == ("a:0", "a:0")
+    assert score >= dedup.DEDUP_THRESHOLD
+    assert index.find(signature("Completely unrelated notes about the history of the periodic table.")) is None
+
+    index.remove(["a:0"])
+    assert index.find(signature(EDITED)) is None
+    assert len(index) == 1
+
+
+def test_detect_duplicates_tags_every_chunk_and_persists_the_index(dedup_dir):
+    metadatas = [{}, {}]
+    keep = detect_duplicates("class_x", ["v1:0", "v1:1"], [PASSAGE, OTHER], metadatas)
+    assert keep == [True, True]
+    assert metadatas == [{"dup_group": NO_DUP_GROUP}, {"dup_group": NO_DUP_GROUP}]
+
+    metadatas = [{}]
+    detect_duplicates("class_x", ["v2:0"], [EDITED], metadatas)
+    assert metadatas == [{"dup_group": "v1:0"}]
+
+    assert len(load_index("class_x")) == 3
+    assert not os.path.exists(dedup_dir / "class_x.lock")
+
+
+def test_a_reupload_that_is_no_longer_a_duplicate_clears_its_group():
+    detect_duplicates("class_x", ["v1:0"], [PASSAGE], [{}])
+    detect_duplicates("class_x", ["v2:0"], [EDITED], [{}])
+
+    metadatas = [{}]
+    detect_duplicates("class_x", ["v2:0"], [OTHER], metadatas, replaced_ids=["v2:0"])
+    assert metadatas == [{"dup_group": NO_DUP_GROUP}]
+
+
+def test_skip_mode_drops_duplicates(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_MODE", "skip")
+    keep = detect_duplicates("class_x", ["v1:0", "v2:0"], [PASSAGE, EDITED], [{}, {}])
+
+    assert keep == [True, False]
+    assert len(load_index("class_x")) == 1
+
+
+def test_forgotten_chunks_no_longer_match():
+    detect_duplicates("class_x", ["v1:0"], [PASSAGE], [{}])
+    forget_chunks("class_x", ["v1:0"])
+
+    metadatas = [{}]
+    detect_duplicates("class_x", ["v2:0"], [EDITED], metadatas)
+    assert metadatas == [{"dup_group": NO_DUP_GROUP}]
+
+
+def test_collapse_keeps_the_best_ranked_chunk_of_each_group():
+    results = {
+        "ids": [["v2:0", "v1:0", "v1:1", "v3:0"]],
+        "documents": [["edited", "original", "other", "third"]],
+        "metadatas": [[{"dup_group": "v1:0"}, {"dup_group": NO_DUP_GROUP}, {"dup_group": NO_DUP_GROUP}, {}]],
+        "distances": [[0.1, 0.2, 0.3, 0.4]],
+    }
+    collapsed = collapse_duplicates(results, 2)
+
+    assert collapsed["ids"] == [["v2:0", "v1:1"]]
+    assert collapsed["documents"] == [["edited", "other"]]
+    assert collapsed["distances"] == [[0.1, 0.3]]
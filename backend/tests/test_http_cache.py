@@ -0,0 +1,62 @@
+import pytest
+
+flask = pytest.importorskip("flask")
+
+from http_cache import paginate, select_fields, make_etag, not_modified, _decode_cursor
+
+ITEMS = [{"filename": name, "summary": f"About {name}"} for name in ("c.pdf", "a.pdf", "e.pdf", "b.pdf", "d.pdf")]
+
+
+def test_without_limit_or_cursor_the_list_is_unchanged():
+    page, next_cursor = paginate(ITEMS, "filename", None, None)
+
+    assert page is ITEMS
+    assert next_cursor is None
+
+
+def test_pages_walk_the_sorted_list_by_cursor():
+    seen = []
+    cursor = None
+    while True:
+        page, next_cursor = paginate(ITEMS, "filename", 2, cursor)
+        seen.extend(item["filename"] for item in page)
+        if next_cursor is None:
+            break
+        cursor = _decode_cursor(next_cursor)
+
+    assert seen == ["a.pdf", "b.pdf", "c.pdf", "d.pdf", "e.pdf"]
+
+
+def test_last_full_page_has_no_next_cursor():
+    page, next_cursor = paginate(ITEMS, "filename", 5, None)
+
+    assert len(page) == 5
+    assert next_cursor is None
+
+
+def test_select_fields_keeps_the_pagination_key():
+    assert select_fields(ITEMS[:1], ["summary"], always=("filename",)) == [ITEMS[0]]
+    assert select_fields(ITEMS[:1], ["missing"], always=("filename",)) == [{"filename": "c.pdf"}]
+
+
+def test_etag_depends_on_parts_and_query_string():
+    app = flask.Flask(__name__)
+    with app.test_request_context("/files"):
+        etag = make_etag("user@example.com", ("v", 1))
+        assert etag == make_etag("user@example.com", ("v", 1))
+        assert etag != make_etag("user@example.com", ("v", 2))
+    with app.test_request_context("/files?limit=2"):
+        assert etag != make_etag("user@example.com", ("v", 1))
+
+
+def test_not_modified_matches_plain_and_gzip_tags():
+    app = flask.Flask(__name__)
+    etag = '"abc123"'
+    with app.test_request_context("/files", headers={"If-None-Match": etag}):
+        assert not_modified(etag).status_code == 304
+    with app.test_request_context("/files", headers={"If-None-Match": '"abc123-gzip"'}):
+        assert not_modified(etag).status_code == 304
+    with app.test_request_context("/files", headers={"If-None-Match": '"other"'}):
+        assert not_modified(etag) is None
+    with app.test_request_context("/files"):
+        assert not_modified(etag) is None
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from llm import LLMGateway, LLMOverloaded, INTERACTIVE, BACKGROUND
+
+
+def make_gateway(max_concurrency=1, tokens_per_minute=0, max_queue=8, max_wait=5.0):
+    return LLMGateway(max_concurrency, tokens_per_minute, max_queue, {INTERACTIVE: max_wait, BACKGROUND: max_wait})
+
+
+def test_admits_up_to_max_concurrency_without_waiting():
+    gateway = make_gateway(max_concurrency=2)
+
+    assert gateway.acquire(INTERACTIVE, 10) < 0.1
+    assert gateway.acquire(INTERACTIVE, 10) < 0.1
+    assert gateway.in_flight == 2
+
+
+def test_interactive_calls_go_ahead_of_background_calls(wait_for):
+    gateway = make_gateway()
+    gateway.acquire(INTERACTIVE, 10)
+    admitted = []
+
+    def call(priority, name):
+        gateway.acquire(priority, 10)
+        admitted.append(name)
+        gateway.release(10)
+
+    background = threading.Thread(target=call, args=(BACKGROUND, "background"))
+    background.start()
+    wait_for(lambda: gateway.queue_depth == 1)
+    interactive = threading.Thread(target=call, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    wait_for(lambda: gateway.queue_depth == 2)
+
+    gateway.release(10)
+    background.join(2)
+    interactive.join(2)
+
+    assert admitted == ["interactive", "background"]
+    assert gateway.in_flight == 0
+
+
+def test_full_queue_raises_overloaded_with_retry_after():
+    gateway = make_gateway(max_queue=0)
+    gateway.acquire(INTERACTIVE, 10)
+
+    with pytest.raises(LLMOverloaded) as excinfo:
+        gateway.acquire(INTERACTIVE, 10)
+    assert excinfo.value.retry_after >= 1
+    assert gateway.queue_depth == 0
+
+
+def test_token_budget_makes_callers_wait_then_time_out():
+    # One token per second
+    gateway = make_gateway(max_concurrency=4, tokens_per_minute=60, max_wait=0.1)
+    gateway.acquire(INTERACTIVE, 60)
+
+    with pytest.raises(LLMOverloaded) as excinfo:
+        gateway.acquire(INTERACTIVE, 30)
+    assert excinfo.value.retry_after >= 29
+    assert gateway.queue_depth == 0
+
+
+def test_release_returns_unused_tokens_to_the_budget():
+    gateway = make_gateway(max_concurrency=4, tokens_per_minute=60, max_wait=0.1)
+    gateway.acquire(INTERACTIVE, 60)
+    gateway.release(60, used=10)
+
+    assert gateway.acquire(INTERACTIVE, 40) < 0.1
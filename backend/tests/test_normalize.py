@@ -0,0 +1,71 @@
+from normalize import normalize_pages
+
+TOPICS = ["Density", "Boiling points", "Molar mass", "Titration", "Gas laws", "Enthalpy", "Rates", "Equilibrium"]
+
+HEADER = "CHEM 101 - Fall Term"
+FOOTER = "Copyright University of Example, all rights reserved"
+
+
+def numeric_handout(pages: int = 8) -> list:
+    out = []
+    for page in range(1, pages + 1):
+        lines = [
+            HEADER,
+            f"{TOPICS[page - 1]} lab",
+            f"This week covers {TOPICS[page - 1].lower()}.",
+            "Subject",
+            "Value",
+            "42",
+            "3.14",
+            str(100 + page),
+            FOOTER,  # extracted mid-page, between the table and the notes
+            "Sample",
+            "7",
+            f"Bring your {TOPICS[page - 1].lower()} results to the next lab.",
+            f"Questions about {TOPICS[page - 1].lower()} go to the forum.",
+            f"Page {page} of {pages}",
+        ]
+        out.append("\n".join(lines))
+    return out
+
+
+def test_numeric_tables_are_kept():
+    text, _ = normalize_pages(numeric_handout())
+    lines = text.splitlines()
+
+    for value in ("Subject", "Value", "Sample", "42", "3.14", "7", "101", "108"):
+        assert value in lines
+    assert lines.count("42") == 8
+    assert lines.count("Value") == 8
+
+
+def test_headers_footers_and_page_numbers_are_removed():
+    text, stats = normalize_pages(numeric_handout())
+
+    assert HEADER not in text
+    assert FOOTER not in text
+    assert "Page 3 of 8" not in text
+    assert "Molar mass lab" in text
+    assert stats["lines_removed"] == 8 * 3
+
+
+def test_single_trailing_number_is_kept():
+    pages = numeric_handout()
+    pages[2] += "\nTotal\n1250"
+    text, stats = normalize_pages(pages)
+    lines = text.splitlines()
+
+    assert lines[lines.index("Total") + 1] == "1250"
+    assert "Page 3 of 8" not in text
+    assert stats["lines_removed"] == 8 * 3
+
+
+def test_bare_page_numbers_with_an_offset_are_removed():
+    pages = [f"Unit {page} notes\nSome content about unit {page}.\n{page + 10}" for page in range(1, 7)]
+    pages[4] += "\n250"
+    text, _ = normalize_pages(pages)
+    lines = text.splitlines()
+
+    for page in range(1, 7):
+        assert str(page + 10) not in lines
+    assert "250" in lines
@@ -0,0 +1,65 @@
+import pytest
+
+from classes_storage import parse_roster_csv, create_class, add_members_bulk, remove_members_bulk, load_memberships
+
+TEACHER = "teacher@example.com"
+
+
+@pytest.fixture
+def class_id(tmp_path, monkeypatch):
+    # The stores live under ./data relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    class_id, error = create_class(TEACHER, "Chemistry")
+    assert error is None
+    return class_id
+
+
+def test_roster_uses_the_email_column_of_a_header_row():
+    text = "name,Email\nAda,ada@example.com\n\nAlan, alan@example.com \nGrace\n"
+
+    assert parse_roster_csv(text) == ["ada@example.com", "alan@example.com", ""]
+
+
+def test_roster_without_a_header_uses_the_first_column():
+    text = "ada@example.com,Ada\nalan@example.com\n"
+
+    assert parse_roster_csv(text) == ["ada@example.com", "alan@example.com"]
+    assert parse_roster_csv("\n  \n") == []
+
+
+def test_bulk_add_reports_every_row(class_id):
+    emails = ["ada@example.com", "not-an-email", "ada@example.com", TEACHER, "alan@example.com"]
+    results, error = add_members_bulk(class_id, TEACHER, emails)
+
+    assert error is None
+    assert [r["status"] for r in results] == ["added", "error", "error", "already_member", "added"]
+    assert [r["row"] for r in results] == [1, 2, 3, 4, 5]
+    members = load_memberships()[class_id]
+    assert members["ada@example.com"]["role"] == "student"
+    assert "alan@example.com" in members
+
+
+def test_bulk_add_dry_run_saves_nothing(class_id):
+    results, error = add_members_bulk(class_id, TEACHER, ["ada@example.com"], dry_run=True)
+
+    assert error is None
+    assert results[0]["status"] == "added"
+    assert "ada@example.com" not in load_memberships()[class_id]
+
+
+def test_only_teachers_manage_the_roster(class_id):
+    add_members_bulk(class_id, TEACHER, ["ada@example.com"])
+
+    assert add_members_bulk(class_id, "ada@example.com", ["alan@example.com"]) == (
+        None, "Only teachers can manage the class roster"
+    )
+    assert remove_members_bulk(class_id, "ada@example.com", [TEACHER])[0] is None
+
+
+def test_bulk_remove_keeps_teachers(class_id):
+    add_members_bulk(class_id, TEACHER, ["ada@example.com", "alan@example.com"])
+    results, error = remove_members_bulk(class_id, TEACHER, ["ada@example.com", TEACHER, "nobody@example.com"])
+
+    assert error is None
+    assert [r["status"] for r in results] == ["removed", "error", "not_member"]
+    assert set(load_memberships()[class_id]) == {TEACHER, "alan@example.com"}
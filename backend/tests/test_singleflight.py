@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def waiters(group, key) -> int:
+    with group._lock:
+        call = group._calls.get(key)
+        return call.waiters if call is not None else -1
+
+
+def run_concurrently(group, key, compute, callers):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(group.do(key, compute))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_callers_share_one_call(wait_for):
+    group = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return "answer"
+
+    threads, results, errors = run_concurrently(group, "q", compute, 5)
+    wait_for(lambda: waiters(group, "q") == 4)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert not errors
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 4
+    assert group.in_flight() == 0
+
+
+def test_joiners_receive_the_leaders_exception(wait_for):
+    group = SingleFlight("test")
+    release = threading.Event()
+
+    def compute():
+        release.wait(2)
+        raise ValueError("boom")
+
+    threads, results, errors = run_concurrently(group, "q", compute, 3)
+    wait_for(lambda: waiters(group, "q") == 2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert not results
+    assert len(errors) == 3
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_nothing_is_cached_after_a_call_finishes():
+    group = SingleFlight("test")
+    counter = iter(range(10))
+
+    assert group.do("q", lambda: next(counter)) == (0, False)
+    assert group.do("q", lambda: next(counter)) == (1, False)
+
+
+def test_different_keys_do_not_coalesce():
+    group = SingleFlight("test")
+
+    assert group.do("a", lambda: "a") == ("a", False)
+    assert group.do("b", lambda: "b") == ("b", False)
+    with pytest.raises(KeyError):
+        group.do("c", lambda: {}["missing"])
+    assert group.in_flight() == 0
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import top_questions
+from top_questions import (
+    wanted_answers, materials_changed, load_answers, list_top_questions, flush_question_log, _save, _answers_path,
+    _log_path,
+)
+
+CLASS_ID = "class_x"
+
+
+@pytest.fixture(autouse=True)
+def top_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(top_questions, "TOP_QUESTIONS_DIR", str(tmp_path))
+    monkeypatch.setattr(top_questions, "PRECOMPUTE_TOP_QUESTIONS", 2)
+    monkeypatch.setattr(top_questions, "PRECOMPUTE_MIN_ASKS", 3)
+    monkeypatch.setattr(top_questions, "_answers_cache", {})
+    monkeypatch.setattr(top_questions, "_pending", {})
+    return tmp_path
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    runs = []
+    monkeypatch.setattr(top_questions, "schedule_precompute", lambda class_id, *args, **kwargs: runs.append(class_id))
+    return runs
+
+
+def entry(question: str, variants: dict) -> dict:
+    return {"question": question, "count": sum(variants.values()), "variants": variants, "last_asked": 0}
+
+
+LOG = {
+    "what is density": entry("What is density?", {"beginner|neutral": 2, "advanced|formal": 7}),
+    "define molarity": entry("Define molarity.", {"beginner|neutral": 5}),
+    "what is a mole": entry("What is a mole?", {"beginner|neutral": 4}),
+    "when is the exam": entry("When is the exam?", {"beginner|neutral": 2}),
+}
+
+
+def answer(version: int) -> dict:
+    return {"question": "What is density?", "answer": "Mass per volume.", "sources": [], "route": "lookup",
+            "computed_at": 0, "version": version}
+
+
+def test_wanted_answers_are_the_top_questions_in_every_variant_asked():
+    assert wanted_answers(LOG) == [
+        ("what is density|advanced|formal", ("What is density?", "advanced", "formal")),
+        ("what is density|beginner|neutral", ("What is density?", "beginner", "neutral")),
+        ("define molarity|beginner|neutral", ("Define molarity.", "beginner", "neutral")),
+    ]
+
+
+def test_questions_below_the_minimum_are_never_wanted(monkeypatch):
+    monkeypatch.setattr(top_questions, "PRECOMPUTE_TOP_QUESTIONS", 10)
+
+    keys = [key for key, _ in wanted_answers(LOG)]
+    assert "what is a mole|beginner|neutral" in keys
+    assert not any(key.startswith("when is the exam") for key in keys)
+
+
+def test_a_materials_change_invalidates_answers_of_the_old_version(top_dir, scheduled):
+    _save(_log_path(CLASS_ID), LOG)
+    _save(_answers_path(CLASS_ID), {"version": 1, "changed_at": 0, "answers": {"what is density|advanced|formal": answer(1)}})
+    density = list_top_questions(CLASS_ID)[0]
+    assert density["variants"][0]["precomputed"]["materials_version"] == 1
+
+    materials_changed(CLASS_ID)
+
+    data = load_answers(CLASS_ID)
+    assert data["version"] == 2
+    assert "what is density|advanced|formal" in data["answers"]
+    assert list_top_questions(CLASS_ID)[0]["variants"][0]["precomputed"] is None
+    assert scheduled == [CLASS_ID]
+    assert not os.path.exists(_answers_path(CLASS_ID) + ".lock")
+
+
+def test_a_flush_schedules_a_run_only_for_missing_answers(scheduled):
+    _save(_log_path(CLASS_ID), LOG)
+    current = {key: answer(1) for key, _ in wanted_answers(LOG)}
+    _save(_answers_path(CLASS_ID), {"version": 1, "changed_at": 0, "answers": current})
+
+    top_questions._pending[CLASS_ID] = {("what is density", "beginner|neutral"): ("What is density?", 1)}
+    flush_question_log()
+    assert scheduled == []
+    assert top_questions._load(_log_path(CLASS_ID))["what is density"]["count"] == 10
+
+    # Asked often enough to overtake "define molarity", which has an answer
+    top_questions._pending[CLASS_ID] = {("what is a mole", "beginner|neutral"): ("What is a mole?", 2)}
+    flush_question_log()
+    assert scheduled == [CLASS_ID]
+
+
+def test_lookup_serves_only_current_answers(scheduled):
+    pytest.importorskip("query")
+    from top_questions import lookup_answer
+
+    _save(_answers_path(CLASS_ID), {"version": 1, "changed_at": 0, "answers": {"what is density|advanced|formal": answer(1)}})
+    assert lookup_answer(CLASS_ID, "  What is DENSITY ", "advanced", "formal")["answer"] == "Mass per volume."
+    assert lookup_answer(CLASS_ID, "What is density?", "beginner", "neutral") is None
+
+    materials_changed(CLASS_ID)
+    assert lookup_answer(CLASS_ID, "What is density?", "advanced", "formal") is None
@@ -0,0 +1,84 @@
+import io
+
+import pytest
+
+import uploads
+from uploads import create_upload, get_upload, write_part
+
+OWNER = "ada@example.com"
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_SPOOL_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(uploads, "UPLOAD_PART_SIZE", 8)
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 20)
+    return tmp_path / "uploads"
+
+
+class DroppedStream:
+    """A request body whose connection drops after `data` has been read"""
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def read(self, size: int) -> bytes:
+        block = self.data.read(size)
+        if not block:
+            raise ConnectionResetError("client disconnected")
+        return block
+
+
+def test_create_upload_validates_name_and_size():
+    assert create_upload(OWNER, "", 10) == (None, "filename is required")
+    assert create_upload(OWNER, "notes.pdf", 0)[1] == "size must be a positive number of bytes"
+    assert create_upload(OWNER, "notes.pdf", True)[1] == "size must be a positive number of bytes"
+    assert create_upload(OWNER, "notes.pdf", 21) == (None, "File is larger than the 20 byte limit")
+
+    session, error = create_upload(OWNER, "../../notes.pdf", 20)
+    assert error is None
+    assert session["filename"] == "notes.pdf"
+    assert (session["offset"], session["part_size"], session["complete"]) == (0, 8, False)
+    assert get_upload(OWNER, session["upload_id"]) == session
+    assert get_upload("alan@example.com", session["upload_id"]) is None
+
+
+def test_parts_must_start_at_the_current_offset():
+    session, _ = create_upload(OWNER, "notes.pdf", 12)
+    session, error = write_part(session, 0, io.BytesIO(b"abcdefgh"), 8)
+    assert error is None
+    assert session["offset"] == 8
+
+    # A repeated part (the client never saw the reply) is refused with the real offset
+    session, error = write_part(session, 0, io.BytesIO(b"abcdefgh"), 8)
+    assert error == "offset_mismatch"
+    assert session["offset"] == 8
+
+    session, error = write_part(session, 8, io.BytesIO(b"ijkl"), 4)
+    assert error is None
+    assert session["complete"]
+    with open(uploads._data_path(session["upload_id"]), "rb") as f:
+        assert f.read() == b"abcdefghijkl"
+
+
+def test_oversized_parts_are_refused_before_anything_is_written():
+    session, _ = create_upload(OWNER, "notes.pdf", 12)
+
+    assert write_part(session, 0, io.BytesIO(b"x" * 9), 9)[1] == "Parts are at most 8 bytes"
+    session, _ = write_part(session, 0, io.BytesIO(b"x" * 8), 8)
+    assert write_part(session, 8, io.BytesIO(b"x" * 5), 5)[1] == "Part extends past the declared file size"
+    assert get_upload(OWNER, session["upload_id"])["offset"] == 8
+
+
+def test_a_part_cut_short_keeps_what_arrived():
+    session, _ = create_upload(OWNER, "notes.pdf", 12)
+    session, error = write_part(session, 0, DroppedStream(b"abc"), 8)
+
+    assert error is None
+    assert session["offset"] == 3
+    assert not session["complete"]
+
+    # The client resumes from the reported offset
+    session, error = write_part(session, 3, io.BytesIO(b"defghijk"), 8)
+    assert error is None
+    assert session["offset"] == 11
@@ -0,0 +1,345 @@
+"""
+Hot/cold tiering for class collections.
+
+Every class-collection lookup records an access time. Collections idle for
+longer than TIERING_IDLE_DAYS are archived: written to a compressed snapshot
+under ./data/archive and dropped from Chroma, which frees their HNSW segment
+on disk and in memory. The next lookup (an /ask, an upload, or the prefetch a
+materials listing triggers) rehydrates the collection from its snapshot
+before returning it, so callers never see the difference. Rehydration
+latency and the resident/archived collection counts are reported on
+/metrics and /health/vectorstore.
+
+    python tiering.py status
+    python tiering.py archive [--idle-days 30] [--dry-run]
+    python tiering.py rehydrate <class_id>
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from snapshots import export_collection, write_snapshot, read_snapshot, load_snapshot
+from flat_index import write_version, invalidate as invalidate_flat_index
+from metrics import Gauge, Histogram
+
+ARCHIVE_DIR = "./data/archive"
+ACCESS_FILE = "./data/collection_access.json"
+
+TIERING_IDLE_DAYS = float(os.environ.get("TIERING_IDLE_DAYS", "30"))
+# 0 disables the background archiver
+TIERING_INTERVAL_SECONDS = int(os.environ.get("TIERING_INTERVAL_SECONDS", "0"))
+
+# Access times are buffered in memory and merged into ACCESS_FILE at most this often
+ACCESS_FLUSH_SECONDS = 60
+
+# How long a request waits for another worker that is already rehydrating
+LOCK_WAIT_SECONDS = 120
+LOCK_STALE_SECONDS = 600
+
+_pending_access = {}
+_last_flush = 0.0
+_access_lock = threading.Lock()
+
+_metrics = {
+    "rehydrations": 0,
+    "rehydration_seconds_total": 0.0,
+    "rehydration_seconds_max": 0.0,
+    "rehydration_seconds_last": 0.0,
+}
+_metrics_lock = threading.Lock()
+
+
+def _resident_count() -> int:
+    # Imported here: vectorstore imports this module
+    from vectorstore import get_chroma_client
+    return len(get_chroma_client().list_collections())
+
+
+# The same figures on /metrics, next to the stage histograms
+REHYDRATION_SECONDS = Histogram(
+    "teachtwin_rehydration_seconds",
+    "Time to rehydrate an archived collection, including waiting for another worker's rehydration",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+RESIDENT_COLLECTIONS = Gauge(
+    "teachtwin_resident_collections", "Collections currently in the vector store", function=_resident_count,
+)
+ARCHIVED_COLLECTIONS = Gauge(
+    "teachtwin_archived_collections", "Collections archived to snapshots", function=lambda: len(list_archived()),
+)
+
+
+def snapshot_path(collection_name: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{collection_name}.snapshot")
+
+
+def is_archived(collection_name: str) -> bool:
+    return os.path.exists(snapshot_path(collection_name))
+
+
+def list_archived() -> list:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(entry[:-len(".snapshot")] for entry in os.listdir(ARCHIVE_DIR) if entry.endswith(".snapshot"))
+
+
+def load_access_times() -> dict:
+    if not os.path.exists(ACCESS_FILE):
+        return {}
+    with open(ACCESS_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_access_times(times: dict):
+    os.makedirs("./data", exist_ok=True)
+    with open(ACCESS_FILE, "w") as f:
+        json.dump(times, f, indent=2)
+
+
+def flush_access_times():
+    global _last_flush
+    with _access_lock:
+        pending = dict(_pending_access)
+        _pending_access.clear()
+        _last_flush = time.time()
+    if not pending:
+        return
+    times = load_access_times()
+    for name, accessed_at in pending.items():
+        times[name] = max(accessed_at, times.get(name, 0))
+    save_access_times(times)
+
+
+def record_access(collection_name: str):
+    now = time.time()
+    with _access_lock:
+        _pending_access[collection_name] = now
+        due = now - _last_flush >= ACCESS_FLUSH_SECONDS
+    if due:
+        flush_access_times()
+
+
+def _lock_path(collection_name: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{collection_name}.lock")
+
+
+def acquire_collection_lock(collection_name: str, wait: float = 0) -> bool:
+    """
+    Cross-process lock on one collection, held while archiving, rehydrating
+    or rebuilding it
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = _lock_path(collection_name)
+    deadline = time.time() + wait
+    while True:
+        try:
+            if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def refresh_collection_lock(collection_name: str):
+    """Keep a lock held by a long-running move from being taken as stale"""
+    try:
+        os.utime(_lock_path(collection_name))
+    except OSError:
+        pass
+
+
+def release_collection_lock(collection_name: str):
+    try:
+        os.remove(_lock_path(collection_name))
+    except OSError:
+        pass
+
+
+def ensure_resident(client, collection_name: str) -> bool:
+    """
+    Rehydrate a collection from its snapshot if it was archived.
+    Returns True if this call did the rehydration.
+    """
+    if not is_archived(collection_name):
+        return False
+
+    start = time.perf_counter()
+    if not acquire_collection_lock(collection_name, wait=LOCK_WAIT_SECONDS):
+        raise RuntimeError(f"Timed out waiting for {collection_name} to be rehydrated")
+    try:
+        # Another worker may have finished while we waited
+        if not is_archived(collection_name):
+            return False
+        snapshot = read_snapshot(snapshot_path(collection_name))
+        # Clear out anything an interrupted archive or rehydrate left behind
+        try:
+            client.delete_collection(collection_name)
+        except Exception:
+            pass
+        collection = client.create_collection(collection_name, metadata=snapshot["collection_metadata"] or None)
+        load_snapshot(collection, snapshot)
+        os.remove(snapshot_path(collection_name))
+    finally:
+        release_collection_lock(collection_name)
+
+    elapsed = time.perf_counter() - start
+    with _metrics_lock:
+        _metrics["rehydrations"] += 1
+        _metrics["rehydration_seconds_total"] += elapsed
+        _metrics["rehydration_seconds_max"] = max(_metrics["rehydration_seconds_max"], elapsed)
+        _metrics["rehydration_seconds_last"] = elapsed
+    REHYDRATION_SECONDS.observe(elapsed)
+    record_access(collection_name)
+    print(f"Rehydrated {collection_name} ({len(snapshot['ids'])} chunks) in {elapsed:.2f}s")
+    return True
+
+
+def prefetch(client, collection_name: str):
+    """Start rehydrating an archived collection in the background"""
+    if not is_archived(collection_name):
+        return
+
+    def run():
+        try:
+            ensure_resident(client, collection_name)
+        except Exception as e:
+            print(f"Prefetch of {collection_name} failed: {e}")
+
+    threading.Thread(target=run, name=f"rehydrate-{collection_name}", daemon=True).start()
+
+
+def archive_collection(client, collection_name: str):
+    """
+    Snapshot a collection and drop it from Chroma.
+    Returns (chunks_archived, error)
+    """
+    if not acquire_collection_lock(collection_name):
+        return 0, "Collection is being moved by another process"
+    try:
+        try:
+            collection = client.get_collection(collection_name)
+        except Exception:
+            return 0, "Collection not found"
+
+        # Read before exporting, so any write landing during the export changes it
+        version = write_version(collection_name)
+        snapshot = export_collection(collection)
+        write_snapshot(snapshot_path(collection_name), snapshot)
+        # A write that slipped in while exporting would be lost, so keep the
+        # collection and discard the snapshot instead. Re-uploads keep chunk
+        # ids and counts, so the write stamp is compared too.
+        if write_version(collection_name) != version or collection.count() != len(snapshot["ids"]):
+            os.remove(snapshot_path(collection_name))
+            return 0, "Collection changed while archiving"
+
+        client.delete_collection(collection_name)
+        invalidate_flat_index(collection_name)
+        return len(snapshot["ids"]), None
+    finally:
+        release_collection_lock(collection_name)
+
+
+def discard_snapshot(collection_name: str) -> bool:
+    try:
+        os.remove(snapshot_path(collection_name))
+        return True
+    except OSError:
+        return False
+
+
+def archive_idle(client, idle_days: float = TIERING_IDLE_DAYS, dry_run: bool = False, is_tiered=None) -> list:
+    """
+    Archive collections not accessed for idle_days. `is_tiered(name)` picks
+    which collections take part. Collections with no recorded access start
+    their idle clock now.
+    """
+    flush_access_times()
+    times = load_access_times()
+    now = time.time()
+    archived = []
+    clock_started = False
+
+    for collection in client.list_collections():
+        name = collection.name
+        if is_tiered is not None and not is_tiered(name):
+            continue
+        last_access = times.get(name)
+        if last_access is None:
+            times[name] = now
+            clock_started = True
+            continue
+        if now - last_access < idle_days * 86400:
+            continue
+        if dry_run:
+            archived.append(name)
+            continue
+        count, error = archive_collection(client, name)
+        if error:
+            print(f"Not archiving {name}: {error}")
+        else:
+            archived.append(name)
+            print(f"Archived {name} ({count} chunks)")
+
+    if clock_started and not dry_run:
+        save_access_times(times)
+    return archived
+
+
+def get_tiering_metrics(client) -> dict:
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics["resident_collections"] = len(client.list_collections())
+    metrics["archived_collections"] = len(list_archived())
+    return metrics
+
+
+def start_background_tiering(client_factory, is_tiered=None, interval: int = TIERING_INTERVAL_SECONDS):
+    """Run archive_idle every `interval` seconds in a daemon thread (0 disables)"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                archive_idle(client_factory(), is_tiered=is_tiered)
+            except Exception as e:
+                print("Tiering error:", e)
+
+    thread = threading.Thread(target=loop, name="collection-tiering", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from vectorstore import get_chroma_client, class_collection_name, is_class_collection
+
+    parser = argparse.ArgumentParser(description="Archive idle class collections or bring them back")
+    parser.add_argument("action", choices=["status", "archive", "rehydrate"])
+    parser.add_argument("class_id", nargs="?")
+    parser.add_argument("--idle-days", type=float, default=TIERING_IDLE_DAYS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = get_chroma_client()
+    if args.action == "status":
+        print(json.dumps(get_tiering_metrics(client), indent=2))
+        for name in list_archived():
+            print(f"  archived: {name}")
+    elif args.action == "archive":
+        names = archive_idle(client, args.idle_days, args.dry_run, is_tiered=is_class_collection)
+        print(f"{'Would archive' if args.dry_run else 'Archived'} {len(names)} collections")
+    else:
+        if not args.class_id:
+            raise SystemExit("rehydrate needs a class_id")
+        if not ensure_resident(client, class_collection_name(args.class_id)):
+            print("Collection is not archived")
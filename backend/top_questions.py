@@ -0,0 +1,369 @@
+"""
+Precomputed answers for each class's most-asked questions.
+
+Every class question asked through /ask is logged (normalized as for
+coalescing, per level/tone) in ./data/top_questions/<class_id>.log.json.
+Counts are buffered in memory and written every QUESTION_LOG_FLUSH_SECONDS.
+
+When a class's materials change (an upload, a deleted material, an imported
+bundle, a regenerated summary, or orphan chunks removed by maintenance), the
+answers computed from the old materials stop being served and, after
+PRECOMPUTE_DELAY_SECONDS (so a multi-file upload or a burst of deletes
+triggers one run), a background job answers the PRECOMPUTE_TOP_QUESTIONS
+most-asked questions (asked at least PRECOMPUTE_MIN_ASKS times) again, for
+every level/tone each was asked with, at BACKGROUND priority. Questions that
+reach the top between changes are answered after the next log flush. The
+answers live in ./data/top_questions/<class_id>.answers.json with the time
+they were computed, and /ask returns them without retrieval or an LLM call.
+
+Set PRECOMPUTE_TOP_QUESTIONS=0 to turn this off. Jobs run in the process
+that saw the change; counts from several workers are merged on flush. Every
+read-modify-write of a class's files holds a lock file beside them, so
+gunicorn workers do not lose each other's counts or version bumps.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from metrics import Counter
+from llm import LLMOverloaded
+
+TOP_QUESTIONS_DIR = "./data/top_questions"
+PRECOMPUTE_TOP_QUESTIONS = int(os.environ.get("PRECOMPUTE_TOP_QUESTIONS", "10"))
+PRECOMPUTE_MIN_ASKS = int(os.environ.get("PRECOMPUTE_MIN_ASKS", "3"))
+PRECOMPUTE_DELAY_SECONDS = float(os.environ.get("PRECOMPUTE_DELAY_SECONDS", "30"))
+QUESTION_LOG_FLUSH_SECONDS = float(os.environ.get("QUESTION_LOG_FLUSH_SECONDS", "10"))
+# Distinct questions kept per class; the least asked are dropped beyond this
+QUESTION_LOG_MAX = int(os.environ.get("QUESTION_LOG_MAX", "500"))
+# Retry delay when the LLM gateway is saturated
+PRECOMPUTE_RETRY_SECONDS = 300
+
+# How long an update waits for another process holding a file's lock
+LOCK_WAIT_SECONDS = 30
+LOCK_STALE_SECONDS = 300
+
+PRECOMPUTED_ANSWERS = Counter(
+    "teachtwin_precomputed_answers_total",
+    "Class questions served from precomputed answers (hit) or answered live (miss)",
+    ["result"],
+)
+PRECOMPUTE_RUNS = Counter(
+    "teachtwin_precompute_answers_computed_total",
+    "Answers computed by the top-question job, by outcome",
+    ["outcome"],
+)
+
+_pending = {}  # class_id -> {(question key, level, tone): (question text, count)}
+_last_flush = 0.0
+_pending_lock = threading.Lock()
+
+_file_lock = threading.Lock()
+# path -> (mtime, data) for answer files read on the /ask path
+_answers_cache = {}
+
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+def _log_path(class_id: str) -> str:
+    return os.path.join(TOP_QUESTIONS_DIR, f"{class_id}.log.json")
+
+
+def _answers_path(class_id: str) -> str:
+    return os.path.join(TOP_QUESTIONS_DIR, f"{class_id}.answers.json")
+
+
+def _load(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(path: str, data: dict):
+    os.makedirs(TOP_QUESTIONS_DIR, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def _locked(path: str):
+    """Hold the process's file lock and a cross-process lock file for `path`"""
+    with _file_lock:
+        os.makedirs(TOP_QUESTIONS_DIR, exist_ok=True)
+        lock_path = path + ".lock"
+        deadline = time.time() + LOCK_WAIT_SECONDS
+        while True:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                break
+            except FileExistsError:
+                if time.time() >= deadline:
+                    raise RuntimeError(f"Timed out waiting for {path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+
+def _question_key(question: str) -> str:
+    from query import normalize_question
+    return normalize_question(question)
+
+
+def _variant(level: str, tone: str) -> str:
+    from query import prompt_variant
+    return "|".join(prompt_variant(level, tone))
+
+
+def _answer_key(question_key: str, variant: str) -> str:
+    return f"{question_key}|{variant}"
+
+
+def load_answers(class_id: str) -> dict:
+    """{"version", "changed_at", "answers": {key: entry}}, from memory unless the file changed"""
+    path = _answers_path(class_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {"version": 0, "changed_at": None, "answers": {}}
+    cached = _answers_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    data = _load(path)
+    data.setdefault("version", 0)
+    data.setdefault("changed_at", None)
+    data.setdefault("answers", {})
+    _answers_cache[path] = (mtime, data)
+    return data
+
+
+def record_question(class_id: str, question: str, level: str, tone: str):
+    """Count a class question; written to the log in batches"""
+    if PRECOMPUTE_TOP_QUESTIONS <= 0:
+        return
+    key = (_question_key(question), _variant(level, tone))
+    now = time.time()
+    with _pending_lock:
+        counts = _pending.setdefault(class_id, {})
+        _, count = counts.get(key, (question, 0))
+        counts[key] = (question.strip(), count + 1)
+        due = now - _last_flush >= QUESTION_LOG_FLUSH_SECONDS
+    if due:
+        flush_question_log()
+
+
+def flush_question_log(schedule: bool = True):
+    """Merge buffered counts into the class logs; schedule a job for new top questions"""
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.time()
+
+    for class_id, counts in pending.items():
+        with _locked(_log_path(class_id)):
+            log = _load(_log_path(class_id))
+            now = time.time()
+            for (question_key, variant), (text, count) in counts.items():
+                entry = log.setdefault(question_key, {"question": text, "count": 0, "variants": {}})
+                entry["question"] = text
+                entry["count"] += count
+                entry["last_asked"] = now
+                entry["variants"][variant] = entry["variants"].get(variant, 0) + count
+            if len(log) > QUESTION_LOG_MAX:
+                keep = sorted(log, key=lambda k: (log[k]["count"], log[k].get("last_asked", 0)), reverse=True)
+                log = {k: log[k] for k in keep[:QUESTION_LOG_MAX]}
+            _save(_log_path(class_id), log)
+
+        data = load_answers(class_id)
+        if schedule and any(not _is_current(data, key) for key, _ in wanted_answers(log)):
+            schedule_precompute(class_id, restart=False)
+
+
+def wanted_answers(log: dict):
+    """[(answer key, (question, level, tone))] for the top questions, most asked first"""
+    top = sorted(
+        (k for k, entry in log.items() if entry["count"] >= PRECOMPUTE_MIN_ASKS),
+        key=lambda k: log[k]["count"],
+        reverse=True,
+    )[:PRECOMPUTE_TOP_QUESTIONS]
+    wanted = []
+    for question_key in top:
+        entry = log[question_key]
+        for variant in sorted(entry["variants"], key=entry["variants"].get, reverse=True):
+            level, tone = variant.split("|", 1)
+            wanted.append((_answer_key(question_key, variant), (entry["question"], level, tone)))
+    return wanted
+
+
+def _is_current(data: dict, key: str) -> bool:
+    entry = data["answers"].get(key)
+    return entry is not None and entry.get("version") == data["version"]
+
+
+def lookup_answer(class_id: str, question: str, level: str, tone: str) -> Optional[dict]:
+    """The precomputed answer for this question, or None"""
+    if PRECOMPUTE_TOP_QUESTIONS <= 0:
+        return None
+    data = load_answers(class_id)
+    key = _answer_key(_question_key(question), _variant(level, tone))
+    if not _is_current(data, key):
+        PRECOMPUTED_ANSWERS.inc(result="miss")
+        return None
+    PRECOMPUTED_ANSWERS.inc(result="hit")
+    return data["answers"][key]
+
+
+def freshness(entry: dict) -> dict:
+    """How old a precomputed answer is, for the /ask response"""
+    return {
+        "computed_at": entry["computed_at"],
+        "age_seconds": round(time.time() - entry["computed_at"], 1),
+        "materials_version": entry["version"],
+    }
+
+
+def materials_changed(class_id: str):
+    """Stop serving answers computed from the old materials and schedule new ones"""
+    if PRECOMPUTE_TOP_QUESTIONS <= 0:
+        return
+    with _locked(_answers_path(class_id)):
+        data = dict(_load(_answers_path(class_id)))
+        data["version"] = data.get("version", 0) + 1
+        data["changed_at"] = time.time()
+        data.setdefault("answers", {})
+        _save(_answers_path(class_id), data)
+    schedule_precompute(class_id)
+
+
+def schedule_precompute(class_id: str, delay: float = None, restart: bool = True):
+    """
+    Run precompute_answers(class_id) after `delay`. A pending run is pushed
+    back (restart) or left as it is.
+    """
+    delay = PRECOMPUTE_DELAY_SECONDS if delay is None else delay
+    with _timers_lock:
+        timer = _timers.get(class_id)
+        if timer is not None:
+            if not restart:
+                return
+            timer.cancel()
+        timer = threading.Timer(delay, _run_precompute, args=(class_id,))
+        timer.name = f"precompute-{class_id}"
+        timer.daemon = True
+        _timers[class_id] = timer
+        timer.start()
+
+
+def _run_precompute(class_id: str):
+    with _timers_lock:
+        _timers.pop(class_id, None)
+    try:
+        precompute_answers(class_id)
+    except LLMOverloaded:
+        print(f"Precompute for {class_id} deferred: LLM gateway saturated")
+        schedule_precompute(class_id, PRECOMPUTE_RETRY_SECONDS)
+    except Exception as e:
+        print(f"Precompute error for {class_id}: {e}")
+
+
+def precompute_answers(class_id: str) -> int:
+    """
+    Answer the class's top questions that have no current answer. Answers
+    for questions that left the top are dropped. Returns how many were computed.
+    """
+    from query import classify_question, _answer_from_class
+    from llm import BACKGROUND
+
+    flush_question_log(schedule=False)
+    wanted = wanted_answers(_load(_log_path(class_id)))
+    current = load_answers(class_id)
+    version = current["version"]
+
+    computed = {}
+    fresh = 0
+    for key, (question, level, tone) in wanted:
+        if _is_current(current, key):
+            computed[key] = current["answers"][key]
+            continue
+        route = classify_question(question)
+        answer, sources = _answer_from_class(class_id, question, level, tone, route, priority=BACKGROUND)
+        computed[key] = {
+            "question": question,
+            "answer": answer,
+            "sources": sources,
+            "route": route,
+            "computed_at": time.time(),
+            "version": version,
+        }
+        fresh += 1
+
+    with _locked(_answers_path(class_id)):
+        data = _load(_answers_path(class_id))
+        if data.get("version", 0) != version:
+            # Materials changed again while this ran; that change scheduled its own run
+            PRECOMPUTE_RUNS.inc(fresh, outcome="discarded")
+            return 0
+        data["answers"] = computed
+        _save(_answers_path(class_id), data)
+    PRECOMPUTE_RUNS.inc(fresh, outcome="computed")
+    return fresh
+
+
+def list_top_questions(class_id: str, limit: int = PRECOMPUTE_TOP_QUESTIONS) -> list:
+    """Most-asked questions with their counts and which answers are precomputed"""
+    flush_question_log()
+    log = _load(_log_path(class_id))
+    data = load_answers(class_id)
+    rows = []
+    for question_key in sorted(log, key=lambda k: log[k]["count"], reverse=True)[:limit]:
+        entry = log[question_key]
+        variants = []
+        for variant, count in sorted(entry["variants"].items(), key=lambda item: item[1], reverse=True):
+            level, tone = variant.split("|", 1)
+            key = _answer_key(question_key, variant)
+            variants.append({
+                "level": level,
+                "tone": tone,
+                "count": count,
+                "precomputed": freshness(data["answers"][key]) if _is_current(data, key) else None,
+            })
+        rows.append({
+            "question": entry["question"],
+            "count": entry["count"],
+            "last_asked": entry.get("last_asked"),
+            "variants": variants,
+        })
+    return rows
+
+
+def discard_top_questions(class_id: str):
+    with _timers_lock:
+        timer = _timers.pop(class_id, None)
+        if timer is not None:
+            timer.cancel()
+    with _pending_lock:
+        _pending.pop(class_id, None)
+    for path in (_log_path(class_id), _answers_path(class_id)):
+        _answers_cache.pop(path, None)
+        with _locked(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,203 @@
+"""
+Resumable uploads, for files too large to send in one multipart request.
+
+A client opens an upload session for one file (personal or class), then
+sends the file in parts of at most UPLOAD_PART_SIZE bytes as raw request
+bodies, each tagged with the byte offset it starts at. Parts are copied from
+the request stream straight into ./data/uploads/<upload_id>/data in small
+blocks, so neither a part nor the file is ever held in memory. The spooled
+size is the session's offset: after a dropped connection the client asks for
+it and carries on from there (whatever arrived of an interrupted part is
+kept).
+
+Once the last byte is written the file is ingested from the spool (PDFs are
+read in place by pypdf) and the session is removed. If ingestion fails the
+spool is kept and an empty part at the final offset retries it. Sessions
+untouched for UPLOAD_SPOOL_TTL_HOURS are removed by maintenance.py.
+
+Parts for one upload are serialized per process.
+"""
+import os
+import json
+import time
+import shutil
+import secrets
+import threading
+from typing import Optional, Tuple
+from metrics import Counter
+
+UPLOAD_SPOOL_DIR = "./data/uploads"
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_SPOOL_TTL_HOURS = float(os.environ.get("UPLOAD_SPOOL_TTL_HOURS", "24"))
+
+# Bytes copied from the request stream per write
+COPY_BLOCK_SIZE = 64 * 1024
+
+UPLOAD_PARTS = Counter(
+    "teachtwin_upload_parts_total",
+    "Resumable upload parts received, by result (ok, partial, offset_mismatch)",
+    ["result"],
+)
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def upload_lock(upload_id: str) -> threading.Lock:
+    with _locks_lock:
+        lock = _locks.get(upload_id)
+        if lock is None:
+            lock = _locks[upload_id] = threading.Lock()
+        return lock
+
+
+def _session_dir(upload_id: str) -> Optional[str]:
+    # Ids are generated here; anything else (e.g. path separators) is not an upload
+    if not upload_id or not upload_id.startswith("up_") or os.path.basename(upload_id) != upload_id:
+        return None
+    return os.path.join(UPLOAD_SPOOL_DIR, upload_id)
+
+
+def _data_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SPOOL_DIR, upload_id, "data")
+
+
+def _with_offset(session: dict) -> dict:
+    """The session plus how many bytes are spooled"""
+    try:
+        offset = os.path.getsize(_data_path(session["upload_id"]))
+    except OSError:
+        offset = 0
+    return {**session, "offset": offset, "complete": offset == session["size"]}
+
+
+def create_upload(owner: str, filename: str, size: int, class_id: str = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Open a session for one file. Returns (session, error)"""
+    filename = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not filename:
+        return None, "filename is required"
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return None, "size must be a positive number of bytes"
+    if size > UPLOAD_MAX_BYTES:
+        return None, f"File is larger than the {UPLOAD_MAX_BYTES} byte limit"
+
+    upload_id = f"up_{secrets.token_hex(12)}"
+    session = {
+        "upload_id": upload_id,
+        "owner": owner,
+        "class_id": class_id,
+        "filename": filename,
+        "size": size,
+        "part_size": UPLOAD_PART_SIZE,
+        "created_at": time.time(),
+    }
+    directory = _session_dir(upload_id)
+    os.makedirs(directory)
+    open(_data_path(upload_id), "wb").close()
+    with open(os.path.join(directory, "session.json"), "w") as f:
+        json.dump(session, f)
+    return _with_offset(session), None
+
+
+def get_upload(owner: str, upload_id: str) -> Optional[dict]:
+    """The session with its current offset, or None if missing or not the owner's"""
+    directory = _session_dir(upload_id)
+    if directory is None:
+        return None
+    try:
+        with open(os.path.join(directory, "session.json")) as f:
+            session = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if session.get("owner") != owner:
+        return None
+    return _with_offset(session)
+
+
+def write_part(session: dict, offset: int, stream, length: int) -> Tuple[dict, Optional[str]]:
+    """
+    Append `length` bytes from `stream` at `offset`, which must be the
+    session's current offset. Returns (updated session, error); a part cut
+    short by a dropped connection keeps what arrived.
+    """
+    upload_id = session["upload_id"]
+    with upload_lock(upload_id):
+        session = _with_offset(session)
+        if offset != session["offset"]:
+            UPLOAD_PARTS.inc(result="offset_mismatch")
+            return session, "offset_mismatch"
+        if length > session["part_size"]:
+            return session, f"Parts are at most {session['part_size']} bytes"
+        if offset + length > session["size"]:
+            return session, "Part extends past the declared file size"
+
+        remaining = length
+        with open(_data_path(upload_id), "r+b") as f:
+            f.seek(offset)
+            while remaining > 0:
+                try:
+                    block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+                except Exception:
+                    # Client disconnected mid-part
+                    break
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        os.utime(os.path.join(UPLOAD_SPOOL_DIR, upload_id, "session.json"))
+        UPLOAD_PARTS.inc(result="partial" if remaining else "ok")
+        return _with_offset(session), None
+
+
+class SpooledUpload:
+    """A completed spool, readable where ingest expects a Werkzeug FileStorage"""
+
+    def __init__(self, session: dict):
+        self.filename = session["filename"]
+        self.stream = open(_data_path(session["upload_id"]), "rb")
+
+    def read(self, size: int = -1) -> bytes:
+        return self.stream.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def discard_upload(upload_id: str):
+    directory = _session_dir(upload_id)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+    with _locks_lock:
+        _locks.pop(upload_id, None)
+
+
+def expire_uploads(ttl_hours: float = UPLOAD_SPOOL_TTL_HOURS, dry_run: bool = False) -> list:
+    """Remove sessions with no part received for ttl_hours. Returns their ids"""
+    if not os.path.isdir(UPLOAD_SPOOL_DIR):
+        return []
+    cutoff = time.time() - ttl_hours * 3600
+    expired = []
+    for upload_id in os.listdir(UPLOAD_SPOOL_DIR):
+        try:
+            last_activity = os.path.getmtime(os.path.join(UPLOAD_SPOOL_DIR, upload_id, "session.json"))
+        except OSError:
+            # A session directory without metadata was never fully created
+            last_activity = os.path.getmtime(os.path.join(UPLOAD_SPOOL_DIR, upload_id))
+        if last_activity < cutoff:
+            expired.append(upload_id)
+            if not dry_run:
+                shutil.rmtree(os.path.join(UPLOAD_SPOOL_DIR, upload_id), ignore_errors=True)
+    return expired
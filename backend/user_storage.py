@@ -1,7 +1,10 @@
 import os
 import json
-import chromadb
 from typing import List, Tuple
+from metrics import timed
+from dedup import forget_chunks, discard_index, user_scope, class_scope
+from flat_index import bump_write_version
+from top_questions import materials_changed, discard_top_questions
 
 # Track uploaded files per user
 FILES_INDEX = "./data/files_index.json"
@@ -16,11 +19,13 @@ def ensure_files_index():
         with open(CLASS_FILES_INDEX, "w") as f:
             json.dump({}, f)
 
+@timed("files_index_load")
 def load_files_index():
     ensure_files_index()
     with open(FILES_INDEX, "r") as f:
         return json.load(f)
 
+@timed("files_index_save")
 def save_files_index(index):
     with open(FILES_INDEX, "w") as f:
         json.dump(index, f, indent=2)
@@ -66,8 +71,17 @@ def get_user_chunk_ids(user_email: str) -> List[str]:
     
     return all_ids
 
-def remove_file_for_user(user_email: str, filename: str, collection) -> bool:
-    """Remove a file and its chunks from storage"""
+def get_user_file_chunk_ids(user_email: str, filename: str) -> List[str]:
+    """Chunk IDs currently indexed for one of a user's files"""
+    index = load_files_index()
+    return index.get(user_email, {}).get(filename, {}).get("chunk_ids", [])
+
+def remove_file_for_user(user_email: str, filename: str, *collections) -> bool:
+    """Remove a file and its chunks from storage.
+
+    Chunks are deleted from every collection given, so callers can pass both
+    the user's shard and the legacy shared collection while a migration runs.
+    """
     index = load_files_index()
     
     if user_email not in index or filename not in index[user_email]:
@@ -76,12 +90,14 @@ def remove_file_for_user(user_email: str, filename: str, collection) -> bool:
     # Get chunk IDs to delete
     chunk_ids = index[user_email][filename]["chunk_ids"]
     
-    # Delete from ChromaDB
-    try:
+    # Delete from ChromaDB. A failure is raised with the index entry still
+    # in place, so the delete can be retried.
+    for collection in collections:
         collection.delete(ids=chunk_ids)
-    except Exception as e:
-        print(f"Error deleting chunks: {e}")
+        bump_write_version(collection.name)
     
+    forget_chunks(user_scope(user_email), chunk_ids)
+
     # Remove from index
     del index[user_email][filename]
     save_files_index(index)
@@ -89,12 +105,14 @@ def remove_file_for_user(user_email: str, filename: str, collection) -> bool:
     return True
 
 
+@timed("class_files_index_load")
 def load_class_files_index():
     ensure_files_index()
     with open(CLASS_FILES_INDEX, "r") as f:
         return json.load(f)
 
 
+@timed("class_files_index_save")
 def save_class_files_index(index):
     with open(CLASS_FILES_INDEX, "w") as f:
         json.dump(index, f, indent=2)
@@ -117,6 +135,27 @@ def add_file_for_class(class_id: str, filename: str, chunk_ids: List[str], uploa
     save_class_files_index(index)
 
 
+def add_files_for_class(class_id: str, entries: dict):
+    """Track several files for a class in a single index write.
+
+    entries maps filename -> {"chunk_ids", "uploaded_by", "summary", ...}
+    """
+    index = load_class_files_index()
+    
+    if class_id not in index:
+        index[class_id] = {}
+    
+    for filename, entry in entries.items():
+        index[class_id][filename] = {
+            "chunk_ids": entry["chunk_ids"],
+            "uploaded_by": entry.get("uploaded_by", "unknown"),
+            "uploaded_at": entry.get("uploaded_at", str(os.times())),
+            "summary": entry.get("summary", "")
+        }
+    
+    save_class_files_index(index)
+
+
 def get_class_files(class_id: str) -> List[dict]:
     """Get list of files uploaded to a class"""
     index = load_class_files_index()
@@ -146,6 +185,12 @@ def get_class_chunk_ids(class_id: str) -> List[str]:
     return all_ids
 
 
+def get_class_file_chunk_ids(class_id: str, filename: str) -> List[str]:
+    """Chunk IDs currently indexed for one of a class's files"""
+    index = load_class_files_index()
+    return index.get(class_id, {}).get(filename, {}).get("chunk_ids", [])
+
+
 def remove_file_for_class(class_id: str, filename: str, collection) -> bool:
     """Remove a file and its chunks from class storage"""
     index = load_class_files_index()
@@ -156,19 +201,32 @@ def remove_file_for_class(class_id: str, filename: str, collection) -> bool:
     # Get chunk IDs to delete
     chunk_ids = index[class_id][filename]["chunk_ids"]
     
-    # Delete from ChromaDB
-    try:
-        collection.delete(ids=chunk_ids)
-    except Exception as e:
-        print(f"Error deleting chunks: {e}")
+    # Delete from ChromaDB. A failure is raised with the index entry still
+    # in place, so the delete can be retried.
+    collection.delete(ids=chunk_ids)
+    bump_write_version(collection.name)
     
+    forget_chunks(class_scope(class_id), chunk_ids)
+
     # Remove from index
     del index[class_id][filename]
     save_class_files_index(index)
-    
+
+    # Precomputed answers may cite the deleted file
+    materials_changed(class_id)
     return True
 
 
+def remove_class_files(class_id: str) -> int:
+    """Drop every material entry for a class. Returns how many were removed."""
+    index = load_class_files_index()
+    removed = len(index.pop(class_id, {}))
+    save_class_files_index(index)
+    discard_index(class_scope(class_id))
+    discard_top_questions(class_id)
+    return removed
+
+
 def update_material_summary(class_id: str, filename: str, summary: str) -> bool:
     """Update the summary for a specific material"""
     index = load_class_files_index()
@@ -178,6 +236,8 @@ def update_material_summary(class_id: str, filename: str, summary: str) -> bool:
     
     index[class_id][filename]["summary"] = summary
     save_class_files_index(index)
+    # Summaries decide which materials a routed search looks at
+    materials_changed(class_id)
     return True
 
 
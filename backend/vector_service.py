@@ -0,0 +1,43 @@
+"""
+The vector store as a separate local service.
+
+By default every worker process opens ./data/vectorstore itself (an embedded
+chromadb.PersistentClient), so workers on one host contend for the same
+sqlite and HNSW files and a second host cannot share the store at all. This
+runs a Chroma server on that directory instead; point the workers at it with
+VECTOR_SERVICE_URL and they talk to it over HTTP (see vectorstore.py for the
+pooled, retrying client). Embeddings are still computed in the workers, so
+the service only stores and searches vectors.
+
+    python vector_service.py [--path ./data/vectorstore] [--host 127.0.0.1] [--port 8000]
+    VECTOR_SERVICE_URL=http://127.0.0.1:8000 gunicorn -c gunicorn.conf.py
+
+The service runs as a single process: Chroma's persistent store is not safe
+to open from several. Run one per store.
+"""
+import os
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the vector store to the app's workers over HTTP")
+    parser.add_argument("--path", default="./data/vectorstore")
+    parser.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to serve workers on other hosts")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--keep-alive", type=int, default=30, help="Seconds idle client connections are kept open")
+    args = parser.parse_args()
+
+    os.makedirs(args.path, exist_ok=True)
+    # Read by chromadb.app's Settings when it is imported
+    os.environ["IS_PERSISTENT"] = "True"
+    os.environ["PERSIST_DIRECTORY"] = os.path.abspath(args.path)
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    import uvicorn
+    print(f"Serving {args.path} on http://{args.host}:{args.port}")
+    uvicorn.run("chromadb.app:app", host=args.host, port=args.port, workers=1,
+                timeout_keep_alive=args.keep_alive, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
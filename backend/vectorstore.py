@@ -0,0 +1,340 @@
+import os
+import time
+import hashlib
+from urllib.parse import urlparse
+from flat_index import get_flat_index, supports_where, source_filter, query_sources, write_version, bump_write_version
+from quantized_index import get_quantized_index, query_quantized
+from index_config import collection_metadata
+from tiering import ensure_resident, record_access, prefetch, discard_snapshot
+from metrics import span, Counter
+
+VECTORSTORE_PATH = "./data/vectorstore"
+
+# Shared collection that held every user's personal uploads before sharding
+LEGACY_COLLECTION = "course_materials"
+
+# Personal uploads are spread over this many hash buckets.
+# Set to 0 to give every user a collection of their own.
+USER_SHARD_BUCKETS = int(os.environ.get("USER_SHARD_BUCKETS", "32"))
+
+# Set to the URL of a vector service (python vector_service.py, or any Chroma
+# server) to share one store between workers and hosts instead of opening
+# VECTORSTORE_PATH in every process
+VECTOR_SERVICE_URL = os.environ.get("VECTOR_SERVICE_URL", "").rstrip("/")
+VECTOR_SERVICE_TIMEOUT = float(os.environ.get("VECTOR_SERVICE_TIMEOUT", "30"))
+VECTOR_SERVICE_CONNECT_TIMEOUT = float(os.environ.get("VECTOR_SERVICE_CONNECT_TIMEOUT", "2"))
+VECTOR_SERVICE_RETRIES = int(os.environ.get("VECTOR_SERVICE_RETRIES", "3"))
+# Keep-alive connections per worker process, shared by its threads
+VECTOR_SERVICE_POOL_SIZE = int(os.environ.get("VECTOR_SERVICE_POOL_SIZE", "16"))
+# Responses worth retrying: the service restarting or overloaded
+RETRY_STATUSES = (502, 503, 504)
+# Requests repeated after a response or a failure mid-request: methods that
+# are idempotent, and Chroma's POST endpoints that only read
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+READ_ENDPOINTS = ("/get", "/query", "/count")
+RETRY_BACKOFF_SECONDS = 0.2
+
+VECTOR_SERVICE_RETRIES_TOTAL = Counter(
+    "teachtwin_vector_service_retries_total",
+    "Vector service requests retried, by reason",
+    ["reason"],
+)
+
+# Lazy load the Chroma client so importing this module stays cheap.
+# Both are per process: after a fork (e.g. gunicorn --preload) the child
+# opens its own sqlite connections and embedding session.
+_chroma_client = None
+_embedding_function = None
+_client_pid = None
+_embedding_pid = None
+
+# Users found to still have chunks in the shared collection, as of one of its
+# write versions: (version, {user_email: bool})
+_legacy_users = (None, {})
+
+
+def preload_modules():
+    """Import chromadb ahead of a fork without opening anything"""
+    import chromadb  # noqa: F401
+    from chromadb.utils import embedding_functions  # noqa: F401
+
+
+def get_chroma_client():
+    global _chroma_client, _client_pid
+    if _chroma_client is None or _client_pid != os.getpid():
+        import chromadb
+        from chromadb.api.client import SharedSystemClient
+        from chromadb.config import Settings
+
+        if _client_pid is not None and _client_pid != os.getpid():
+            # Chroma caches one system per path; the parent's is not ours to use
+            SharedSystemClient.clear_system_cache()
+        if VECTOR_SERVICE_URL:
+            _chroma_client = _connect_vector_service()
+        else:
+            os.makedirs(VECTORSTORE_PATH, exist_ok=True)
+            _chroma_client = chromadb.PersistentClient(
+                path=VECTORSTORE_PATH,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        _client_pid = os.getpid()
+    return _chroma_client
+
+
+def _service_session(verify=True):
+    """
+    HTTP session for the vector service: a bounded pool of keep-alive
+    connections, connect/read timeouts, and retries with exponential backoff.
+    A request is repeated only when it cannot have reached the service
+    (connection refused, connect or pool timeout) or when repeating it
+    changes nothing: idempotent methods and Chroma's read endpoints. Other
+    writes (add, upsert, update, delete over POST) fail on the first error,
+    since the service may already have applied them.
+    """
+    import httpx
+
+    # Errors raised before any of the request was written
+    not_sent = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    class RetryingSession(httpx.Client):
+        def request(self, method, url, **kwargs):
+            repeatable = method.upper() in IDEMPOTENT_METHODS or str(url).rstrip("/").endswith(READ_ENDPOINTS)
+            for attempt in range(VECTOR_SERVICE_RETRIES + 1):
+                last = attempt == VECTOR_SERVICE_RETRIES
+                try:
+                    response = super().request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if last or not (repeatable or isinstance(e, not_sent)):
+                        raise
+                    VECTOR_SERVICE_RETRIES_TOTAL.inc(reason=type(e).__name__)
+                else:
+                    if response.status_code not in RETRY_STATUSES or last or not repeatable:
+                        return response
+                    VECTOR_SERVICE_RETRIES_TOTAL.inc(reason=str(response.status_code))
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    return RetryingSession(
+        # Chroma sends JSON bodies without saying so; newer FastAPI servers reject those
+        headers={"Content-Type": "application/json"},
+        timeout=httpx.Timeout(VECTOR_SERVICE_TIMEOUT, connect=VECTOR_SERVICE_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=VECTOR_SERVICE_POOL_SIZE, max_keepalive_connections=VECTOR_SERVICE_POOL_SIZE),
+        verify=verify,
+    )
+
+
+def _connect_vector_service():
+    import chromadb
+    from chromadb.config import Settings
+
+    url = urlparse(VECTOR_SERVICE_URL)
+    settings = Settings(anonymized_telemetry=False)
+    client = chromadb.HttpClient(
+        host=url.hostname,
+        port=url.port or (443 if url.scheme == "https" else 8000),
+        ssl=url.scheme == "https",
+        settings=settings,
+    )
+    # Swap Chroma's unbounded, timeout-less session for the pooled, retrying
+    # one. These are private attributes: stop here if a Chroma upgrade moved them.
+    server = getattr(client, "_server", None)
+    previous = getattr(server, "_session", None)
+    if previous is None:
+        raise RuntimeError(
+            "This chromadb version's HttpClient has no _server._session to replace; "
+            "VECTOR_SERVICE_URL needs a supported chromadb release"
+        )
+    verify = settings.chroma_server_ssl_verify
+    server._session = _service_session(True if verify is None else verify)
+    server._session.headers.update(previous.headers)
+    previous.close()
+    return client
+
+
+def vector_service_status() -> dict:
+    """Where this worker's vector store lives, and for a service its round-trip time"""
+    if not VECTOR_SERVICE_URL:
+        return {"mode": "embedded", "path": VECTORSTORE_PATH}
+    start = time.perf_counter()
+    try:
+        get_chroma_client().heartbeat()
+        return {"mode": "service", "url": VECTOR_SERVICE_URL, "heartbeat_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        return {"mode": "service", "url": VECTOR_SERVICE_URL, "error": str(e)}
+
+
+def get_legacy_collection():
+    """Return the pre-sharding shared collection"""
+    return get_chroma_client().get_or_create_collection(
+        LEGACY_COLLECTION, metadata=collection_metadata(LEGACY_COLLECTION)
+    )
+
+
+def user_has_legacy_chunks(user_email: str) -> bool:
+    """True while some of a user's uploads have not been migrated out of the shared collection"""
+    global _legacy_users
+    version = write_version(LEGACY_COLLECTION)
+    cached_version, users = _legacy_users
+    if cached_version != version:
+        users = {}
+        _legacy_users = (version, users)
+    if user_email not in users:
+        found = get_legacy_collection().get(where={"user": user_email}, limit=1, include=[])
+        users[user_email] = bool(found["ids"])
+    return users[user_email]
+
+
+def delete_legacy_user_file(user_email: str, filename: str):
+    """Drop every chunk of a user's file from the shared collection (re-uploads and deletes before migration)"""
+    if not user_has_legacy_chunks(user_email):
+        return
+    legacy = get_legacy_collection()
+    legacy.delete(where={"$and": [{"user": user_email}, {"source": filename}]})
+    bump_write_version(legacy.name)
+
+
+def user_collection_name(user_email: str, buckets: int = None) -> str:
+    """Name of the collection holding a user's personal uploads"""
+    if buckets is None:
+        buckets = USER_SHARD_BUCKETS
+
+    digest = hashlib.sha1(user_email.encode("utf-8")).hexdigest()
+    if buckets <= 0:
+        return f"course_materials_user_{digest[:16]}"
+    return f"course_materials_shard_{int(digest, 16) % buckets:03d}"
+
+
+def get_user_collection(user_email: str):
+    """Get or create the shard collection for a user's personal uploads"""
+    name = user_collection_name(user_email)
+    return get_chroma_client().get_or_create_collection(name, metadata=collection_metadata(name))
+
+
+def find_user_collection(user_email: str):
+    """Return the user's shard collection, or None if it was never created"""
+    try:
+        return get_chroma_client().get_collection(user_collection_name(user_email))
+    except Exception:
+        return None
+
+
+def class_collection_name(class_id: str) -> str:
+    return f"course_materials_{class_id}"
+
+
+def get_class_collection(class_id: str):
+    """Get or create a class-specific ChromaDB collection, rehydrating it if archived"""
+    name = class_collection_name(class_id)
+    client = get_chroma_client()
+    ensure_resident(client, name)
+    record_access(name)
+    return client.get_or_create_collection(name, metadata=collection_metadata(name))
+
+
+def find_class_collection(class_id: str):
+    """Return the class collection, or None if nothing was ever uploaded"""
+    name = class_collection_name(class_id)
+    client = get_chroma_client()
+    ensure_resident(client, name)
+    try:
+        collection = client.get_collection(name)
+    except Exception:
+        return None
+    record_access(name)
+    return collection
+
+
+def prefetch_class_collection(class_id: str):
+    """Start rehydrating an archived class collection ahead of the next /ask"""
+    prefetch(get_chroma_client(), class_collection_name(class_id))
+
+
+def delete_class_collection(class_id: str) -> bool:
+    """Drop a class's collection (and any archived snapshot). Returns False if neither existed."""
+    name = class_collection_name(class_id)
+    deleted = discard_snapshot(name)
+    try:
+        get_chroma_client().delete_collection(name)
+        deleted = True
+    except Exception:
+        pass
+    return deleted
+
+
+def is_personal_collection(name: str) -> bool:
+    """True for the legacy shared collection and the per-user shards"""
+    return name == LEGACY_COLLECTION or name.startswith(("course_materials_shard_", "course_materials_user_"))
+
+
+def class_id_from_collection_name(name: str):
+    """Inverse of class_collection_name, or None for non-class collections"""
+    if is_personal_collection(name) or not name.startswith("course_materials_"):
+        return None
+    return name[len("course_materials_"):]
+
+
+def is_class_collection(name: str) -> bool:
+    """True for live class collections (not rebuild staging or leftovers)"""
+    return class_id_from_collection_name(name) is not None and not name.endswith(("__rebuild", "__retired"))
+
+
+def _get_embedding_function():
+    global _embedding_function, _embedding_pid
+    if _embedding_function is None or _embedding_pid != os.getpid():
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        _embedding_function = DefaultEmbeddingFunction()
+        _embedding_pid = os.getpid()
+    return _embedding_function
+
+
+def embed_query(text: str):
+    """Embed a query with the same model the collections use"""
+    embedding_function = _get_embedding_function()
+    with span("embed_query"):
+        return embedding_function([text])[0]
+
+
+def embed_texts(texts):
+    """Embed several texts in one batch with the collections' model"""
+    return _get_embedding_function()(list(texts))
+
+
+def query_collection(collection, query_text: str, n_results: int, where=None, query_embedding=None) -> dict:
+    """
+    Top-k search over a collection. Small collections are answered exactly
+    from a flat NumPy index, searches limited to a few source files from
+    those files' chunks, collections configured for int8 quantization from
+    their compressed index, and everything else (or complex filters) from
+    HNSW. Pass query_embedding to reuse an embedding already computed
+    for query_text.
+    """
+    if query_embedding is not None:
+        query_kwargs = {"query_embeddings": [list(map(float, query_embedding))]}
+    else:
+        query_kwargs = {"query_texts": [query_text]}
+
+    if not supports_where(where):
+        return collection.query(n_results=n_results, where=where, **query_kwargs)
+
+    index = get_flat_index(collection)
+    if index is not None:
+        return index.query(embed_query(query_text) if query_embedding is None else query_embedding, n_results, where)
+
+    sources = source_filter(where)
+    if sources is not None:
+        embedding = embed_query(query_text) if query_embedding is None else query_embedding
+        return query_sources(collection, embedding, sources, n_results)
+
+    quantized = get_quantized_index(collection)
+    if quantized is not None:
+        embedding = embed_query(query_text) if query_embedding is None else query_embedding
+        return query_quantized(collection, quantized, embedding, n_results, where)
+
+    return collection.query(n_results=n_results, where=where, **query_kwargs)
+
+
+def refresh_search_indexes(collection):
+    """Start rebuilding a collection's compressed index after a write, so the next query does not pay for it"""
+    try:
+        get_quantized_index(collection)
+    except Exception as e:
+        print(f"Error refreshing quantized index for {collection.name}: {e}")